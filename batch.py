@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# Description: Command-line entry point that runs the matching engines without Streamlit, for scheduled batch runs.
+# It reads the same CSV layouts as the sample files in data_sample/ and writes the results as CSV files.
+#
+# Examples:
+#   python batch.py sep_nus --students data_sample/sep/student_sample_nus.csv --schools data_sample/sep/school_sample_nus.csv --out results
+#   python batch.py sep --students data_sample/sep/student_sample_en.csv --schools data_sample/sep/school_sample_en.csv --out results
+#   python batch.py course --teachers data_sample/course/teacher_sample_en.csv --courses data_sample/course/course_sample_en.csv --out results
+#   python batch.py proctor --exams data_sample/exam/exam1_sample_en.csv --teachers data_sample/exam/teacher_sample_en.csv --out results
+
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+
+@contextmanager
+def stage(name):
+    """Print the wall time of one stage of the run."""
+    start = time.perf_counter()
+    yield
+    print(f"{name:<10} {time.perf_counter() - start:8.3f}s", flush=True)
+
+
+def write_csv(df, out_dir, filename):
+    path = os.path.join(out_dir, filename)
+    df.to_csv(path, index=False, encoding="utf-8-sig")
+    print(f"  wrote {path} ({len(df)} rows)")
+
+
+def spill_path(args):
+    """File a "full" trace is streamed to during the run, next to the outputs; None for the other levels."""
+    return os.path.join(args.out, "matching_processes.trace") if args.trace == "full" else None
+
+
+def progress_printer(args):
+    """on_progress callback of the engines printing the share of proposals done, with --progress; None otherwise."""
+    if not args.progress:
+        return None
+
+    def on_progress(progress):
+        if progress.done:  # total only bounds the steps: a run usually ends well before it
+            print(f"  done after {progress.steps} steps", flush=True)
+        else:
+            print(f"  {progress.steps} / at most {progress.total} steps", flush=True)
+    return on_progress
+
+
+def write_trace(trace, rosters, out_dir, lang):
+    from utils.sep_trace import SpilledTrace, write_trace_csv
+    path = os.path.join(out_dir, "matching_processes.csv")
+    write_trace_csv(trace, rosters, path, lang, encoding="utf-8-sig")
+    if isinstance(trace, SpilledTrace):
+        os.remove(trace.path)
+    print(f"  wrote {path} ({len(trace)} rows)")
+
+
+def check_inputs(students_df, schools_df, layout, args):
+    """Validate the SEP input files; write the problems found and stop on errors."""
+    from utils.sep_validation import validate, has_errors
+
+    with stage("validate"):
+        issues = validate(students_df, schools_df, layout, args.lang)
+    if len(issues):
+        write_csv(issues, args.out, "validation_issues.csv")
+    if has_errors(issues):
+        sys.exit(f"{(issues['Severity'] == 'error').sum()} errors in the input files, see validation_issues.csv")
+
+
+def run_sep(args):
+    from utils.sep import load_students, load_schools, deferred_acceptance
+
+    students_df, schools_df = pd.read_csv(args.students), pd.read_csv(args.schools)
+    check_inputs(students_df, schools_df, "sep", args)
+    with stage("load"):
+        students = load_students(students_df, args.lang)
+        schools = load_schools(schools_df, args.lang)
+    with stage("match"):
+        student_assignments, school_enrollments, matching_process_df = deferred_acceptance(
+            students, schools, args.trace, trace_path=spill_path(args), on_progress=progress_printer(args))
+    with stage("write"):
+        write_csv(pd.DataFrame(list(student_assignments.items()), columns=["Student", "Assigned School"]), args.out, "student_assignments.csv")
+        write_csv(pd.DataFrame(list(school_enrollments.items()), columns=["School", "Enrolled Student"]), args.out, "school_enrollments.csv")
+        if args.trace != "off":
+            rosters = {school_name: school.accepted_students for school_name, school in schools.items()}
+            write_trace(matching_process_df, rosters, args.out, args.lang)
+
+
+def run_sep_nus(args):
+    from utils.sep_nus import load_students, load_programs, deferred_acceptance
+    from utils.sep_cutoffs import ProgramCutoffs
+    from utils.sep_checkpoint import run_with_checkpoints
+    from utils.sep_engine import compile_instance
+    from utils.sep_store import cached_instance, file_digest
+    from utils.sep_report import report_from_results, report_from_engine
+    from utils.sep_waitlist import run_waitlist
+
+    students_df, schools_df = pd.read_csv(args.students), pd.read_csv(args.schools)
+    check_inputs(students_df, schools_df, "nus", args)
+    with stage("load"):
+        students = load_students(students_df)
+        programs = load_programs(schools_df)
+    with stage("compile"):
+        if args.instance_cache:
+            instance = cached_instance(students, programs, args.instance_cache, file_digest(args.students, args.schools))
+        else:
+            instance = compile_instance(students, programs)  # shared by the run and the waitlist rounds
+    with stage("match"):
+        if args.checkpoint:
+            # array engine saving its state as it goes: rerunning the same command resumes a run that stopped
+            state, _ = run_with_checkpoints(
+                instance, args.checkpoint, args.checkpoint_every, on_progress=progress_printer(args))
+        else:
+            rejections = {}  # quota rejections of the run, for --cutoffs
+            student_assignments, program_enrollments, matching_process_df = deferred_acceptance(
+                students, programs, args.trace, trace_path=spill_path(args), instance=instance, rejections=rejections,
+                on_progress=progress_printer(args))
+    waitlist_df = None
+    if args.waitlist_rounds:
+        with stage("waitlist"):
+            student_assignments, program_enrollments, waitlist_df = run_waitlist(
+                students, programs, student_assignments, program_enrollments, args.waitlist_rounds, args.widen, instance)
+    with stage("write"):
+        # same tables as the downloads of the page: the input files with the results appended
+        if args.checkpoint:
+            report = report_from_engine(students_df, schools_df, instance, state)
+        else:
+            report = report_from_results(students_df, schools_df, students, student_assignments, program_enrollments, waitlist_df)
+        write_csv(report.students, args.out, "student_assignments.csv")
+        write_csv(report.schools_df, args.out, "program_enrollments.csv")
+        write_csv(report.students_df, args.out, "students_with_results.csv")
+        if args.cutoffs:
+            cutoffs = ProgramCutoffs(instance, program_enrollments, rejections)
+            write_csv(cutoffs.table(), args.out, "program_cutoffs.csv")
+            write_csv(cutoffs.sensitivity(), args.out, "quota_sensitivity.csv")
+        if args.trace != "off" and not args.checkpoint:
+            rosters = {programID: program.accepted_students for programID, program in programs.items()}
+            write_trace(matching_process_df, rosters, args.out, args.lang)
+
+
+def run_course(args):
+    from utils.course import load_teachers, load_courses, teacher_course_matching
+
+    with stage("load"):
+        teachers = load_teachers(pd.read_csv(args.teachers), args.lang)
+        courses = load_courses(pd.read_csv(args.courses), args.lang)
+    with stage("match"):
+        teacher_assignments, course_assignments = teacher_course_matching(teachers, courses)
+    with stage("write"):
+        teacher_results_df = pd.DataFrame([(t, ", ".join(map(str, assigned))) for t, assigned in teacher_assignments.items()],
+                                          columns=["Teacher", "Assigned Courses"])
+        teacher_results_df["Required Classes"] = [teachers[t].required_classes for t in teacher_results_df["Teacher"]]
+        teacher_results_df["Assigned Classes"] = [sum(c[2] for c in teacher_assignments[t]) for t in teacher_results_df["Teacher"]]
+        course_results_df = pd.DataFrame([(c, ", ".join(map(str, assigned))) for c, assigned in course_assignments.items()],
+                                         columns=["Course", "Assigned Teachers"])
+        course_results_df["Assigned Classes"] = [sum(t[2] for t in course_assignments[c]) for c in course_results_df["Course"]]
+        write_csv(teacher_results_df, args.out, "teacher_assignments.csv")
+        write_csv(course_results_df, args.out, "course_enrollments.csv")
+
+
+def run_proctor(args):
+    from utils.exam import load_classes, load_teachers, assign_proctors
+    from utils.translations import translations_exam as translations
+
+    columns = translations[args.lang]
+    with stage("load"):
+        classes = load_classes(pd.read_csv(args.exams), args.lang)
+        teachers = load_teachers(pd.read_csv(args.teachers), args.lang)
+    with stage("match"):
+        assign_proctors(teachers, classes)
+    with stage("write"):
+        exams_df = pd.DataFrame([
+            {
+                columns['course']: cls['course'],
+                columns['teachers']: ','.join(cls['teachers']),
+                columns['class_id']: cls['class_id'],
+                columns['exam_date']: cls['exam_date'],
+                columns['main_proctor_faculty']: cls['main_proctor_faculty'],
+                columns['main_proctor']: cls.get('main_proctor'),
+                columns['joint_proctor_faculty']: cls['joint_proctor_faculty'],
+                columns['joint_proctor']: cls.get('joint_proctor'),
+            }
+            for cls in classes
+        ])
+        workload_df = pd.DataFrame([
+            {
+                columns['teacher_name']: teacher.name,
+                columns['main_proctor']: teacher.main_proctor_count,
+                columns['joint_proctor']: teacher.joint_proctor_count,
+            }
+            for teacher in teachers
+        ])
+        write_csv(exams_df, args.out, "proctor_assignments.csv")
+        write_csv(workload_df, args.out, "teacher_workload.csv")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a matching engine on CSV files without starting Streamlit.")
+    subparsers = parser.add_subparsers(dest="engine", required=True)
+
+    sep = subparsers.add_parser("sep", help="student exchange, one row per student (utils/sep.py)")
+    sep.add_argument("--students", required=True)
+    sep.add_argument("--schools", required=True)
+    sep.set_defaults(run=run_sep)
+
+    sep_nus = subparsers.add_parser("sep_nus", help="student exchange, NUS program layout (utils/sep_nus.py)")
+    sep_nus.add_argument("--students", required=True)
+    sep_nus.add_argument("--schools", required=True)
+    sep_nus.add_argument("--waitlist-rounds", type=int, default=0,
+                         help="rounds in which unmatched students propose again to the seats left (default: 0)")
+    sep_nus.add_argument("--widen", action="store_true",
+                         help="in waitlist rounds, add every school with seats left to the students' choices")
+    sep_nus.add_argument("--cutoffs", action="store_true",
+                         help="also write the cutoff score of every program and who extra seats would admit")
+    sep_nus.add_argument("--checkpoint",
+                         help="save the matching state to this .npz file as the run goes and resume from it if it exists "
+                              "(no matching_processes.csv)")
+    sep_nus.add_argument("--checkpoint-every", type=int, default=100000, help="proposals between checkpoints")
+    sep_nus.add_argument("--instance-cache",
+                         help="with --checkpoint: directory keeping the compiled input as .npy files, memory-mapped "
+                              "by later runs on the same files instead of compiling them again")
+    sep_nus.set_defaults(run=run_sep_nus)
+
+    for engine_parser in (sep, sep_nus):
+        engine_parser.add_argument("--trace", choices=["off", "summary", "full"], default="summary",
+                                   help="detail of matching_processes.csv (default: summary)")
+        engine_parser.add_argument("--progress", action="store_true", help="print the progress of the matching run")
+
+    course = subparsers.add_parser("course", help="lecturer-course matching (utils/course.py)")
+    course.add_argument("--teachers", required=True)
+    course.add_argument("--courses", required=True)
+    course.set_defaults(run=run_course)
+
+    proctor = subparsers.add_parser("proctor", help="exam proctor assignment (utils/exam.py)")
+    proctor.add_argument("--exams", required=True)
+    proctor.add_argument("--teachers", required=True)
+    proctor.set_defaults(run=run_proctor)
+
+    for engine_parser in (sep, sep_nus, course, proctor):
+        engine_parser.add_argument("--lang", choices=["en", "zh"], default="en", help="column layout of the input files")
+        engine_parser.add_argument("--out", default=".", help="output directory")
+
+    args = parser.parse_args()
+    if getattr(args, "checkpoint", None) and args.waitlist_rounds:
+        parser.error("--checkpoint cannot be combined with --waitlist-rounds")
+    if getattr(args, "checkpoint", None) and args.cutoffs:
+        parser.error("--checkpoint cannot be combined with --cutoffs (a checkpoint does not keep the quota rejections)")
+    if getattr(args, "instance_cache", None) and not args.checkpoint:
+        parser.error("--instance-cache needs --checkpoint")
+    os.makedirs(args.out, exist_ok=True)
+    with stage("total"):
+        args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,10 @@
 import streamlit as st
 import pandas as pd
 from utils.translations import translations_sep as translations
-from utils.sep import Student, School, deferred_acceptance
+from utils.sep import load_students, load_schools, deferred_acceptance
+from utils.sep_trace import TRACE_LEVELS
+from utils.sep_views import progress_bar, trace_spill_path, trace_download, trace_viewer, validation_panel
+from utils.sep_validation import validate_students, validate_schools, validate_choices
 from utils.layout import set_layout
 
 set_layout()
@@ -52,14 +55,10 @@ if student_file is None:
 else:
     students_df = pd.read_csv(student_file)
     st.dataframe(students_df, height=200, hide_index=True)
-    students = {}
-    for _, row in students_df.iterrows():
-        if lang_code == "en":
-            preferences = [row[f"Choice{i}"] for i in range(1, len(row) - 1) if pd.notna(row[f"Choice{i}"])]
-            students[row["StudentName"]] = Student(row["StudentName"], row["GPA"], preferences)
-        elif lang_code == "zh":
-            preferences = [row[f"选择{i}"] for i in range(1, len(row) - 1) if pd.notna(row[f"选择{i}"])]
-            students[row["姓名"]] = Student(row["姓名"], row["GPA"], preferences)
+    if validation_panel(validate_students(students_df, "sep", lang_code), lang_code):
+        student_file = None  # not loaded: Step 3 asks for a corrected file
+    else:
+        students = load_students(students_df, lang_code)
 
 
 #--------------------------------------------------#
@@ -75,10 +74,10 @@ if school_file is None:
 else:
     schools_df = pd.read_csv(school_file)
     st.dataframe(schools_df, hide_index=True)
-    if lang_code == "en":
-        schools = {row["SchoolName"]: School(row["SchoolName"], int(row["Quota"]), row["minGPA"]) for _, row in schools_df.iterrows()}
-    elif lang_code == "zh":
-        schools = {row["学校名称"]: School(row["学校名称"], int(row["名额"]), row["最低绩点"]) for _, row in schools_df.iterrows()}
+    if validation_panel(validate_schools(schools_df, "sep", lang_code), lang_code):
+        school_file = None
+    else:
+        schools = load_schools(schools_df, lang_code)
 
 
 #--------------------------------------------------#
@@ -86,9 +85,13 @@ else:
 #--------------------------------------------------#
 st.write("<div style='height: 1.5cm;'></div>", unsafe_allow_html=True)
 st.subheader(translations[lang_code]["run_matching"])
+trace_level = st.selectbox(translations[lang_code]["trace_level"], TRACE_LEVELS, index=TRACE_LEVELS.index("full"))
 if st.button(translations[lang_code]["run_matching"]):
     if student_file and school_file:                
-        student_assignments, school_enrollments, matching_process_df = deferred_acceptance(students, schools)
+        validation_panel(validate_choices(students_df, schools_df, "sep", lang_code), lang_code)
+        trace_path = trace_spill_path(trace_level)  # a full trace is streamed to disk, not kept in memory
+        student_assignments, school_enrollments, matching_process_df = deferred_acceptance(
+            students, schools, trace_level, trace_path=trace_path, on_progress=progress_bar(lang_code))
         
         student_assignments_df = pd.DataFrame(list(student_assignments.items()), columns=["Student", "Assigned School"])
         school_enrollments_df = pd.DataFrame(list(school_enrollments.items()), columns=["School", "Enrolled Student"])
@@ -103,7 +106,8 @@ if st.button(translations[lang_code]["run_matching"]):
         
         student_csv = student_assignments_df.to_csv(index=False).encode("utf-8")
         school_csv = school_enrollments_df.to_csv(index=False).encode("utf-8")
-        matching_process_csv = matching_process_df.to_csv(index=False).encode("utf-8")
+        rosters = {school_name: school.accepted_students for school_name, school in schools.items()}
+        trace_viewer(matching_process_df, rosters, lang_code)
 
         # Create a button to export the results
         st.divider()
@@ -126,13 +130,8 @@ if st.button(translations[lang_code]["run_matching"]):
             )
         
         with col3:
-            st.download_button(
-                "Download Matching Processes",
-                matching_process_csv,
-                "matching_processes.csv",
-                "text/csv",
-                on_click="ignore"
-            )
+            # reason codes are turned into readable text only when the export is asked for
+            trace_download(matching_process_df, rosters, lang_code)
     else:
         st.error(translations[lang_code]["error_message"])
 
@@ -5,7 +5,16 @@
 import streamlit as st
 import pandas as pd
 from utils.translations import translations_sep as translations
-from utils.sep_nus import Student, Program, deferred_acceptance
+from utils.sep_nus import Student, load_students, load_programs, deferred_acceptance
+from utils.sep_engine import compile_instance
+from utils.sep_trace import TRACE_LEVELS
+from utils.sep_views import progress_bar, trace_spill_path, trace_download, trace_viewer, validation_panel
+from utils.sep_validation import validate_students, validate_schools, validate_choices
+from utils.sep_audit import audit_assignment
+from utils.sep_mechanisms import MECHANISMS, compare_mechanisms
+from utils.sep_report import report_from_results
+from utils.sep_waitlist import run_waitlist
+from utils.sep_cutoffs import ProgramCutoffs
 from utils.layout import set_layout
 
 set_layout()
@@ -53,24 +62,11 @@ else:
     students_df = pd.read_csv(student_file)
     st.dataframe(students_df, hide_index=True)
     students = {}
-    # Group the data by student name to collect all preferences
     if lang_code == "en":
-        grouped = students_df.groupby("*EmplID")
-        for student_name, group in grouped:
-            preferences = [
-                [row["Ext. Study Location"], row["*Ext. Study Period"]] 
-                for _, row in sorted(group.iterrows(), key=lambda x: x[1]["Destination Ranking"])
-                ]
-            students[student_name] = Student(
-                student_name, 
-                group.iloc[0]["GPA"], 
-                group.iloc[0]["Total Score"],
-                group.iloc[0]["Student Major"].replace(' (Hons)', ''),
-                group.iloc[0]["Seniority"],
-                group.iloc[0]["Singapore Residency Status"],
-                preferences
-                )
-        # st.write(students['27X'])
+        if validation_panel(validate_students(students_df, "nus"), lang_code):
+            student_file = None  # not loaded: Step 3 asks for a corrected file
+        else:
+            students = load_students(students_df)
     elif lang_code == "zh":
         grouped = students_df.groupby("姓名")
         for student_name, group in grouped:
@@ -92,19 +88,10 @@ else:
     schools_df = pd.read_csv(school_file)
     st.dataframe(schools_df, hide_index=True)
     if lang_code == "en":
-        programs = {
-            row["ProgramID"]: 
-            Program(
-                row["SchoolName"],
-                row["Semester"],
-                row["Major (incl)"].split(", ") if not pd.isna(row["Major (incl)"]) else [],
-                row["Major (excl)"].split(", ") if not pd.isna(row["Major (excl)"]) else [],
-                int(row["Quota"]),
-                row["minGPA"],
-                row["Seniority"],
-                row["Nationality (excl)"].split(", ") if not pd.isna(row["Nationality (excl)"]) else []
-            )            
-            for _, row in schools_df.iterrows()}
+        if validation_panel(validate_schools(schools_df, "nus"), lang_code):
+            school_file = None
+        else:
+            programs = load_programs(schools_df)
     elif lang_code == "zh":
         schools = {row["学校名称"]: School(row["学校名称"], int(row["名额"]), row["最低绩点"]) for _, row in schools_df.iterrows()}
 
@@ -114,50 +101,51 @@ else:
 #--------------------------------------------------#
 st.write("<div style='height: 1.5cm;'></div>", unsafe_allow_html=True)
 st.subheader(translations[lang_code]["run_matching"])
+trace_level = st.selectbox(translations[lang_code]["trace_level"], TRACE_LEVELS, index=TRACE_LEVELS.index("full"))
+mechanisms = st.multiselect(translations[lang_code]["mechanisms"], list(MECHANISMS))
+waitlist_rounds = st.number_input(translations[lang_code]["waitlist_rounds"], min_value=0, max_value=5, value=0)
+widen = st.checkbox(translations[lang_code]["widen_preferences"], disabled=waitlist_rounds == 0)
 if st.button(translations[lang_code]["run_matching"]):
     if student_file and school_file:                
-        student_assignments, program_enrollments, matching_process_df = deferred_acceptance(students, programs)
+        validation_panel(validate_choices(students_df, schools_df, "nus"), lang_code)
+        trace_path = trace_spill_path(trace_level)  # a full trace is streamed to disk, not kept in memory
+        instance = compile_instance(students, programs)  # shared by the run and the waitlist rounds
+        rejections = {}  # quota rejections of the run, for the cutoff tables
+        student_assignments, program_enrollments, matching_process_df = deferred_acceptance(
+            students, programs, trace_level, trace_path=trace_path, instance=instance, rejections=rejections,
+            on_progress=progress_bar(lang_code))
 
-        # clean results for student assignments and school enrollments        
-        student_assignments_df = pd.DataFrame(list(student_assignments.items()), columns=["Student", "ProgramID"])
-        student_assignments_df = student_assignments_df.merge(
-            schools_df[['ProgramID', 'SchoolName', 'Semester']].rename(columns={'Semester': 'PU required semester'}), 
-            on="ProgramID",
-            how="left"
-            )
-        
-        # find the student's preferred exchange semester in student.preferences for the assigned school
-        student_assignments_df["Student preferred semester"] = student_assignments_df["Student"].apply(lambda x: students[x].preferences[students[x].current_proposal - 1][1])
+        waitlist_df = None
+        if waitlist_rounds:
+            student_assignments, program_enrollments, waitlist_df = run_waitlist(
+                students, programs, student_assignments, program_enrollments, waitlist_rounds, widen, instance)
 
-        program_enrollments_df = pd.DataFrame(list(program_enrollments.items()), columns=["ProgramID", "Enrolled Student"])
-        program_enrollments_df = program_enrollments_df.merge(
-            schools_df[['ProgramID', 'SchoolName', 'Semester', 'Quota']].rename(columns={'Semester': 'PU required semester'}), 
-            on="ProgramID", 
-            how="left"
-            )
-        
-        # add a column to show the number of students enrolled in each school
-        program_enrollments_df["Students Count"] = program_enrollments_df["Enrolled Student"].apply(lambda x: len(x) if x else 0)
-        program_enrollments_df["Quota Remaining"] = program_enrollments_df["Quota"] - program_enrollments_df["Students Count"]
+        # build the result tables and the downloadable files in one pass
+        report = report_from_results(students_df, schools_df, students, student_assignments, program_enrollments, waitlist_df)
         
         st.success(translations[lang_code]["success_message"])
+        if waitlist_df is not None:
+            st.info(translations[lang_code]["waitlist_placed"].format(len(waitlist_df)))
         st.write(translations[lang_code]["student_preview:"])
-        st.dataframe(student_assignments_df, hide_index=True)
+        st.dataframe(report.students, hide_index=True)
         st.write(translations[lang_code]["school_preview:"])
-        st.dataframe(program_enrollments_df[program_enrollments_df["Enrolled Student"].apply(lambda x: len(x) > 0)], hide_index=True)
-
-
-        # append the results to the input dataframes and allow users to download the results as csv files
-        students_df["Assigned ProgramID"] = students_df["*EmplID"].map(student_assignments)
-        students_df["Assigned University"] = students_df["Assigned ProgramID"].map(programs).apply(lambda x: x.schoolName if pd.notna(x) else None)
-        students_df['PU required semester'] = students_df['Assigned ProgramID'].map(programs).apply(lambda x: x.sem if pd.notna(x) else None)
-        schools_df["Enrolled Students"] = schools_df["ProgramID"].map(program_enrollments).apply(lambda x: ", ".join(x) if x else None)
-        schools_df["Enrolled Students Count"] = schools_df["Enrolled Students"].apply(lambda x: len(x.split(", ")) if x else 0)
-        schools_df["Quota Remaining"] = schools_df["Quota"] - schools_df["Enrolled Students Count"]
+        st.dataframe(report.programs[report.programs["Students Count"] > 0], hide_index=True)
+        if mechanisms:
+            st.write(translations[lang_code]["mechanism_preview:"])
+            st.dataframe(compare_mechanisms(students, programs, mechanisms, translations[lang_code]["unmatched"]), hide_index=True)
+        with st.expander(translations[lang_code]["cutoffs"]):
+            st.write(translations[lang_code]["cutoffs_desc"])
+            cutoffs = ProgramCutoffs(instance, program_enrollments, rejections)
+            st.dataframe(cutoffs.table(), hide_index=True)
+            st.dataframe(cutoffs.sensitivity(), hide_index=True)
+        
+        # the input files with the results appended, for download
+        students_df, schools_df = report.students_df, report.schools_df
         
         student_csv = students_df.to_csv(index=False).encode("utf-8")
         school_csv = schools_df.to_csv(index=False).encode("utf-8")
-        matching_process_csv = matching_process_df.to_csv(index=False).encode("utf-8")
+        rosters = {programID: program.accepted_students for programID, program in programs.items()}
+        trace_viewer(matching_process_df, rosters, lang_code)
 
         # Create a button to export the results
         st.divider()
@@ -180,13 +168,8 @@ if st.button(translations[lang_code]["run_matching"]):
             )
         
         with col3:
-            st.download_button(
-                "Download Matching Processes",
-                matching_process_csv,
-                "matching_processes.csv",
-                "text/csv",
-                on_click="ignore"
-            )
+            # reason codes are turned into readable text only when the export is asked for
+            trace_download(matching_process_df, rosters, lang_code)
     else:
         st.error(translations[lang_code]["error_message"])
 
@@ -195,80 +178,48 @@ if st.button("Run Matching with Sample Data"):
     
     # construct students and programs object from sample csv
     students_df = studentSample.copy()
-    students = {}
-    grouped = students_df.groupby("*EmplID")
-    for student_name, group in grouped:
-        preferences = [
-            [row["Ext. Study Location"], row["*Ext. Study Period"]] 
-            for _, row in sorted(group.iterrows(), key=lambda x: x[1]["Destination Ranking"])
-            ]
-        students[student_name] = Student(
-            student_name, 
-            group.iloc[0]["GPA"], 
-            group.iloc[0]["Total Score"],
-            group.iloc[0]["Student Major"].replace(' (Hons)', ''),
-            group.iloc[0]["Seniority"],
-            group.iloc[0]["Singapore Residency Status"],
-            preferences
-            )
-    
+    students = load_students(students_df)
     schools_df = schoolSample.copy()
-    programs = {
-        row["ProgramID"]: 
-        Program(
-            row["SchoolName"],
-            row["Semester"],
-            row["Major (incl)"].split(", ") if not pd.isna(row["Major (incl)"]) else [],
-            row["Major (excl)"].split(", ") if not pd.isna(row["Major (excl)"]) else [],
-            int(row["Quota"]),
-            row["minGPA"],
-            row["Seniority"],
-            row["Nationality (excl)"].split(", ") if not pd.isna(row["Nationality (excl)"]) else []
-        )            
-        for _, row in schools_df.iterrows()}
+    programs = load_programs(schools_df)
 
-    student_assignments, program_enrollments, matching_process_df = deferred_acceptance(students, programs)
+    trace_path = trace_spill_path(trace_level)  # a full trace is streamed to disk, not kept in memory
+    instance = compile_instance(students, programs)  # shared by the run and the waitlist rounds
+    rejections = {}  # quota rejections of the run, for the cutoff tables
+    student_assignments, program_enrollments, matching_process_df = deferred_acceptance(
+        students, programs, trace_level, trace_path=trace_path, instance=instance, rejections=rejections,
+        on_progress=progress_bar(lang_code))
 
-    # clean results for student assignments and school enrollments        
-    student_assignments_df = pd.DataFrame(list(student_assignments.items()), columns=["Student", "ProgramID"])
-    student_assignments_df = student_assignments_df.merge(
-        schools_df[['ProgramID', 'SchoolName', 'Semester']].rename(columns={'Semester': 'PU required semester'}), 
-        on="ProgramID",
-        how="left"
-        )
-    
-    # find the student's preferred exchange semester in student.preferences for the assigned school
-    student_assignments_df["Student preferred semester"] = student_assignments_df["Student"].apply(lambda x: students[x].preferences[students[x].current_proposal - 1][1])
+    waitlist_df = None
+    if waitlist_rounds:
+        student_assignments, program_enrollments, waitlist_df = run_waitlist(
+            students, programs, student_assignments, program_enrollments, waitlist_rounds, widen, instance)
 
-    program_enrollments_df = pd.DataFrame(list(program_enrollments.items()), columns=["ProgramID", "Enrolled Student"])
-    program_enrollments_df = program_enrollments_df.merge(
-        schools_df[['ProgramID', 'SchoolName', 'Semester', 'Quota']].rename(columns={'Semester': 'PU required semester'}), 
-        on="ProgramID", 
-        how="left"
-        )
-    
-    # add a column to show the number of students enrolled in each school
-    program_enrollments_df["Students Count"] = program_enrollments_df["Enrolled Student"].apply(lambda x: len(x) if x else 0)
-    program_enrollments_df["Quota Remaining"] = program_enrollments_df["Quota"] - program_enrollments_df["Students Count"]
+    # build the result tables and the downloadable files in one pass
+    report = report_from_results(students_df, schools_df, students, student_assignments, program_enrollments, waitlist_df)
     
     st.success(translations[lang_code]["success_message"])
+    if waitlist_df is not None:
+        st.info(translations[lang_code]["waitlist_placed"].format(len(waitlist_df)))
     st.write(translations[lang_code]["student_preview:"])
-    st.dataframe(student_assignments_df, hide_index=True)
+    st.dataframe(report.students, hide_index=True)
     st.write(translations[lang_code]["school_preview:"])
-    st.dataframe(program_enrollments_df[program_enrollments_df["Enrolled Student"].apply(lambda x: len(x) > 0)], hide_index=True)
-
-
-    # append the results to the input dataframes and allow users to download the results as csv files
-    students_df["Assigned ProgramID"] = students_df["*EmplID"].map(student_assignments)
-    students_df["Assigned University"] = students_df["Assigned ProgramID"].map(programs).apply(lambda x: x.schoolName if pd.notna(x) else None)
-    students_df['PU required semester'] = students_df['Assigned ProgramID'].map(programs).apply(lambda x: x.sem if pd.notna(x) else None)
-    schools_df["Enrolled Students"] = schools_df["ProgramID"].map(program_enrollments).apply(lambda x: ", ".join(x) if x else None)
-    schools_df["Enrolled Students Count"] = schools_df["Enrolled Students"].apply(lambda x: len(x.split(", ")) if x else 0)
-    schools_df["Quota Remaining"] = schools_df["Quota"] - schools_df["Enrolled Students Count"]
+    st.dataframe(report.programs[report.programs["Students Count"] > 0], hide_index=True)
+    if mechanisms:
+        st.write(translations[lang_code]["mechanism_preview:"])
+        st.dataframe(compare_mechanisms(students, programs, mechanisms, translations[lang_code]["unmatched"]), hide_index=True)
+    with st.expander(translations[lang_code]["cutoffs"]):
+        st.write(translations[lang_code]["cutoffs_desc"])
+        cutoffs = ProgramCutoffs(instance, program_enrollments, rejections)
+        st.dataframe(cutoffs.table(), hide_index=True)
+        st.dataframe(cutoffs.sensitivity(), hide_index=True)
+    
+    # the input files with the results appended, for download
+    students_df, schools_df = report.students_df, report.schools_df
     
     student_csv = students_df.to_csv(index=False).encode("utf-8")
     school_csv = schools_df.to_csv(index=False).encode("utf-8")
-    matching_process_csv = matching_process_df.to_csv(index=False).encode("utf-8")
+    rosters = {programID: program.accepted_students for programID, program in programs.items()}
+    trace_viewer(matching_process_df, rosters, lang_code)
 
     # Create a button to export the results
     st.divider()
@@ -291,11 +242,44 @@ if st.button("Run Matching with Sample Data"):
         )
     
     with col3:
-        st.download_button(
-            "Download Matching Processes",
-            matching_process_csv,
-            "matching_processes.csv",
-            "text/csv",
-            on_click="ignore"
-        )
+        # reason codes are turned into readable text only when the export is asked for
+        trace_download(matching_process_df, rosters, lang_code)
+
+
+#--------------------------------------------------#
+# Step 4: Check a hand-edited assignment           #
+#--------------------------------------------------#
+st.write("<div style='height: 1.5cm;'></div>", unsafe_allow_html=True)
+st.subheader(translations[lang_code]["audit"])
+edited_file = st.file_uploader(translations[lang_code]["audit_desc"], type=["csv"])
 
+if edited_file is not None:
+    if student_file and school_file:
+        edited_df = pd.read_csv(edited_file).drop_duplicates("*EmplID")
+        edited_assignments = {
+            name: (programID if pd.notna(programID) else None)
+            for name, programID in zip(edited_df["*EmplID"], edited_df["Assigned ProgramID"])
+        }
+        # the unedited result, so problems the matching itself leaves are not blamed on the edits
+        baseline, _, _ = deferred_acceptance(load_students(students_df), load_programs(schools_df), "off")
+        audit_df = audit_assignment(load_students(students_df), load_programs(schools_df), edited_assignments, baseline)
+        edits_df, engine_df = audit_df[audit_df["From Edits"]], audit_df[~audit_df["From Edits"]]
+        if edits_df.empty:
+            st.success(translations[lang_code]["audit_stable"])
+        else:
+            st.write(translations[lang_code]["audit_issues"])
+            st.dataframe(edits_df.drop(columns="From Edits"), hide_index=True)
+        if not engine_df.empty:
+            with st.expander(translations[lang_code]["audit_engine"].format(len(engine_df))):
+                st.write(translations[lang_code]["audit_engine_desc"])
+                st.dataframe(engine_df.drop(columns="From Edits"), hide_index=True)
+        if not audit_df.empty:
+            st.download_button(
+                translations[lang_code]["download_audit"],
+                audit_df.to_csv(index=False).encode("utf-8"),
+                "assignment_check.csv",
+                "text/csv",
+                on_click="ignore"
+            )
+    else:
+        st.error(translations[lang_code]["error_message"])
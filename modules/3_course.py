@@ -5,7 +5,7 @@
 import streamlit as st
 import pandas as pd
 from utils.translations import translations_course as translations
-from utils.course import Teacher, Course, teacher_course_matching
+from utils.course import load_teachers, load_courses, teacher_course_matching
 from utils.layout import set_layout
 from utils.surveys import teaching_survey
 
@@ -95,19 +95,8 @@ st.write("<div style='height: 1.5cm;'></div>", unsafe_allow_html=True)
 st.subheader(translations[lang_code]["run_matching"])
 if st.button(translations[lang_code]["run_matching_button"]):
     if teacher_file and course_file:
-        teachers = {}
-        for _, row in teachers_df.iterrows():
-            if lang_code == "en":
-                preferences = [row[f"choice{i}"] for i in range(1, len(row) - 2) if pd.notna(row[f"choice{i}"])]
-                teachers[row["name"]] = Teacher(row["name"], row["language"], int(row["required_classes"]), preferences)
-            elif lang_code == "zh":
-                preferences = [row[f"课程偏好{i}"] for i in range(1, len(row) - 2) if pd.notna(row[f"课程偏好{i}"])]
-                teachers[row["老师姓名"]] = Teacher(row["老师姓名"], row["授课语言"], int(row["课时要求"]), preferences)
-        
-        if lang_code == "en":
-            courses = {row["course"]: Course(row["course"], int(row["classes"])) for _, row in courses_df.iterrows()}
-        elif lang_code == "zh":
-            courses = {row["课程名称"]: Course(row["课程名称"], int(row["班次需求"])) for _, row in courses_df.iterrows()}
+        teachers = load_teachers(teachers_df, lang_code)
+        courses = load_courses(courses_df, lang_code)
         
         teacher_assignments, course_assignments = teacher_course_matching(teachers, courses)
         
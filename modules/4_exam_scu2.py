@@ -10,7 +10,7 @@
 
 import streamlit as st
 import pandas as pd
-from utils.exam_scu2 import Teacher, Exam, assign_proctors
+from utils.exam_scu2 import load_exams, load_teachers, assign_proctors
 from utils.layout import set_layout
 from utils.translations import translations_exam_scu2 as translations
 
@@ -59,23 +59,7 @@ if exam1_file is None:
 else:
     exam1_info = pd.read_csv(exam1_file)
     st.write(exam1_info)
-    exam1_classes = [
-        Exam(
-              row[translations[lang_code]['exam_id']],
-              row[translations[lang_code]['teaching_dept']],
-              row[translations[lang_code]['course']]+ ' (' +str(row[translations[lang_code]['course_id']]) + ')',
-              row[translations[lang_code]['class_id']],
-              row[translations[lang_code]['teachers']].split(' '),  # Assuming teachers are comma-separated
-              row[translations[lang_code]['exam_date']],
-              row[translations[lang_code]['exam_time']],
-              row[translations[lang_code]['exam_location']],
-              row[translations[lang_code]['proctor_dept']],
-              row[translations[lang_code]['proctor_count']],
-            # 'main_proctor_faculty': row[translations[lang_code]['main_proctor_faculty']],
-            # 'joint_proctor_faculty': row[translations[lang_code]['joint_proctor_faculty']],
-        )
-        for _, row in exam1_info.iterrows()
-    ] 
+    exam1_classes = load_exams(exam1_info, lang_code)
     exam2_file = None
 
 # allow uploading of 2nd batch exam schedule
@@ -111,16 +95,7 @@ else:
     st.write(teacher_info)
     # remove rows with non-empty column '豁免主考'
     # teacher_info = teacher_info[teacher_info[translations[lang_code]['exempted_main']].isna()]
-    teachers = [
-        Teacher(row[translations[lang_code]['teacher_name']], 
-                row[translations[lang_code]['workload']],
-                row[translations[lang_code]['exempted_main']],
-                row[translations[lang_code]['exempted_joint']],
-                row[translations[lang_code]['preferred_location']],
-                row[translations[lang_code]['special_needs']],
-                [row[translations[lang_code][f'date{i}']] for i in range(1, 9) if not pd.isna(row[translations[lang_code][f'date{i}']])])
-        for _, row in teacher_info.iterrows()
-    ]
+    teachers = load_teachers(teacher_info, lang_code)
     
     # teachers_df = [
     #     {
@@ -0,0 +1,5 @@
+# The utils/ modules are imported as in the pages and batch.py, from the repository root.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
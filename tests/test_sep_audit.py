@@ -0,0 +1,26 @@
+import numpy as np
+from test_sep_engine import synthetic
+from utils.sep_audit import audit_assignment
+from utils.sep_engine import compile_instance
+from utils.sep_nus import deferred_acceptance
+
+
+def test_capped_result_has_no_cap_problems_and_edits_over_caps_are_flagged():
+    students, programs = synthetic(1, capped=True, keyed=True)
+    baseline, _, _ = deferred_acceptance(*synthetic(1, capped=True, keyed=True), "off")
+    audit = audit_assignment(students, programs, baseline, baseline)
+    assert not audit['From Edits'].any()
+    assert not audit['Issue'].isin(['over quota', 'over cap']).any()
+
+    # put unmatched students into capped programs, past the caps
+    instance = compile_instance(students, programs)
+    capped = [instance.program_ids[p] for p in np.flatnonzero(instance.program_group >= 0)]
+    edited = dict(baseline)
+    rng = np.random.default_rng(0)
+    for name in [name for name, program_id in baseline.items() if program_id is None][:40]:
+        edited[name] = capped[rng.integers(len(capped))]
+    audit = audit_assignment(students, programs, edited, baseline)
+    over_cap = audit[audit['Issue'] == 'over cap']
+    assert len(over_cap) and over_cap['From Edits'].all()
+    assert (over_cap['Enrolled'] > over_cap['Quota']).all()
+    assert set(over_cap['ProgramID']) <= set(instance.group_names)
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+import utils.sep_checkpoint as sep_checkpoint
+from utils.sep_checkpoint import run_with_checkpoints
+from utils.sep_components import run_decomposed
+from utils.sep_engine import compile_instance, matching_result, run_deferred_acceptance, to_assignment_dicts
+from utils.sep_nus import deferred_acceptance, load_programs, load_students
+from utils.sep_store import load_instance, save_instance
+from utils.sep_synthetic import generate_nus
+
+KEYS = [None, 'GPA, Seniority, Total Score', 'Seniority, GPA']
+
+
+def synthetic(seed, capped=False, keyed=False):
+    """Students / Program dicts of a generate_nus instance, with school / semester caps and priority keys if asked."""
+    rng = np.random.default_rng(seed)
+    students_df, schools_df = generate_nus(300, 15, programs_per_school=2.5, seed=seed, tightness=2.5)
+    students_df['GPA'] = students_df['GPA'].round(1)  # ties
+    if capped:
+        schools_df['School Quota'] = np.nan
+        schools_df['Semester Quota'] = np.nan
+        for _, rows in schools_df.groupby('SchoolName').groups.items():
+            if rng.random() < 0.6:
+                schools_df.loc[rows, 'School Quota'] = int(schools_df.loc[rows, 'Quota'].sum() * rng.uniform(0.3, 1.0))
+            for _, semester_rows in schools_df.loc[rows].groupby('Semester').groups.items():
+                if rng.random() < 0.5:
+                    schools_df.loc[semester_rows, 'Semester Quota'] = int(schools_df.loc[semester_rows, 'Quota'].sum() * rng.uniform(0.2, 1.0))
+    if keyed:  # one key per school, as programs sharing a cap must share their key
+        school_key = {school: KEYS[rng.integers(len(KEYS))] for school in schools_df['SchoolName'].unique()}
+        schools_df['Priority'] = schools_df['SchoolName'].map(school_key)
+    return load_students(students_df), load_programs(schools_df)
+
+
+CASES = [(seed, capped, keyed) for seed in (1, 2) for capped in (False, True) for keyed in (False, True)]
+
+
+@pytest.mark.parametrize("seed, capped, keyed", CASES)
+def test_array_engine_matches_deferred_acceptance(seed, capped, keyed):
+    students, programs = synthetic(seed, capped, keyed)
+    instance = compile_instance(students, programs)
+    assert bool(len(instance.group_capacity)) == capped and bool(len(instance.priority_ranks)) == keyed
+    expected = to_assignment_dicts(instance, *run_deferred_acceptance(instance))
+    for trace_level in ("off", "full"):
+        student_assignments, program_enrollments, _ = deferred_acceptance(*synthetic(seed, capped, keyed), trace_level)
+        assert (student_assignments, program_enrollments) == expected
+    assert to_assignment_dicts(instance, *run_decomposed(instance, max_workers=1)) == expected
+
+
+@pytest.mark.parametrize("capped, keyed", [(False, False), (True, True)])
+def test_stored_instance_gives_the_same_matching(tmp_path, capped, keyed):
+    instance = compile_instance(*synthetic(3, capped, keyed))
+    save_instance(instance, tmp_path)
+    assignment, roster_ids = run_deferred_acceptance(load_instance(tmp_path))
+    expected_assignment, expected_roster_ids = run_deferred_acceptance(instance)
+    assert np.array_equal(assignment, expected_assignment) and roster_ids == expected_roster_ids
+
+
+def test_checkpoint_resume_gives_the_same_matching(tmp_path, monkeypatch):
+    instance = compile_instance(*synthetic(4, capped=True, keyed=True))
+    path = str(tmp_path / "checkpoint.npz")
+
+    class Stopped(Exception):
+        pass
+
+    saved = []
+    save_checkpoint = sep_checkpoint.save_checkpoint
+
+    def save_then_stop(*args, **kwargs):
+        save_checkpoint(*args, **kwargs)
+        saved.append(args[1].step)
+        if len(saved) == 3:
+            raise Stopped
+
+    monkeypatch.setattr(sep_checkpoint, "save_checkpoint", save_then_stop)
+    with pytest.raises(Stopped):
+        run_with_checkpoints(instance, path, checkpoint_every=7)
+    monkeypatch.undo()
+    stopped, _ = sep_checkpoint.load_checkpoint(path, instance, sep_checkpoint.instance_fingerprint(instance))
+    assert stopped.step == saved[-1] > 0
+
+    state, _ = run_with_checkpoints(instance, path, checkpoint_every=7)
+    assert state.step > saved[-1]
+    assignment, roster_ids = matching_result(instance, state)
+    expected_assignment, expected_roster_ids = run_deferred_acceptance(instance)
+    assert np.array_equal(assignment, expected_assignment) and roster_ids == expected_roster_ids
+
+
+def test_progress_is_reported_without_changing_the_matching():
+    students, programs = synthetic(5, capped=True, keyed=True)
+    instance = compile_instance(students, programs)
+    reports = {"array": [], "object": []}
+    assignment, roster_ids = run_deferred_acceptance(instance, on_progress=reports["array"].append, progress_every=50)
+    expected = to_assignment_dicts(instance, assignment, roster_ids)
+    assert deferred_acceptance(students, programs, "off", on_progress=reports["object"].append, progress_every=50)[:2] == expected
+    for progress in reports.values():
+        assert [p.done for p in progress] == [False] * (len(progress) - 1) + [True]
+        assert [p.steps for p in progress[:-1]] == list(range(0, 50 * (len(progress) - 1), 50))
+        assert progress[-1].steps <= progress[-1].total
+    assert reports["array"][-1].steps == reports["object"][-1].steps
@@ -0,0 +1,43 @@
+import copy
+
+import numpy as np
+import pytest
+from test_sep_engine import synthetic
+from utils.sep_engine import deferred_acceptance_fast
+from utils.sep_incremental import IncrementalMatcher
+
+
+def random_edit(matcher, rng):
+    """One edit of a random student or program: score, GPA, preferences, quota or minimum GPA."""
+    kind = rng.integers(6)
+    if kind < 3:
+        name = list(matcher.students)[rng.integers(len(matcher.students))]
+        student = copy.copy(matcher.students[name])
+        if kind == 0:
+            student.total_score += rng.normal(0, 0.5)
+        elif kind == 1:
+            student.gpa = float(np.clip(student.gpa + rng.normal(0, 0.5), 0, 5))
+        else:
+            student.preferences = list(student.preferences)[::-1][:rng.integers(1, len(student.preferences) + 2)]
+        return {name: student}, {}
+    program_id = list(matcher.programs)[rng.integers(len(matcher.programs))]
+    program = copy.copy(matcher.programs[program_id])
+    if kind == 5:
+        program.minGPA = float(rng.uniform(2, 4))
+    else:
+        program.quota = max(0, program.quota + (1 if kind == 3 else -1))
+    return {}, {program_id: program}
+
+
+@pytest.mark.parametrize("seed, capped", [(1, False), (2, True)])
+def test_updates_give_the_result_of_a_full_run(seed, capped):
+    matcher = IncrementalMatcher(*synthetic(seed, capped), checkpoint_every=20)
+    rng = np.random.default_rng(seed)
+    replays = []
+    for _ in range(40):
+        result = matcher.update(*random_edit(matcher, rng))
+        assert result == deferred_acceptance_fast(matcher.students, matcher.programs)
+        replays.append(matcher.replayed_from)
+    # edits that never come into play are not replayed, the others mostly from a late checkpoint
+    assert None in replays
+    assert any(step is not None and step > 0 for step in replays)
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+from test_sep_engine import synthetic
+from utils.sep_capacity import group_counts
+from utils.sep_engine import compile_instance
+from utils.sep_mechanisms import MECHANISMS
+from utils.sep_nus import load_programs, load_students
+from utils.sep_synthetic import generate_nus
+
+
+@pytest.mark.parametrize("name", list(MECHANISMS))
+def test_mechanisms_keep_quotas_and_caps(name):
+    instance = compile_instance(*synthetic(2, capped=True))
+    assignment, roster_ids = MECHANISMS[name](instance)
+    enrolled = np.bincount(assignment[assignment >= 0], minlength=instance.n_programs)
+    assert (enrolled <= instance.program_quota).all()
+    assert (group_counts(instance.program_group, instance.group_parent, enrolled) <= instance.group_capacity).all()
+    assert [len(roster) for roster in roster_ids] == enrolled.tolist()
+
+
+def test_mechanisms_rank_by_the_program_key():
+    # one program per school and one choice per student: every mechanism gives each program its best
+    # applicants under the program's key, so all agree with DA
+    students_df, schools_df = generate_nus(300, 12, programs_per_school=1, prefs_per_student=1, seed=6, tightness=3)
+    schools_df['Priority'] = ['GPA, Seniority, Total Score' if i % 2 else None for i in range(len(schools_df))]
+    instance = compile_instance(load_students(students_df), load_programs(schools_df))
+    assert len(instance.priority_ranks)
+    results = {name: mechanism(instance) for name, mechanism in MECHANISMS.items()}
+    for assignment, roster_ids in results.values():
+        assert np.array_equal(assignment, results["DA"][0])
+        assert roster_ids == results["DA"][1]
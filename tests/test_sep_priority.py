@@ -0,0 +1,57 @@
+import re
+
+import numpy as np
+from utils.sep_cutoffs import ProgramCutoffs
+from utils.sep_engine import compile_instance
+from utils.sep_nus import deferred_acceptance, load_programs, load_students
+from utils.sep_priority import dense_rank, parse_priority
+from utils.sep_synthetic import generate_nus
+from utils.sep_trace import render_reasons
+
+
+def test_parse_priority():
+    assert parse_priority("GPA, Seniority") == ("GPA", "Seniority")
+    assert parse_priority(np.nan) is None
+    assert parse_priority(" ") is None
+
+
+def test_dense_rank_orders_lexicographically_and_keeps_ties():
+    gpa = [4.0, 4.0, 3.5, np.nan, 4.0]
+    seniority = [2, 3, 3, 3, 2]
+    assert dense_rank([gpa, seniority]).tolist() == [2, 3, 1, 0, 2]
+
+
+def test_keyed_program_trace_shows_total_scores():
+    students_df, schools_df = generate_nus(300, 10, programs_per_school=2.5, seed=5, tightness=3)
+    schools_df['Priority'] = 'GPA, Seniority'
+    programs = load_programs(schools_df)
+    _, _, trace = deferred_acceptance(load_students(students_df), programs, "full")
+    scores = set(students_df['Total Score'])
+    assert trace['Total Score'].isin(scores).all()
+    assert trace['Cutoff Score'].dropna().isin(scores).all()
+
+    rendered = render_reasons(trace, {program_id: program.accepted_students for program_id, program in programs.items()})
+    listed = [float(score) for reason in rendered['Reason'].dropna() for score in re.findall(r"', ([0-9.]+)\)", reason)]
+    assert listed and set(listed) <= scores
+
+
+def test_keyed_program_cutoffs_follow_the_key():
+    students_df, schools_df = generate_nus(400, 8, programs_per_school=2.5, seed=3, tightness=3)
+    students_df['GPA'] = students_df['GPA'].round(1)  # ties on the first column of the key
+    schools_df['Priority'] = 'GPA, Total Score'
+    students, programs = load_students(students_df), load_programs(schools_df)
+    instance = compile_instance(students, programs)
+    rejections = {}
+    _, program_enrollments, _ = deferred_acceptance(students, programs, "off", instance=instance, rejections=rejections)
+    cutoffs = ProgramCutoffs(instance, program_enrollments, rejections)
+
+    checked = 0
+    for program_id, rejected in zip(instance.program_ids, cutoffs.rejected):
+        keys = [(students[instance.student_names[s]].gpa, students[instance.student_names[s]].total_score) for s in rejected]
+        assert keys == sorted(keys, reverse=True)
+        if keys:
+            assert cutoffs.seats_needed(program_id, keys[-1]) == len(keys)
+            assert cutoffs.seats_needed(program_id, (keys[0][0], np.inf)) == 0
+            checked += 1
+    assert checked
+    assert (cutoffs.table()['Priority'] == 'GPA, Total Score').all()
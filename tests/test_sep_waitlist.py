@@ -0,0 +1,16 @@
+import numpy as np
+from utils.sep_nus import deferred_acceptance, load_programs, load_students
+from utils.sep_synthetic import generate_nus
+from utils.sep_waitlist import run_waitlist
+
+
+def test_choices_without_a_semester_show_no_preferred_semester():
+    students_df, schools_df = generate_nus(300, 15, programs_per_school=2.5, seed=3, tightness=2.5)
+    students_df['*Ext. Study Period'] = students_df['*Ext. Study Period'].where(np.arange(len(students_df)) % 3 == 0)
+    schools_df['Semester'] = schools_df['Semester'].where(np.arange(len(schools_df)) % 2 == 0)
+    students, programs = load_students(students_df), load_programs(schools_df)
+    student_assignments, program_enrollments, _ = deferred_acceptance(students, programs, "off")
+    _, _, waitlist_df = run_waitlist(students, programs, student_assignments, program_enrollments, 2, widen=True)
+    preferred = waitlist_df['Student preferred semester']
+    assert preferred.isna().any()
+    assert preferred.dropna().isin(students_df['*Ext. Study Period'].dropna()).all()
@@ -1,4 +1,5 @@
 # import streamlit as st
+import pandas as pd
 
 class Teacher:
     def __init__(self, name, lang, required_classes, preferred_courses):
@@ -17,6 +18,27 @@ class Course:
         self.required_classes = required_classes  # Total classes that need teachers
         self.assigned_teachers = []  # List of (teacher_name, lang, num_classes)
 
+def load_teachers(teachers_df, lang_code):
+    # Build Teacher objects from the teacher preference file
+    teachers = {}
+    for _, row in teachers_df.iterrows():
+        if lang_code == "en":
+            preferences = [row[f"choice{i}"] for i in range(1, len(row) - 2) if pd.notna(row[f"choice{i}"])]
+            teachers[row["name"]] = Teacher(row["name"], row["language"], int(row["required_classes"]), preferences)
+        elif lang_code == "zh":
+            preferences = [row[f"课程偏好{i}"] for i in range(1, len(row) - 2) if pd.notna(row[f"课程偏好{i}"])]
+            teachers[row["老师姓名"]] = Teacher(row["老师姓名"], row["授课语言"], int(row["课时要求"]), preferences)
+    return teachers
+
+
+def load_courses(courses_df, lang_code):
+    # Build Course objects from the course file
+    if lang_code == "en":
+        return {row["course"]: Course(row["course"], int(row["classes"])) for _, row in courses_df.iterrows()}
+    elif lang_code == "zh":
+        return {row["课程名称"]: Course(row["课程名称"], int(row["班次需求"])) for _, row in courses_df.iterrows()}
+
+
 def teacher_course_matching(teachers, courses):
     """
     Matches teachers to courses ensuring all courses are covered and 
@@ -1,4 +1,5 @@
 # This module is responsible for assigning proctors to classes based on their availability and teaching assignments.
+from utils.translations import translations_exam as translations
 
 class Teacher:
     def __init__(self, name, unavailable_dates):
@@ -33,6 +34,31 @@ class Class:
         self.joint_proctor = None
 
 
+def load_classes(exam_df, lang_code):
+    # Build the class dicts of assign_proctors from the exam schedule file; column names follow translations_exam
+    columns = translations[lang_code]
+    return [
+        {
+            'course': row[columns['course']],
+            'teachers': row[columns['teachers']].split(','),  # Teachers are comma-separated
+            'class_id': row[columns['class_id']],
+            'exam_date': row[columns['exam_date']],
+            'main_proctor_faculty': row[columns['main_proctor_faculty']],
+            'joint_proctor_faculty': row[columns['joint_proctor_faculty']],
+        }
+        for _, row in exam_df.iterrows()
+    ]
+
+
+def load_teachers(teacher_df, lang_code):
+    # Build Teacher objects from the invigilator file
+    columns = translations[lang_code]
+    return [
+        Teacher(row[columns['teacher_name']], [row[columns[f'date{i}']] for i in range(1, 4)])
+        for _, row in teacher_df.iterrows()
+    ]
+
+
 def assign_proctors(teachers, classes):
     """
     Assign proctors to classes based on priority and availability.
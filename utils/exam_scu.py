@@ -1,5 +1,4 @@
 # This module is responsible for assigning proctors to classes based on their availability and teaching assignments.
-import streamlit as st
 import pandas as pd
 
 class Teacher:
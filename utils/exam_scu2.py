@@ -1,6 +1,6 @@
 # This module is responsible for assigning proctors to classes based on their availability and teaching assignments.
-import streamlit as st
 import pandas as pd
+from utils.translations import translations_exam_scu2 as translations
 
 class Teacher:
     def __init__(self, name, workload, exempted_main, exempted_joint, preferred_location, special_needs, unavailable_dates):
@@ -49,6 +49,41 @@ class Exam:
         self.joint_proctor = None
 
 
+def load_exams(exam_df, lang_code):
+    # Build Exam objects from the exam schedule file; column names follow translations_exam_scu2
+    columns = translations[lang_code]
+    return [
+        Exam(
+            row[columns['exam_id']],
+            row[columns['teaching_dept']],
+            row[columns['course']] + ' (' + str(row[columns['course_id']]) + ')',
+            row[columns['class_id']],
+            row[columns['teachers']].split(' '),  # Teachers are space-separated
+            row[columns['exam_date']],
+            row[columns['exam_time']],
+            row[columns['exam_location']],
+            row[columns['proctor_dept']],
+            row[columns['proctor_count']],
+        )
+        for _, row in exam_df.iterrows()
+    ]
+
+
+def load_teachers(teacher_df, lang_code):
+    # Build Teacher objects from the invigilator file
+    columns = translations[lang_code]
+    return [
+        Teacher(row[columns['teacher_name']], 
+                row[columns['workload']],
+                row[columns['exempted_main']],
+                row[columns['exempted_joint']],
+                row[columns['preferred_location']],
+                row[columns['special_needs']],
+                [row[columns[f'date{i}']] for i in range(1, 9) if not pd.isna(row[columns[f'date{i}']])])
+        for _, row in teacher_df.iterrows()
+    ]
+
+
 def assign_proctors(teachers, exams):
     """
     Assign proctors to exam classes based on priority and availability.
@@ -0,0 +1,83 @@
+# This module contains the capacity-bounded acceptance list used by School (utils/sep.py) and Program (utils/sep_nus.py).
+import heapq
+import itertools
+
+
+class BoundedRoster:
+    """
+    Tentatively accepted students of a school or program, at most `capacity` of them.
+    Kept as a min-heap so the lowest-ranked student is always at the top: push / evict are O(log q)
+    and the current cutoff is O(1). Among equal scores the earlier arrival ranks higher, which is the
+    order the previous append-and-sort list produced.
+    Students are ranked by their score, or by a separate rank when one is pushed (a program with its own
+    priority key, utils/sep_priority.py); every view still lists (score, name).
+    """
+    def __init__(self, capacity, history=False):
+        self.capacity = capacity
+        self._heap = []  # (rank, -arrival, student_name, score), heap[0] is the lowest-ranked student
+        self._arrival = itertools.count()
+        # with history: every pushed (score, name, rank) and None for every pop, so past versions can be
+        # rebuilt for the trace; None when nothing is traced
+        self.history = [] if history else None
+
+    def keep_history(self):
+        """Start recording the history of an empty roster, for a matching run that keeps a trace."""
+        if self.history is None:
+            self.history = []
+
+    def push(self, score, name, rank=None):
+        """Add a student, ranked by rank if given, else by score. Returns the evicted (score, name) if the roster was full, otherwise None."""
+        if self.history is not None:
+            self.history.append((score, name, rank))
+        entry = (score if rank is None else rank, -next(self._arrival), name, score)
+        if len(self._heap) < self.capacity:
+            heapq.heappush(self._heap, entry)
+            return None
+        removed = heapq.heappushpop(self._heap, entry)  # the new student itself when it ranks lowest
+        return removed[3], removed[2]
+
+    def pop(self):
+        """Remove the lowest-ranked (score, name), for a seat cap shared with other rosters (utils/sep_capacity.py)."""
+        if self.history is not None:
+            self.history.append(None)
+        _, _, name, score = heapq.heappop(self._heap)
+        return score, name
+
+    def cutoff(self):
+        """The lowest-ranked accepted (score, name), or None if the roster is empty."""
+        if not self._heap:
+            return None
+        return self._heap[0][3], self._heap[0][2]
+
+    def is_full(self):
+        return len(self._heap) >= self.capacity
+
+    def sorted(self):
+        """Sorted roster view: list of (score, name), best first."""
+        return [(score, name) for _, _, name, score in sorted(self._heap, reverse=True)]
+
+    def snapshot(self):
+        """Id of the current roster version: the number of pushes and pops so far; None without history."""
+        return None if self.history is None else len(self.history)
+
+    def replay(self, snapshots, roster=None):
+        """
+        Rebuild the sorted roster view at each of the given snapshot ids in one pass over the history.
+        roster: an earlier replay to continue from, advanced in place (snapshots must not be older than it).
+        """
+        roster = roster if roster is not None else BoundedRoster(self.capacity, history=True)
+        views = {}
+        for snapshot in sorted(set(snapshots)):
+            for pushed in self.history[roster.snapshot():snapshot]:
+                if pushed is None:
+                    roster.pop()
+                else:
+                    roster.push(*pushed)
+            views[snapshot] = roster.sorted()
+        return views
+
+    def __iter__(self):
+        return iter(self.sorted())
+
+    def __len__(self):
+        return len(self._heap)
@@ -1,5 +1,17 @@
-import streamlit as st
+import numpy as np
 import pandas as pd
+from utils.roster import BoundedRoster
+from utils.sep_trace import TraceRecorder, Progress, Reason, UNKNOWN_SCHOOL
+
+# Columns of the matching process table
+TRACE_COLUMNS = {
+    'Student Name': object,
+    'GPA': np.float64,
+    'Action': object,
+    'Choice Number': object,
+    'School Name': object,
+}  # followed by the reason code columns of utils.sep_trace
+
 
 class Student:
     def __init__(self, name, gpa, preferences):
@@ -21,62 +33,85 @@ class School:
         self.name = name
         self.quota = quota
         self.minGPA = minGPA
-        self.accepted_students = []  # List of (gpa, student_name)
+        self.accepted_students = BoundedRoster(quota)  # (gpa, student_name), sorted view by GPA
     
     def consider(self, student):
         if student.gpa < self.minGPA:
-            rejected_reason = f"minimum GPA {self.minGPA} not met"
+            rejected_reason = Reason("min_gpa", self.minGPA)
             return (student.gpa, student.name), rejected_reason  # Student does not meet GPA requirement
-        self.accepted_students.append((student.gpa, student.name))
-        self.accepted_students.sort(reverse=True, key=lambda x: x[0])  # Sort by GPA
-        if len(self.accepted_students) > self.quota:
-            rejected_reason = f"maximum quota reached. Accepted students: {[(name, gpa) for gpa, name in self.accepted_students[:-1]]}"
-            return self.accepted_students.pop(), rejected_reason  # Remove lowest-ranked student
+        removed_student = self.accepted_students.push(student.gpa, student.name)
+        if removed_student is not None:
+            cutoff = self.accepted_students.cutoff()
+            rejected_reason = Reason("quota", self.quota, cutoff[0] if cutoff else None, self.accepted_students.snapshot())
+            return removed_student, rejected_reason  # Lowest-ranked student removed
         return None, None  # No student removed
 
-def deferred_acceptance(students, schools):
+def load_students(students_df, lang_code):
+    # Build Student objects from the student file, one row per student with Choice1..N columns
+    students = {}
+    for _, row in students_df.iterrows():
+        if lang_code == "en":
+            preferences = [row[f"Choice{i}"] for i in range(1, len(row) - 1) if pd.notna(row[f"Choice{i}"])]
+            students[row["StudentName"]] = Student(row["StudentName"], row["GPA"], preferences)
+        elif lang_code == "zh":
+            preferences = [row[f"选择{i}"] for i in range(1, len(row) - 1) if pd.notna(row[f"选择{i}"])]
+            students[row["姓名"]] = Student(row["姓名"], row["GPA"], preferences)
+    return students
+
+
+def load_schools(schools_df, lang_code):
+    # Build School objects from the school quota file
+    if lang_code == "en":
+        return {row["SchoolName"]: School(row["SchoolName"], int(row["Quota"]), row["minGPA"]) for _, row in schools_df.iterrows()}
+    elif lang_code == "zh":
+        return {row["学校名称"]: School(row["学校名称"], int(row["名额"]), row["最低绩点"]) for _, row in schools_df.iterrows()}
+
+
+def deferred_acceptance(students, schools, trace_level="full", trace_path=None, on_progress=None, progress_every=10000):
+    # trace_level: "off" for bulk runs, "summary" for the final event of each student, "full" for every event
+    # trace_path: optional file the "full" trace is streamed to in chunks; the trace returned is then a
+    # utils.sep_trace.SpilledTrace instead of a DataFrame
+    # on_progress: optional callback receiving a utils.sep_trace.Progress every progress_every steps and at the
+    # end, e.g. for a progress bar in a page or progress lines in batch.py
     unmatched_students = list(students.values())
 
-    # Create a DataFrame to record the matching process
-    columns = ['Student Name', 'GPA', 'Action', 'Choice Number', 'School Name', 'Reason']
-    matching_process_df = pd.DataFrame(columns=columns)
+    # Record the matching process in a columnar buffer
+    trace = TraceRecorder(TRACE_COLUMNS, trace_level, spill_path=trace_path)
+    if trace.enabled:  # quota rejections in the trace list the roster of their time, rebuilt from the history
+        for school in schools.values():
+            school.accepted_students.keep_history()
 
-    with st.expander("See detailed matching process"):
-        with st.container(height=300, border=False):
-            # st.write("Deferred Acceptance Algorithm:")
-            st.divider()
+    total = sum(len(student.preferences) for student in students.values()) + len(students)
+    steps = 0
+    while len(unmatched_students)>0:
+        if on_progress is not None and steps % progress_every == 0:
+            on_progress(Progress(steps, total))
+        steps += 1
+        student = unmatched_students.pop(0)
+        school_name = student.propose()
+        if school_name is not None:
+            # Record the proposal action
+            trace.record(student.name, student.gpa, 'proposed to', student.current_proposal, school_name, None)
             
-            while len(unmatched_students)>0:
-                student = unmatched_students.pop(0)
-                school_name = student.propose()
-                if school_name is not None:
-                    # Record the proposal action
-                    new_row = {
-                        'Student Name': student.name,
-                        'GPA': student.gpa,
-                        'Action': 'proposed to',
-                        'Choice Number': student.current_proposal,
-                        'School Name': school_name,
-                        'Reason': None
-                    }
-                    matching_process_df = pd.concat([matching_process_df, pd.DataFrame([new_row])], ignore_index=True)
-                    st.write(f"{student.name} propose to Choice {student.current_proposal} -- {school_name}")
-                    
-                    removed_student, rejected_reason = schools[school_name].consider(student)
-                    if removed_student:
-                        # Record the rejection action     
-                        new_row = {
-                            'Student Name': removed_student[1],
-                            'GPA': removed_student[0],
-                            'Action': 'rejected by',
-                            'Choice Number': students[removed_student[1]].preferences.index(school_name) + 1,
-                            'School Name': school_name,
-                            'Reason': rejected_reason
-                        }
-                        matching_process_df = pd.concat([matching_process_df, pd.DataFrame([new_row])], ignore_index=True)
-                        st.write(f"{removed_student[1]} (GPA:{removed_student[0]}) is rejected by {school_name} because {rejected_reason}")
-                        unmatched_students.append(students[removed_student[1]])
+            if school_name not in schools:
+                # a choice missing from the school file rejects the student (utils/sep_validation.py warns about it)
+                trace.record(student.name, student.gpa, 'rejected by', student.current_proposal, school_name,
+                             reason=UNKNOWN_SCHOOL, program=school_name)
+                unmatched_students.append(student)
+                continue
+
+            removed_student, rejected_reason = schools[school_name].consider(student)
+            if removed_student:
+                # Record the rejection action     
+                if trace.enabled:
+                    choice = students[removed_student[1]].preferences.index(school_name) + 1
+                    trace.record(removed_student[1], removed_student[0], 'rejected by', choice, school_name,
+                                 reason=rejected_reason, program=school_name)
+                unmatched_students.append(students[removed_student[1]])
     
+    if on_progress is not None:
+        on_progress(Progress(steps, total, done=True))
+
     student_assignments = {s.name: None for s in students.values()}
     school_enrollments = {school.name: [] for school in schools.values()}
     
@@ -85,4 +120,4 @@ def deferred_acceptance(students, schools):
             student_assignments[student_name] = school.name
             school_enrollments[school.name].append(student_name)
     
-    return student_assignments, school_enrollments, matching_process_df
\ No newline at end of file
+    return student_assignments, school_enrollments, trace.finish()
\ No newline at end of file
@@ -0,0 +1,113 @@
+# This module checks an SEP assignment (for example one edited by hand after deferred_acceptance) against
+# the rules of utils/sep_nus.py Program.consider:
+#   - every assigned student meets the program requirements for one of their choices, and
+#   - no program holds more students than its quota, and no school / semester cap (utils/sep_capacity.py)
+#     holds more than its seats, and
+#   - there is no blocking pair: a student and a program they rank above their assignment (and are
+#     eligible for) that holds someone it ranks lower (by total score, or by the program's priority key,
+#     utils/sep_priority.py), or has a free seat under caps that have room or hold someone ranked lower.
+# The check runs over the candidate lists of the compiled instance (utils/sep_engine.py), comparing each
+# entry with the program's (or its full cap's) current cutoff, so it is linear in the total preference length.
+# deferred_acceptance itself can leave blocking pairs (see audit_assignment), so with the engine's own
+# result as a baseline the problems it already has are told apart from the ones the edits brought in.
+import numpy as np
+import pandas as pd
+from utils.sep_capacity import group_counts
+from utils.sep_engine import compile_instance
+
+AUDIT_COLUMNS = ['Issue', 'Student', 'Total Score', 'Assigned ProgramID', 'ProgramID', 'Program Cutoff', 'Enrolled', 'Quota',
+                 'From Edits']
+
+
+def audit_assignment(students, programs, student_assignments, baseline=None):
+    """
+    students, programs: the dicts of utils/sep_nus.py Student / Program objects.
+    student_assignments: student name -> ProgramID or None, as returned by deferred_acceptance.
+    baseline: optional assignment of the same form the edits started from, normally the unedited result of
+    deferred_acceptance.
+    Returns one row per problem with the columns in AUDIT_COLUMNS; Issue is one of "unknown program",
+    "not eligible", "over quota", "over cap" or "blocking pair"; an "over cap" row gives the name of the
+    school / semester group as ProgramID, its students as Enrolled and its cap as Quota. An empty DataFrame means the assignment is stable.
+    Program Cutoff is the lowest total score enrolled, or the lowest rank for a program with its own priority key.
+    From Edits is False for a problem the baseline has too (same issue, student and program), True otherwise.
+    Note that deferred_acceptance itself can leave blocking pairs: a student displaced from a program moves
+    on to their next school without trying the school's remaining programs.
+    """
+    instance = compile_instance(students, programs)
+    rows = _issues(instance, student_assignments)
+    known = set()
+    if baseline is not None:
+        known = {(row[0], row[1], row[4]) for row in _issues(instance, baseline)}
+    for row in rows:
+        row.append((row[0], row[1], row[4]) not in known)
+    return pd.DataFrame(rows, columns=AUDIT_COLUMNS).astype({'From Edits': bool})
+
+
+def _issues(instance, student_assignments):
+    """The rows of audit_assignment, without the From Edits column."""
+    program_index = {program_id: p for p, program_id in enumerate(instance.program_ids)}
+    assigned_ids = [student_assignments.get(name) for name in instance.student_names]
+    unknown = [program_id is not None and program_id not in program_index for program_id in assigned_ids]
+    assignment = np.array([program_index.get(program_id, -1) if program_id is not None else -1 for program_id in assigned_ids],
+                          dtype=np.int64)
+
+    # enrolled count and lowest ranking value per program: the total score, or the rank under the program's own key
+    score = instance.student_score
+    values = np.vstack([score, instance.priority_ranks])  # key x student
+    matched = assignment >= 0
+    enrolled = np.bincount(assignment[matched], minlength=instance.n_programs)
+    cutoff = np.full(instance.n_programs, np.inf)
+    np.minimum.at(cutoff, assignment[matched], values[instance.program_key[assignment[matched]], np.flatnonzero(matched)])
+
+    # the same per school / semester cap: students under it and its lowest ranking value (programs sharing
+    # a cap share their key); full_group is the lowest full cap above every program, -1 if none
+    group_parent, group_capacity = instance.group_parent, instance.group_capacity
+    enrolled_groups = group_counts(instance.program_group, group_parent, enrolled)
+    group_cutoff = np.full(len(group_capacity), np.inf)
+    capped = instance.program_group >= 0
+    np.minimum.at(group_cutoff, instance.program_group[capped], cutoff[capped])
+    for g in range(len(group_parent) - 1, -1, -1):  # children are numbered after their parent
+        if group_parent[g] >= 0:
+            group_cutoff[group_parent[g]] = min(group_cutoff[group_parent[g]], group_cutoff[g])
+    full_group = np.full(instance.n_programs, -1, dtype=np.int64)
+    for p, g in enumerate(instance.program_group.tolist()):
+        while g >= 0 and enrolled_groups[g] < group_capacity[g]:
+            g = group_parent[g]
+        full_group[p] = g
+
+    # every candidate entry, i.e. (student, program) in the order the student would try them
+    entries_per_student = np.diff(instance.cand_offsets[instance.pref_offsets])
+    cand_student = np.repeat(np.arange(instance.n_students), entries_per_student)
+    cand_program = instance.cand_programs.astype(np.int64)
+    position = np.arange(len(cand_program))
+
+    # rank of the assigned program in each student's list (first occurrence), len(list) when unmatched
+    own = cand_program == assignment[cand_student]
+    assigned_position = np.full(instance.n_students, len(cand_program))
+    np.minimum.at(assigned_position, cand_student[own], position[own])
+    not_eligible = matched & (assigned_position == len(cand_program))
+    assigned_position[not_eligible] = -1  # students placed against the rules are reported, not checked for blocking
+
+    # blocking: a program ranked above the assignment with a lower cutoff, or with a free seat under caps
+    # that have room or whose lowest-ranked student ranks below the student
+    ahead = position < assigned_position[cand_student]
+    value = values[instance.program_key[cand_program], cand_student]
+    free_seat = enrolled[cand_program] < instance.program_quota[cand_program]
+    cap_full = full_group[cand_program]
+    beats_cap = np.append(group_cutoff, np.inf)[cap_full] < value  # index -1 (no full cap) reads the extra inf
+    blocking = ahead & np.where(free_seat, (cap_full < 0) | beats_cap, value > cutoff[cand_program])
+    pairs = pd.DataFrame({'student': cand_student[blocking], 'program': cand_program[blocking]}).drop_duplicates()
+
+    rows = []
+    names, ids = instance.student_names, instance.program_ids
+    for issue, flagged in (('unknown program', unknown), ('not eligible', not_eligible)):
+        for s in np.flatnonzero(flagged):
+            rows.append([issue, names[s], score[s], assigned_ids[s], assigned_ids[s], np.nan, np.nan, np.nan])
+    for p in np.flatnonzero(enrolled > instance.program_quota):
+        rows.append(['over quota', None, np.nan, None, ids[p], cutoff[p], enrolled[p], instance.program_quota[p]])
+    for g in np.flatnonzero(enrolled_groups > group_capacity):
+        rows.append(['over cap', None, np.nan, None, instance.group_names[g], group_cutoff[g], enrolled_groups[g], group_capacity[g]])
+    for s, p in zip(pairs['student'], pairs['program']):
+        rows.append(['blocking pair', names[s], score[s], assigned_ids[s], ids[p],
+                     cutoff[p] if enrolled[p] else np.nan, enrolled[p], instance.program_quota[p]])
+    return rows
@@ -0,0 +1,218 @@
+# Benchmark of the SEP matching engines on synthetic instances (utils/sep_synthetic.py).
+# For every cohort size, engine and trace level it records the wall time of the matching call, its peak
+# Python memory and the number of proposals per second. Compare a run with a saved one to catch regressions:
+#
+#   python -m utils.sep_benchmark --students 2000 20000 --out benchmark.csv
+#   python -m utils.sep_benchmark --students 2000 20000 --baseline benchmark.csv
+#
+# With --incremental it instead times utils.sep_incremental.IncrementalMatcher.update() on single-row edits
+# against a full run of the edited input, e.g. python -m utils.sep_benchmark --students 30000 --incremental
+import argparse
+import copy
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from utils.sep_synthetic import generate_nus, generate_sep
+from utils.sep_trace import TRACE_LEVELS
+
+ENGINES = ['sep', 'sep_nus', 'sep_engine', 'sep_components']  # utils/sep.py, utils/sep_nus.py, utils/sep_engine.py and
+# utils/sep_components.py (the last two without trace)
+BENCHMARK_COLUMNS = ['Engine', 'Trace Level', 'Students', 'Preference Rows', 'Proposals',
+                     'Wall Time (s)', 'Peak Memory (MB)', 'Proposals/s']
+EDITS = ['total score', 'quota +1', 'quota -1']  # single-row edits timed by run_incremental_benchmark
+INCREMENTAL_COLUMNS = ['Edit', 'Students', 'Edits', 'Full Run (s)', 'Update Median (s)', 'Update Mean (s)',
+                       'Replayed Share', 'Speedup']
+
+
+def _run_sep(data, trace_level):
+    from utils.sep import load_students, load_schools, deferred_acceptance
+    students, schools = load_students(data[0], "en"), load_schools(data[1], "en")
+    return lambda: deferred_acceptance(students, schools, trace_level), lambda: sum(s.current_proposal for s in students.values())
+
+
+def _run_sep_nus(data, trace_level):
+    from utils.sep_nus import load_students, load_programs, deferred_acceptance
+    students, programs = load_students(data[0]), load_programs(data[1])
+    return lambda: deferred_acceptance(students, programs, trace_level), lambda: sum(s.current_proposal for s in students.values())
+
+
+def _run_sep_engine(data, trace_level):
+    from utils.sep_nus import load_students, load_programs
+    from utils.sep_engine import compile_instance, MatchingState, advance, matching_result, to_assignment_dicts
+    students, programs = load_students(data[0]), load_programs(data[1])
+    run = {}
+
+    def match():
+        # same steps as deferred_acceptance_fast, keeping the state to count proposals
+        instance = run['instance'] = compile_instance(students, programs)
+        state = run['state'] = advance(instance, MatchingState(instance))
+        return to_assignment_dicts(instance, *matching_result(instance, state))
+
+    def proposals():
+        return int((np.array(run['state'].next_pref) - run['instance'].pref_offsets[:-1]).sum())
+    return match, proposals
+
+
+def _run_sep_components(data, trace_level):
+    from utils.sep_nus import load_students, load_programs
+    from utils.sep_engine import compile_instance, to_assignment_dicts
+    from utils.sep_components import run_decomposed
+    students, programs = load_students(data[0]), load_programs(data[1])
+    run = {}
+
+    def match():
+        instance = run['instance'] = compile_instance(students, programs)
+        return to_assignment_dicts(instance, *run_decomposed(instance))
+
+    def proposals():
+        return np.nan  # the submarket states stay in the workers
+    return match, proposals
+
+
+RUNNERS = {'sep': _run_sep, 'sep_nus': _run_sep_nus, 'sep_engine': _run_sep_engine, 'sep_components': _run_sep_components}
+
+
+def measure(engine, data, trace_level, repeat=1):
+    """
+    Best wall time of `repeat` matching calls, then one more call under tracemalloc for the peak memory.
+    Loading the input is not measured.
+    """
+    wall_time = np.inf
+    for _ in range(repeat):
+        match, proposals = RUNNERS[engine](data, trace_level)
+        start = time.perf_counter()
+        match()
+        wall_time = min(wall_time, time.perf_counter() - start)
+    n_proposals = proposals()
+
+    match, _ = RUNNERS[engine](data, trace_level)
+    tracemalloc.start()
+    match()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n_proposals, wall_time, peak / 2**20
+
+
+def run_benchmark(sizes, engines=ENGINES, trace_levels=TRACE_LEVELS, n_schools=200, seed=0, repeat=1, **generator_options):
+    """
+    One row per (cohort size, engine, trace level) with the columns in BENCHMARK_COLUMNS.
+    generator_options are passed to utils.sep_synthetic (skew, tightness, eligibility, prefs_per_student).
+    """
+    rows = []
+    for n_students in sizes:
+        layouts = {}
+        if 'sep' in engines:
+            layouts['sep'] = generate_sep(n_students, n_schools, seed=seed, **generator_options)
+        if {'sep_nus', 'sep_engine', 'sep_components'} & set(engines):
+            layouts['sep_nus'] = layouts['sep_engine'] = layouts['sep_components'] = generate_nus(n_students, n_schools, seed=seed, **generator_options)
+        for engine in engines:
+            data = layouts[engine]
+            preference_rows = len(data[0]) if engine != 'sep' else int(data[0].filter(like='Choice').notna().sum().sum())
+            for trace_level in (trace_levels if engine in ('sep', 'sep_nus') else ['off']):
+                n_proposals, wall_time, peak = measure(engine, data, trace_level, repeat)
+                rows.append([engine, trace_level, n_students, preference_rows, n_proposals,
+                             wall_time, peak, n_proposals / wall_time if wall_time else np.nan])
+                print(f"{engine:<11} {trace_level:<8} {n_students:>9} students  {wall_time:8.3f}s  {peak:8.1f} MB", flush=True)
+    return pd.DataFrame(rows, columns=BENCHMARK_COLUMNS)
+
+
+def _edit(matcher, kind, rng):
+    """One random single-row edit of the input of matcher, as the students / programs arguments of update()."""
+    if kind == 'total score':
+        name = list(matcher.students)[rng.integers(len(matcher.students))]
+        student = copy.copy(matcher.students[name])
+        # a correction up or down, small against the spread of the cohort's scores
+        student.total_score += rng.choice([-1, 1]) * rng.uniform(0.05, 0.5) * matcher.instance.student_score.std()
+        return {name: student}, {}
+    program_id = list(matcher.programs)[rng.integers(len(matcher.programs))]
+    program = copy.copy(matcher.programs[program_id])
+    program.quota = max(0, program.quota + (1 if kind == 'quota +1' else -1))
+    return {}, {program_id: program}
+
+
+def run_incremental_benchmark(n_students, n_schools=300, n_edits=20, seed=0, **generator_options):
+    """
+    One row per kind of edit in EDITS with the columns in INCREMENTAL_COLUMNS: the wall time of update() against
+    compile_instance() plus a full run, and the mean share of the steps of the run that an update replayed.
+    The edits accumulate, and every update is checked against the full run of the same input.
+    """
+    from utils.sep_nus import load_students, load_programs
+    from utils.sep_engine import deferred_acceptance_fast
+    from utils.sep_incremental import IncrementalMatcher
+    students_df, schools_df = generate_nus(n_students, n_schools, seed=seed, **generator_options)
+    matcher = IncrementalMatcher(load_students(students_df), load_programs(schools_df))
+    rng = np.random.default_rng(seed)
+    rows = []
+    for kind in EDITS:
+        full_times, update_times, replayed = [], [], []
+        for _ in range(n_edits):
+            students, programs = _edit(matcher, kind, rng)
+            start = time.perf_counter()
+            result = matcher.update(students, programs)
+            update_times.append(time.perf_counter() - start)
+            replayed.append(1 - matcher.replayed_from / len(matcher.log) if matcher.replayed_from is not None else 0.0)
+            start = time.perf_counter()
+            expected = deferred_acceptance_fast(matcher.students, matcher.programs)
+            full_times.append(time.perf_counter() - start)
+            if result != expected:
+                raise AssertionError(f"update() after a {kind} edit differs from a full run")
+        full_time, update_time = float(np.median(full_times)), float(np.median(update_times))
+        rows.append([kind, n_students, n_edits, full_time, update_time, float(np.mean(update_times)),
+                     float(np.mean(replayed)), full_time / update_time])
+        print(f"{kind:<12} full run {full_time:7.3f}s  update {update_time:7.3f}s  ({full_time / update_time:.1f}x)", flush=True)
+    return pd.DataFrame(rows, columns=INCREMENTAL_COLUMNS)
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Join a run with a saved one; "Slower" marks rows whose wall time grew by more than tolerance."""
+    keys = ['Engine', 'Trace Level', 'Students']
+    merged = results.merge(baseline[keys + ['Wall Time (s)', 'Peak Memory (MB)']], on=keys, how='left', suffixes=('', ' (baseline)'))
+    merged['Time Ratio'] = merged['Wall Time (s)'] / merged['Wall Time (s) (baseline)']
+    merged['Slower'] = merged['Time Ratio'] > 1 + tolerance
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SEP matching engines on synthetic instances.")
+    parser.add_argument("--students", type=int, nargs="+", default=[1000, 10000], help="cohort sizes")
+    parser.add_argument("--schools", type=int, default=200)
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=ENGINES)
+    parser.add_argument("--trace", nargs="+", choices=TRACE_LEVELS, default=TRACE_LEVELS)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--tightness", type=float, default=1.5)
+    parser.add_argument("--eligibility", type=float, default=0.8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="keep the best of this many timed runs")
+    parser.add_argument("--out", help="save the results as CSV")
+    parser.add_argument("--baseline", help="CSV of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown against the baseline")
+    parser.add_argument("--incremental", action="store_true",
+                        help="time IncrementalMatcher.update() on single-row edits instead of the engines")
+    parser.add_argument("--edits", type=int, default=20, help="with --incremental: edits of every kind")
+    args = parser.parse_args()
+
+    if args.incremental:
+        results = pd.concat([run_incremental_benchmark(n_students, args.schools, args.edits, args.seed, skew=args.skew,
+                                                       tightness=args.tightness, eligibility=args.eligibility)
+                             for n_students in args.students])
+        if args.out:
+            results.to_csv(args.out, index=False)
+        print(results.to_string(index=False))
+        return
+
+    results = run_benchmark(args.students, args.engines, args.trace, args.schools, args.seed, args.repeat,
+                            skew=args.skew, tightness=args.tightness, eligibility=args.eligibility)
+    if args.out:
+        results.to_csv(args.out, index=False)
+    if args.baseline:
+        results = compare(results, pd.read_csv(args.baseline), args.tolerance)
+    print(results.to_string(index=False))
+    if args.baseline and results['Slower'].any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
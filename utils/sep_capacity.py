@@ -0,0 +1,125 @@
+# This module contains the nested seat caps above the NUS exchange programs: a partner school can cap the
+# total of all its programs ("School Quota" column of the school file) and the total of its programs in
+# one semester ("Semester Quota"), on top of the quota of every program. Programs without a semester only
+# count towards the school cap. The caps form a tree: program -> school-semester group -> school group.
+#
+# CapacityTree keeps a seat count and a lazy min-heap of the admitted students for every group, so the
+# engines (utils/sep_nus.py, utils/sep_engine.py) find a full group and its lowest-ranked student in
+# O(depth log n) instead of rescanning the rosters of the sibling programs. That student is also the
+# lowest-ranked of its own program, i.e. the top of its program's roster, so the rosters stay plain heaps.
+import heapq
+
+import numpy as np
+import pandas as pd
+
+
+def _cap(values):
+    """First given cap among the programs of a group, or None (utils/sep_validation.py flags conflicting ones)."""
+    for value in values:
+        if not pd.isna(value):
+            return int(value)
+    return None
+
+
+def capacity_groups(programs):
+    """
+    Encode the school and semester caps of the Program objects of utils/sep_nus.py, in program order.
+    Returns (program_group, group_parent, group_capacity, group_names): the lowest group above every
+    program (-1 if none), the parent of every group (-1 for a school) and its cap. A school group is
+    numbered before its semester groups, so parents come first.
+    """
+    by_school = {}
+    for p, program in enumerate(programs.values()):
+        by_school.setdefault(program.schoolName, []).append(p)
+    program_list = list(programs.values())
+
+    program_group = np.full(len(program_list), -1, dtype=np.int32)
+    group_parent, group_capacity, group_names = [], [], []
+    for school_name, members in by_school.items():
+        school_cap = _cap(getattr(program_list[p], 'school_quota', None) for p in members)
+        school_group = -1
+        if school_cap is not None:
+            school_group = len(group_names)
+            group_parent.append(-1)
+            group_capacity.append(school_cap)
+            group_names.append(school_name)
+            program_group[members] = school_group
+        by_semester = {}
+        for p in members:
+            if not pd.isna(program_list[p].sem):
+                by_semester.setdefault(program_list[p].sem, []).append(p)
+        for sem, sem_members in by_semester.items():
+            sem_cap = _cap(getattr(program_list[p], 'semester_quota', None) for p in sem_members)
+            if sem_cap is None:
+                continue
+            program_group[sem_members] = len(group_names)
+            group_parent.append(school_group)
+            group_capacity.append(sem_cap)
+            group_names.append(f"{school_name} {sem}")
+    return (program_group, np.array(group_parent, dtype=np.int32), np.array(group_capacity, dtype=np.int32),
+            group_names)
+
+
+def group_counts(program_group, group_parent, program_counts):
+    """Students under every group, given the number of students of every program."""
+    placed = program_group >= 0
+    counts = np.bincount(program_group[placed], weights=np.asarray(program_counts)[placed],
+                         minlength=len(group_parent)).astype(np.int64)
+    for g in range(len(group_parent) - 1, -1, -1):  # children are numbered after their parent
+        if group_parent[g] >= 0:
+            counts[group_parent[g]] += counts[g]
+    return counts
+
+
+class CapacityTree:
+    """
+    Seat counts and admitted students of the cap groups while a matching runs.
+    Students are entered as (score, -arrival) with a key (name or id) and the program holding them;
+    among equal scores the earlier arrival ranks higher, as in the program rosters.
+    """
+    def __init__(self, program_group, group_parent, group_capacity):
+        self.program_group = np.asarray(program_group).tolist()
+        self.group_parent = np.asarray(group_parent).tolist()
+        self.group_capacity = np.asarray(group_capacity).tolist()
+        self.count = [0] * len(self.group_capacity)
+        self._heaps = [[] for _ in self.group_capacity]  # (score, -arrival, key, program), stale entries are skipped
+        self._held = {}  # key -> -arrival of the student's current seat
+
+    def path(self, p):
+        """Groups above program p, lowest first."""
+        g = self.program_group[p]
+        while g >= 0:
+            yield g
+            g = self.group_parent[g]
+
+    def full_group(self, p):
+        """The lowest group above program p without a seat left, or -1."""
+        for g in self.path(p):
+            if self.count[g] >= self.group_capacity[g]:
+                return g
+        return -1
+
+    def add(self, p, score, neg_arrival, key):
+        """Count a student admitted to program p (nothing to do for a program without caps above it)."""
+        if self.program_group[p] < 0:
+            return
+        entry = (score, neg_arrival, key, p)
+        for g in self.path(p):
+            heapq.heappush(self._heaps[g], entry)
+            self.count[g] += 1
+        self._held[key] = neg_arrival
+
+    def remove(self, p, key):
+        """Free the seat of a student who left program p (its heap entries go stale)."""
+        if self.program_group[p] < 0:
+            return
+        for g in self.path(p):
+            self.count[g] -= 1
+        del self._held[key]
+
+    def worst(self, g):
+        """The lowest-ranked (score, -arrival, key, program) admitted under group g, or None if it is empty."""
+        heap = self._heaps[g]
+        while heap and self._held.get(heap[0][2]) != heap[0][1]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
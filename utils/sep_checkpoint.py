@@ -0,0 +1,103 @@
+# This module saves the state of a running SEP matching (utils/sep_engine.py MatchingState) to a
+# compact .npz checkpoint and resumes from it, so a long run that dies can continue where it stopped.
+# The checkpoint holds what Student.current_proposal and Program.accepted_students hold in the object
+# engine (the next preference entry of every student and the program rosters, as heaps), plus the queue,
+# the arrival counter, the step and optionally the proposal log. It also holds a fingerprint of the
+# compiled instance, and a checkpoint from other input files is refused.
+import hashlib
+import os
+
+import numpy as np
+from utils.sep_engine import MatchingState, advance, compile_instance, matching_result, progress_reporter, to_assignment_dicts
+
+
+def instance_fingerprint(instance, priority=None):
+    """Hash of the parts of a CompiledInstance (and ranking key) that decide the course of a run."""
+    digest = hashlib.sha1()
+    for array in (instance.pref_offsets, instance.cand_offsets, instance.cand_programs, instance.program_quota,
+                  instance.program_group, instance.group_parent, instance.group_capacity,
+                  instance.program_key, instance.priority_ranks,
+                  instance.student_score if priority is None else np.asarray(priority)):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def save_checkpoint(path, state, fingerprint, log=None, compress=False):
+    """
+    Write state to path (a .npz file), replacing the previous checkpoint only once the new one is complete.
+    compress: zip-compress the arrays, about half the size but several times slower to write.
+    """
+    lengths = [len(roster) for roster in state.rosters]
+    entries = [entry for roster in state.rosters for entry in roster]
+    score, neg_arrival, student = zip(*entries) if entries else ((), (), ())
+    arrays = {
+        'fingerprint': np.array(fingerprint),
+        'counters': np.array([state.arrival, state.step], dtype=np.int64),
+        'next_pref': np.array(state.next_pref, dtype=np.int32),
+        'queue': np.array(state.queue, dtype=np.int32),
+        'roster_lengths': np.array(lengths, dtype=np.int32),
+        'roster_score': np.array(score, dtype=np.float64),
+        'roster_arrival': np.array(neg_arrival, dtype=np.int64),
+        'roster_student': np.array(student, dtype=np.int32),
+    }
+    if log is not None:
+        arrays['log'] = np.array(log, dtype=np.int32)
+    temporary = f"{path}.tmp.npz"
+    (np.savez_compressed if compress else np.savez)(temporary, **arrays)
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path, instance, fingerprint):
+    """Rebuild (state, log) from a checkpoint; log is None when none was saved. Raises ValueError for other inputs."""
+    with np.load(path) as data:
+        if str(data['fingerprint']) != fingerprint:
+            raise ValueError(f"{path} was saved for other input files")
+        state = MatchingState(instance)
+        state.arrival, state.step = data['counters'].tolist()
+        state.next_pref = data['next_pref'].tolist()
+        state.queue.clear()
+        state.queue.extend(data['queue'].tolist())
+        entries = list(zip(data['roster_score'].tolist(), data['roster_arrival'].tolist(), data['roster_student'].tolist()))
+        ends = np.cumsum(data['roster_lengths']).tolist()
+        state.rosters = [entries[start:end] for start, end in zip([0] + ends[:-1], ends)]  # heap order is kept
+        log = data['log'].tolist() if 'log' in data else None
+    return state, log
+
+
+def run_with_checkpoints(instance, path, checkpoint_every=100000, priority=None, keep_log=False, on_progress=None):
+    """
+    Run deferred acceptance on a CompiledInstance, saving a checkpoint every checkpoint_every steps.
+    If path already holds a checkpoint of the same instance, the run resumes from it.
+    Returns the finished MatchingState and the proposal log (None unless keep_log); the last checkpoint
+    is the finished state, so calling again returns at once.
+    on_progress: optional callback receiving a utils.sep_trace.Progress at every checkpoint and at the end.
+    """
+    fingerprint = instance_fingerprint(instance, priority)
+    if os.path.exists(path):
+        state, log = load_checkpoint(path, instance, fingerprint)
+        if keep_log and log is None:
+            raise ValueError(f"{path} was saved without the proposal log")
+    else:
+        state, log = MatchingState(instance), ([] if keep_log else None)
+
+    report = progress_reporter(instance, on_progress) if on_progress is not None else None
+
+    def checkpoint(live_state):
+        if live_state.step > start_step:  # the state at the start is already on disk (or trivial)
+            save_checkpoint(path, live_state, fingerprint, log)
+        if report is not None:
+            report(live_state)
+
+    start_step = state.step
+    advance(instance, state, log, checkpoint_every, checkpoint, priority)
+    save_checkpoint(path, state, fingerprint, log)
+    if report is not None:
+        report(state, done=True)
+    return state, log
+
+
+def deferred_acceptance_resumable(students, programs, path, checkpoint_every=100000):
+    """utils.sep_engine.deferred_acceptance_fast with checkpoints in path; resumes a run that stopped."""
+    instance = compile_instance(students, programs)
+    state, _ = run_with_checkpoints(instance, path, checkpoint_every)
+    return to_assignment_dicts(instance, *matching_result(instance, state))
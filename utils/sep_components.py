@@ -0,0 +1,167 @@
+# This module splits an SEP market into independent submarkets and matches them in a process pool.
+# Students and programs are linked when a program is on one of the student's candidate lists
+# (utils/sep_engine.py build_candidates); students in different connected components never compete.
+#
+# The split does not change the result. In the global FIFO queue, the students of one component keep
+# their relative order whatever the other components do, and arrival numbers only order proposals to
+# the same program. So every component sees the same sequence of proposals alone as in the full run.
+# Components are packed into a few bundles of similar size, and each bundle is matched as one submarket.
+# Worker processes memory-map one stored copy of the instance (utils/sep_store.py) and cut their
+# submarkets from it, so only the student and program ids of each bundle are sent to them.
+import heapq
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from utils.sep_engine import compile_instance, run_deferred_acceptance, to_assignment_dicts
+from utils.sep_store import load_instance, shared_instance
+
+_instance = None  # memory-mapped instance of the current worker process
+
+
+def _init_worker(directory):
+    global _instance
+    _instance = load_instance(directory)
+
+
+def _ranges(starts, lengths):
+    """Concatenation of range(start, start + length) for every pair, as one array."""
+    return np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths) + np.repeat(starts, lengths)
+
+
+def market_components(instance):
+    """
+    Connected components of the student-program candidate graph.
+    Returns (student_component, program_component, n_components); students without any candidate
+    program have component -1, and so do programs no student can propose to.
+    """
+    entries_per_student = np.diff(instance.cand_offsets[instance.pref_offsets])
+    cand_student = np.repeat(np.arange(instance.n_students), entries_per_student)
+    cand_program = instance.cand_programs.astype(np.int64)
+    has_candidates = entries_per_student > 0
+
+    # link every candidate program of a student to the student's first one, then merge programs by
+    # hooking the larger root under the smaller and pointer jumping until every edge is inside a tree
+    first = np.full(instance.n_students, -1, dtype=np.int64)
+    first[has_candidates] = cand_program[instance.cand_offsets[instance.pref_offsets[:-1]][has_candidates]]
+    a, b = first[cand_student], cand_program
+    parent = np.arange(instance.n_programs)
+    while True:
+        root_a, root_b = parent[a], parent[b]
+        apart = root_a != root_b
+        if not apart.any():
+            break
+        np.minimum.at(parent, np.maximum(root_a, root_b)[apart], np.minimum(root_a, root_b)[apart])
+        while True:
+            jumped = parent[parent]
+            if (jumped == parent).all():
+                break
+            parent = jumped
+
+    used = np.zeros(instance.n_programs, dtype=bool)
+    used[cand_program] = True
+    roots, labels = np.unique(parent[used], return_inverse=True)
+    program_component = np.full(instance.n_programs, -1, dtype=np.int64)
+    program_component[used] = labels
+    student_component = np.where(has_candidates, program_component[np.maximum(first, 0)], -1)
+    return student_component, program_component, len(roots)
+
+
+class Submarket:
+    """
+    The students and programs of some components of a CompiledInstance, renumbered from 0, with the
+    fields advance() and matching_result() read; students and programs keep their relative order.
+    """
+    def __init__(self, instance, students, programs):
+        local = np.full(instance.n_programs, -1, dtype=np.int32)
+        local[programs] = np.arange(len(programs), dtype=np.int32)
+        self.student_names = [instance.student_names[s] for s in students.tolist()]
+        self.student_score = instance.student_score[students]
+        self.program_ids = [instance.program_ids[p] for p in programs.tolist()]
+        self.program_quota = instance.program_quota[programs]
+        self.program_key = instance.program_key[programs]
+        self.priority_ranks = instance.priority_ranks[:, students]
+        self.priority_keys = instance.priority_keys
+        # run_decomposed() only splits instances without school / semester caps
+        self.program_group = np.full(len(programs), -1, dtype=np.int32)
+        self.group_parent = self.group_capacity = np.zeros(0, dtype=np.int32)
+
+        pref_length = instance.pref_offsets[students + 1] - instance.pref_offsets[students]
+        self.pref_offsets = np.zeros(len(students) + 1, dtype=np.int32)
+        np.cumsum(pref_length, out=self.pref_offsets[1:])
+        entries = _ranges(instance.pref_offsets[students], pref_length)
+        self.pref_school = instance.pref_school[entries]
+        self.pref_sem = instance.pref_sem[entries]
+
+        cand_length = instance.cand_offsets[entries + 1] - instance.cand_offsets[entries]
+        self.cand_offsets = np.zeros(len(entries) + 1, dtype=np.int32)
+        np.cumsum(cand_length, out=self.cand_offsets[1:])
+        self.cand_programs = local[instance.cand_programs[_ranges(instance.cand_offsets[entries], cand_length)]]
+
+    @property
+    def n_students(self):
+        return len(self.student_names)
+
+    @property
+    def n_programs(self):
+        return len(self.program_ids)
+
+
+def _bundles(sizes, n_bundles):
+    """Bundle number of every component, packing the largest first into the lightest bundle."""
+    bundle = np.empty(len(sizes), dtype=np.int64)
+    loads = [(0, b) for b in range(n_bundles)]
+    for c in np.argsort(-sizes, kind='stable').tolist():
+        load, b = heapq.heappop(loads)
+        bundle[c] = b
+        heapq.heappush(loads, (load + int(sizes[c]), b))
+    return bundle
+
+
+def _match_submarket(students, programs, priority):
+    return run_deferred_acceptance(Submarket(_instance, students, programs), priority)
+
+
+def run_decomposed(instance, max_workers=None, priority=None):
+    """
+    Same result as run_deferred_acceptance(instance, priority), computed per submarket.
+    max_workers: processes to use (default: all cores); 1 matches the bundles one after another in-process.
+    """
+    if len(instance.group_capacity):
+        # a school / semester cap links programs that no student links, so the market is matched whole
+        return run_deferred_acceptance(instance, priority)
+    max_workers = max_workers or os.cpu_count()
+    student_component, program_component, n_components = market_components(instance)
+    has_candidates = student_component >= 0
+    entries = np.diff(instance.cand_offsets[instance.pref_offsets])
+    sizes = np.bincount(student_component[has_candidates], weights=entries[has_candidates], minlength=n_components)
+    n_bundles = min(n_components, 1 if max_workers == 1 else 4 * max_workers)
+    bundle_of = _bundles(sizes, n_bundles)
+    student_bundle = np.where(has_candidates, bundle_of[np.maximum(student_component, 0)], -1)
+    program_bundle = np.where(program_component >= 0, bundle_of[np.maximum(program_component, 0)], -1)
+
+    members = [(np.flatnonzero(student_bundle == b), np.flatnonzero(program_bundle == b)) for b in range(n_bundles)]
+    priorities = [None if priority is None else np.asarray(priority)[students] for students, _ in members]
+    if max_workers == 1 or len(members) <= 1:
+        results = [run_deferred_acceptance(Submarket(instance, students, programs), member_priority)
+                   for (students, programs), member_priority in zip(members, priorities)]
+    else:
+        with shared_instance(instance) as directory, \
+                ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(directory,)) as executor:
+            student_ids, program_ids = zip(*members)
+            results = list(executor.map(_match_submarket, student_ids, program_ids, priorities))
+
+    assignment = np.full(instance.n_students, -1, dtype=np.int32)
+    roster_ids = [[] for _ in range(instance.n_programs)]
+    for (students, programs), (local_assignment, local_rosters) in zip(members, results):
+        placed = local_assignment >= 0
+        assignment[students[placed]] = programs[local_assignment[placed]]
+        for p, ids in zip(programs.tolist(), local_rosters):
+            roster_ids[p] = students[ids].tolist()
+    return assignment, roster_ids
+
+
+def deferred_acceptance_decomposed(students, programs, max_workers=None):
+    """Drop-in replacement for utils.sep_engine.deferred_acceptance_fast that matches submarkets in parallel."""
+    instance = compile_instance(students, programs)
+    return to_assignment_dicts(instance, *run_decomposed(instance, max_workers))
@@ -0,0 +1,114 @@
+# This module reports the final cutoff of every SEP program and answers quota sensitivity questions
+# ("who would one more seat admit?") from the matching run that already happened: the deferred
+# acceptance run (utils/sep_nus.py) collects, for every program, the students it turned away for quota or
+# a school / semester cap; sorted best first, they are the queue extra seats would admit, so a query is an
+# index lookup. The cutoffs are read from the final enrollments, after any waitlist rounds.
+#
+# Programs rank by total score or by their own priority key (utils/sep_priority.py); cutoffs are given as
+# the values of the key, e.g. "4.3, 3" for a program ranking by "GPA, Seniority".
+#
+# The answers are first-order: a student admitted through an extra seat frees their current seat, which
+# could move others in turn; that cascade is not followed. Every student turned away by a program
+# ranked it above the place they ended in, so they would all take an extra seat.
+import bisect
+
+import numpy as np
+import pandas as pd
+from utils.sep_engine import MatchingState, advance, compile_instance, matching_result, to_assignment_dicts
+from utils.sep_priority import priority_values
+
+CUTOFF_COLUMNS = ['ProgramID', 'SchoolName', 'Quota', 'Enrolled', 'Priority', 'Cutoff', 'Rejected for Quota', 'Best Rejected']
+SENSITIVITY_COLUMNS = ['ProgramID', 'Extra Seats', 'Newly Admitted', 'New Cutoff']
+
+
+def _key_text(values):
+    """Readable key values of one student, e.g. "4.3, 3"; empty for a missing value."""
+    return ', '.join('' if np.isnan(value) else np.format_float_positional(value, trim='-') for value in values)
+
+
+class ProgramCutoffs:
+    """
+    Final cutoff of every program and the students it rejected for quota, best first under its priority key.
+    instance: the CompiledInstance of the run; program_enrollments: ProgramID -> enrolled student names, as
+    returned by deferred_acceptance or run_waitlist; rejections: ProgramID -> names of the students the
+    program turned away for quota, in the order it happened (deferred_acceptance rejections).
+    """
+    def __init__(self, instance, program_enrollments, rejections):
+        self.instance = instance
+        self.program_index = {program_id: p for p, program_id in enumerate(instance.program_ids)}
+        self.school = [instance.school_names[code] for code in instance.program_school.tolist()]
+        self.priority = [', '.join(instance.priority_keys[k]) for k in instance.program_key.tolist()]
+        student_index = {name: s for s, name in enumerate(instance.student_names)}
+        score = instance.student_score
+        # ranking value of every student per key (total score, or the rank under the key) and the key values
+        ranking = [score, *instance.priority_ranks]
+        values = [priority_values(instance, key) for key in instance.priority_keys]
+
+        self.roster_ids, self.rejected, self.rejected_values, self.cutoff = [], [], [], []
+        for program_id, k in zip(instance.program_ids, instance.program_key.tolist()):
+            ids = np.array([student_index[name] for name in program_enrollments.get(program_id, [])], dtype=np.int32)
+            self.roster_ids.append(ids)
+            # a student listing a school twice can be turned away twice, and a waitlist round can place a
+            # rejected student in the program after all; keep the others once, best first
+            enrolled = set(ids.tolist())
+            rejected = [s for s in dict.fromkeys(student_index[name] for name in rejections.get(program_id, []))
+                        if s not in enrolled]
+            rejected = np.array(rejected, dtype=np.int32)
+            rejected = rejected[np.argsort(-ranking[k][rejected], kind='stable')]
+            self.rejected.append(rejected)
+            self.rejected_values.append(values[k][rejected])
+            self.cutoff.append(values[k][ids[np.argmin(ranking[k][ids])]] if len(ids) else None)
+        self.rejected_score = [score[ids] for ids in self.rejected]
+
+    def table(self):
+        """One row per program with the columns in CUTOFF_COLUMNS; Cutoff is the lowest-ranked enrolled student's key."""
+        instance = self.instance
+        return pd.DataFrame({
+            'ProgramID': instance.program_ids,
+            'SchoolName': self.school,
+            'Quota': instance.program_quota,
+            'Enrolled': [len(ids) for ids in self.roster_ids],
+            'Priority': self.priority,
+            'Cutoff': [None if cutoff is None else _key_text(cutoff) for cutoff in self.cutoff],
+            'Rejected for Quota': [len(ids) for ids in self.rejected],
+            'Best Rejected': [_key_text(values[0]) if len(values) else None for values in self.rejected_values],
+        }, columns=CUTOFF_COLUMNS)
+
+    def next_admitted(self, program_id, extra_seats):
+        """The students (name and total score) that extra_seats more seats of a program would admit, best first."""
+        p = self.program_index[program_id]
+        ids = self.rejected[p][:extra_seats]
+        return pd.DataFrame({'Student': [self.instance.student_names[s] for s in ids.tolist()],
+                             'Total Score': self.rejected_score[p][:extra_seats]})
+
+    def seats_needed(self, program_id, value):
+        """
+        Extra seats a program needs to admit every student it rejected whose key is at least value: a total
+        score, or a tuple of values in the columns of the program's priority key.
+        """
+        values = self.rejected_values[self.program_index[program_id]]
+        ascending = [tuple(row) for row in np.nan_to_num(values, nan=-np.inf)[::-1]]
+        value = tuple(np.atleast_1d(np.asarray(value, dtype=np.float64)))
+        return len(ascending) - bisect.bisect_left(ascending, value)
+
+    def sensitivity(self, extra_seats=(1, 2, 5)):
+        """Rows with the columns in SENSITIVITY_COLUMNS: the cutoff of every program with a few more seats."""
+        rows = []
+        for p, program_id in enumerate(self.instance.program_ids):
+            values = self.rejected_values[p]
+            for extra in extra_seats:
+                admitted = min(extra, len(values))
+                cutoff = values[admitted - 1] if admitted else self.cutoff[p]
+                rows.append([program_id, extra, admitted, None if cutoff is None else _key_text(cutoff)])
+        return pd.DataFrame(rows, columns=SENSITIVITY_COLUMNS)
+
+
+def program_cutoffs(students, programs):
+    """Cutoff table of a new run of the array engine (utils/sep_engine.py), when no run result is at hand."""
+    instance = compile_instance(students, programs)
+    entries = [[] for _ in range(instance.n_programs)]
+    state = advance(instance, MatchingState(instance), rejections=entries)
+    _, program_enrollments = to_assignment_dicts(instance, *matching_result(instance, state))
+    rejections = {program_id: [instance.student_names[s] for _, _, s in sorted(program_entries, reverse=True)]
+                  for program_id, program_entries in zip(instance.program_ids, entries)}
+    return ProgramCutoffs(instance, program_enrollments, rejections).table()
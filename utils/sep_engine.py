@@ -0,0 +1,521 @@
+# This module contains an integer-encoded, array-backed version of the deferred acceptance
+# algorithm in utils/sep_nus.py.
+# compile_instance() maps students, schools, semesters and programs to integer ids once and stores
+# preferences, scores and quotas in NumPy arrays. deferred_acceptance_fast() then runs the matching on
+# those ids and returns the same student_assignments / program_enrollments dicts as
+# utils.sep_nus.deferred_acceptance.
+import copy
+import heapq
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from utils.sep_capacity import CapacityTree, capacity_groups
+from utils.sep_priority import priority_keys
+from utils.sep_trace import Progress
+
+ANY_SEMESTER = 'Any available semester'
+
+
+def _code(value, table):
+    """Return the integer code of value in table, adding it if unseen. Missing values are coded -1."""
+    if pd.isna(value):
+        return -1
+    if value not in table:
+        table[value] = len(table)
+    return table[value]
+
+
+def _membership_matrix(codes_per_program, n_values):
+    """Boolean program x value matrix with one extra all-False column for missing values."""
+    matrix = np.zeros((len(codes_per_program), n_values + 1), dtype=bool)
+    for p, codes in enumerate(codes_per_program):
+        matrix[p, codes] = True
+    return matrix
+
+
+def _eligibility_block(instance, students, programs=slice(None)):
+    """Student x program eligibility for a slice of students (and optionally of programs), vectorized over both axes."""
+    major = instance.student_major[students]
+    ok = ~instance.program_has_major_incl[None, programs] | instance.program_major_incl[programs][:, major].T
+    ok &= ~instance.program_major_excl[programs][:, major].T
+    with np.errstate(invalid='ignore'):
+        ok &= ~(instance.student_gpa[students, None] < instance.program_min_gpa[None, programs])  # NaN minGPA never fails
+    seniority = instance.program_seniority[None, programs]
+    ok &= (seniority == -1) | (instance.student_seniority[students, None] == seniority)
+    ok &= ~instance.program_nationality_excl[programs][:, instance.student_nationality[students]].T
+    return ok
+
+
+def build_eligibility(instance, chunk_size=4096):
+    """
+    Precompute the student x program eligibility bitset (one bit per pair, packed along programs).
+    The semester requirement depends on the proposal rather than on the student, so it is checked
+    separately by build_candidates().
+    """
+    n_bytes = (instance.n_programs + 7) // 8
+    eligible = np.zeros((instance.n_students, n_bytes), dtype=np.uint8)
+    for start in range(0, instance.n_students, chunk_size):
+        students = np.arange(start, min(start + chunk_size, instance.n_students))
+        eligible[students] = np.packbits(_eligibility_block(instance, students), axis=1)
+    return eligible
+
+
+def build_candidates(instance):
+    """
+    For every preference entry, list the programs of the proposed school that would consider it:
+    the student is eligible and the semester matches. Returned as CSR (offsets, program ids), in the
+    school's program order, so a proposal jumps straight to its eligible programs.
+    """
+    pref_student = np.repeat(np.arange(instance.n_students, dtype=np.int32), np.diff(instance.pref_offsets))
+    starts = instance.school_offsets[instance.pref_school]
+    counts = instance.school_offsets[instance.pref_school + 1] - starts
+    entry = np.repeat(np.arange(len(instance.pref_school), dtype=np.int32), counts)
+    position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+    program = instance.school_programs[position]
+
+    student = pref_student[entry]
+    ok = ((instance.eligible[student, program >> 3] >> (7 - (program & 7))) & 1).astype(bool)
+    sem = instance.pref_sem[entry]
+    program_sem = instance.program_sem[program]
+    ok &= (program_sem == -1) | (sem == 0) | (sem == program_sem)
+
+    cand_offsets = np.zeros(len(instance.pref_school) + 1, dtype=np.int32)
+    np.cumsum(np.bincount(entry[ok], minlength=len(instance.pref_school)), out=cand_offsets[1:])
+    return cand_offsets, program[ok].astype(np.int32)
+
+
+class CompiledInstance:
+    """
+    Integer-encoded SEP instance built from the Student / Program objects of utils/sep_nus.py.
+    Students, programs and schools keep the order of the input dicts, so ties are broken exactly
+    as in the object-based engine.
+    """
+    def __init__(self, students, programs):
+        self.student_names = [s.name for s in students.values()]
+        self.program_ids = list(programs.keys())
+
+        # schools are numbered in order of first appearance in programs, then in preferences
+        school_table = {}
+        for program in programs.values():
+            _code(program.schoolName, school_table)
+        semester_table = {ANY_SEMESTER: 0}
+        major_table, seniority_table, nationality_table = {}, {}, {}
+
+        # student attributes
+        n_students = len(self.student_names)
+        self.student_gpa = np.empty(n_students, dtype=np.float64)
+        self.student_score = np.empty(n_students, dtype=np.float64)
+        self.student_major = np.empty(n_students, dtype=np.int32)
+        self.student_seniority = np.empty(n_students, dtype=np.int32)
+        self.student_nationality = np.empty(n_students, dtype=np.int32)
+
+        # preferences as CSR: the choices of student s are pref_school / pref_sem[pref_offsets[s]:pref_offsets[s + 1]]
+        self.pref_offsets = np.zeros(n_students + 1, dtype=np.int32)
+        pref_school, pref_sem = [], []
+        for s, student in enumerate(students.values()):
+            self.student_gpa[s] = student.gpa
+            self.student_score[s] = student.total_score
+            self.student_major[s] = _code(student.major, major_table)
+            self.student_seniority[s] = _code(student.seniority, seniority_table)
+            self.student_nationality[s] = _code(student.nationality, nationality_table)
+            for school_name, semester in student.preferences:
+                pref_school.append(_code(school_name, school_table))
+                pref_sem.append(_code(semester, semester_table))
+            self.pref_offsets[s + 1] = len(pref_school)
+        self.pref_school = np.asarray(pref_school, dtype=np.int32)
+        self.pref_sem = np.asarray(pref_sem, dtype=np.int32)
+
+        # program attributes; requirement values no student has are coded -2 so they never match
+        n_programs = len(self.program_ids)
+        self.program_school = np.empty(n_programs, dtype=np.int32)
+        self.program_sem = np.empty(n_programs, dtype=np.int32)
+        self.program_quota = np.empty(n_programs, dtype=np.int32)
+        self.program_min_gpa = np.empty(n_programs, dtype=np.float64)
+        self.program_seniority = np.empty(n_programs, dtype=np.int32)
+        major_incl, major_excl, nationality_excl = [], [], []
+        for p, program in enumerate(programs.values()):
+            self.program_school[p] = school_table[program.schoolName]
+            self.program_sem[p] = _code(program.sem, semester_table)
+            self.program_quota[p] = program.quota
+            self.program_min_gpa[p] = np.nan if pd.isna(program.minGPA) else program.minGPA
+            self.program_seniority[p] = -1 if pd.isna(program.seniority) else seniority_table.get(program.seniority, -2)
+            major_incl.append([major_table[m] for m in program.major_incl if m in major_table])
+            major_excl.append([major_table[m] for m in program.major_excl if m in major_table])
+            nationality_excl.append([nationality_table[n] for n in program.nationality_excl if n in nationality_table])
+        self.program_has_major_incl = np.array([len(program.major_incl) > 0 for program in programs.values()], dtype=bool)
+        # school and semester caps above the programs (utils/sep_capacity.py), no groups without caps
+        self.program_group, self.group_parent, self.group_capacity, self.group_names = capacity_groups(programs)
+        # priority keys of the programs (utils/sep_priority.py): key 0 is the total score, every other key is
+        # a row of dense ranks, so the proposal loop compares one number per student whatever the key
+        self.program_key, self.priority_ranks, self.priority_keys = priority_keys(students, programs)
+
+        # program x value requirement matrices; the extra last column stands for a missing student value,
+        # so indexing with code -1 reads it and it never matches
+        self.program_major_incl = _membership_matrix(major_incl, len(major_table))
+        self.program_major_excl = _membership_matrix(major_excl, len(major_table))
+        self.program_nationality_excl = _membership_matrix(nationality_excl, len(nationality_table))
+
+        self.school_names = list(school_table.keys())
+        self.semester_names = list(semester_table.keys())
+        # value -> code tables, kept so changed students / programs can be encoded the same way later
+        self.value_codes = {'school': school_table, 'semester': semester_table, 'major': major_table,
+                            'seniority': seniority_table, 'nationality': nationality_table}
+
+        # programs offered by each school, in input order, as CSR
+        n_schools = len(self.school_names)
+        order = np.argsort(self.program_school, kind='stable')
+        self.school_programs = order.astype(np.int32)
+        self.school_offsets = np.zeros(n_schools + 1, dtype=np.int32)
+        np.cumsum(np.bincount(self.program_school, minlength=n_schools), out=self.school_offsets[1:])
+
+        self.eligible = build_eligibility(self)
+        self.cand_offsets, self.cand_programs = build_candidates(self)
+
+    @property
+    def n_students(self):
+        return len(self.student_names)
+
+    @property
+    def n_programs(self):
+        return len(self.program_ids)
+
+    def is_eligible(self, s, p):
+        """Whether student s meets the major, GPA, seniority and nationality requirements of program p."""
+        return bool((self.eligible[s, p >> 3] >> (7 - (p & 7))) & 1)
+
+    def semester_ok(self, sem, p):
+        """Whether a proposal for semester code sem meets the semester requirement of program p."""
+        return self.program_sem[p] == -1 or sem == 0 or sem == self.program_sem[p]
+
+
+def with_overrides(instance, quota=None, min_gpa=None):
+    """
+    Copy of a CompiledInstance with some program quotas / minimum GPAs replaced; the original is not modified.
+    quota and min_gpa map program index -> new value (a minGPA of None or NaN removes the floor).
+    Only the eligibility bits of the programs whose minGPA changed are recomputed.
+    """
+    overridden = copy.copy(instance)
+    if quota:
+        overridden.program_quota = instance.program_quota.copy()
+        for p, value in quota.items():
+            overridden.program_quota[p] = value
+    if min_gpa:
+        overridden.program_min_gpa = instance.program_min_gpa.copy()
+        for p, value in min_gpa.items():
+            overridden.program_min_gpa[p] = np.nan if value is None else value
+        _refresh_program_eligibility(overridden, sorted(min_gpa))
+        overridden.cand_offsets, overridden.cand_programs = build_candidates(overridden)
+    return overridden
+
+
+def _refresh_program_eligibility(instance, programs):
+    """Recompute the eligibility bits of the given program indexes on a copy of instance.eligible."""
+    changed = np.array(programs, dtype=np.int32)
+    instance.eligible = instance.eligible.copy()
+    block = _eligibility_block(instance, np.arange(instance.n_students), changed)
+    for j, p in enumerate(changed.tolist()):
+        mask = np.uint8(1 << (7 - (p & 7)))
+        column = instance.eligible[:, p >> 3]
+        instance.eligible[:, p >> 3] = np.where(block[:, j], column | mask, column & ~mask)
+
+
+def _splice_rows(offsets, values, rows):
+    """Replace some rows of a CSR array; rows maps row index -> new values. Returns the new (offsets, values)."""
+    lengths = np.diff(offsets)
+    segments, previous = [], 0
+    for r in sorted(rows):
+        segments.append(values[offsets[previous]:offsets[r]])
+        segments.append(np.asarray(rows[r], dtype=values.dtype))
+        lengths[r] = len(rows[r])
+        previous = r + 1
+    segments.append(values[offsets[previous]:])
+    new_offsets = np.zeros_like(offsets)
+    np.cumsum(lengths, out=new_offsets[1:])
+    return new_offsets, np.concatenate(segments)
+
+
+def with_changes(instance, students=None, programs=None):
+    """
+    Copy of a CompiledInstance with some students and programs replaced by edited versions; the original
+    is not modified. students / programs are dicts like the inputs of compile_instance(), keyed by names
+    and ProgramIDs that are already in the instance.
+    Returns None when an edit needs a full compile_instance(): a value no student or program had before
+    (school, semester, major, seniority, nationality of a student), a program moved to another school,
+    a program of a school with school / semester caps, a changed priority key or an edited student when
+    some program ranks by its own key (the ranks of every student depend on the others).
+    """
+    codes = instance.value_codes
+    changed = copy.copy(instance)
+
+    def code(value, table):
+        return -1 if pd.isna(value) else table.get(value)
+
+    if students and len(instance.priority_ranks):
+        return None
+    if students:
+        student_index = {name: s for s, name in enumerate(instance.student_names)}
+        rows = [student_index[name] for name in students]
+        changed.student_gpa = instance.student_gpa.copy()
+        changed.student_score = instance.student_score.copy()
+        changed.student_major = instance.student_major.copy()
+        changed.student_seniority = instance.student_seniority.copy()
+        changed.student_nationality = instance.student_nationality.copy()
+        pref_school, pref_sem = {}, {}
+        for s, student in zip(rows, students.values()):
+            values = (code(student.major, codes['major']), code(student.seniority, codes['seniority']),
+                      code(student.nationality, codes['nationality']))
+            schools = [code(school_name, codes['school']) for school_name, _ in student.preferences]
+            semesters = [code(semester, codes['semester']) for _, semester in student.preferences]
+            if None in values or None in schools or None in semesters or -1 in schools:
+                return None
+            changed.student_gpa[s] = student.gpa
+            changed.student_score[s] = student.total_score
+            changed.student_major[s], changed.student_seniority[s], changed.student_nationality[s] = values
+            pref_school[s], pref_sem[s] = schools, semesters
+        changed.pref_offsets, changed.pref_school = _splice_rows(instance.pref_offsets, instance.pref_school, pref_school)
+        _, changed.pref_sem = _splice_rows(instance.pref_offsets, instance.pref_sem, pref_sem)
+        rows = np.array(sorted(rows), dtype=np.int32)
+        changed.eligible = instance.eligible.copy()
+        changed.eligible[rows] = np.packbits(_eligibility_block(changed, rows), axis=1)
+
+    if programs:
+        program_index = {program_id: p for p, program_id in enumerate(instance.program_ids)}
+        columns = [program_index[program_id] for program_id in programs]
+        for p, program in zip(columns, programs.values()):
+            # caps are compiled from all the programs of a school together
+            school_capped = (instance.program_group[instance.program_school == instance.program_school[p]] >= 0).any()
+            if school_capped or not pd.isna(getattr(program, 'school_quota', None)) or not pd.isna(getattr(program, 'semester_quota', None)):
+                return None
+            key = getattr(program, 'priority', None)
+            if instance.priority_keys[instance.program_key[p]] != (key or instance.priority_keys[0]):
+                return None
+        for name in ('program_sem', 'program_quota', 'program_min_gpa', 'program_seniority', 'program_has_major_incl',
+                     'program_major_incl', 'program_major_excl', 'program_nationality_excl'):
+            setattr(changed, name, getattr(instance, name).copy())
+        for p, program in zip(columns, programs.values()):
+            if codes['school'].get(program.schoolName) != instance.program_school[p]:
+                return None
+            sem = code(program.sem, codes['semester'])
+            changed.program_sem[p] = -2 if sem is None else sem  # a semester no student asked for never matches
+            changed.program_quota[p] = program.quota
+            changed.program_min_gpa[p] = np.nan if pd.isna(program.minGPA) else program.minGPA
+            changed.program_seniority[p] = -1 if pd.isna(program.seniority) else codes['seniority'].get(program.seniority, -2)
+            changed.program_has_major_incl[p] = len(program.major_incl) > 0
+            for matrix, values, table in ((changed.program_major_incl, program.major_incl, codes['major']),
+                                          (changed.program_major_excl, program.major_excl, codes['major']),
+                                          (changed.program_nationality_excl, program.nationality_excl, codes['nationality'])):
+                matrix[p] = False
+                matrix[p, [table[v] for v in values if v in table]] = True
+        _refresh_program_eligibility(changed, sorted(columns))
+
+    changed.cand_offsets, changed.cand_programs = build_candidates(changed)
+    return changed
+
+
+def compile_instance(students, programs):
+    """Encode the students and programs dicts of utils/sep_nus.py as a CompiledInstance."""
+    return CompiledInstance(students, programs)
+
+
+class MatchingState:
+    """
+    Where a deferred acceptance run stands: the next preference entry of every student, the program
+    rosters, the arrival counter used for ties and the queue of unmatched students.
+    advance() moves it forward, so a run can be paused, copied and resumed.
+    """
+    def __init__(self, instance):
+        self.next_pref = instance.pref_offsets[:-1].tolist()
+        self.rosters = [[] for _ in range(instance.n_programs)]  # min-heaps of (score, -arrival, student id), lowest-ranked on top
+        self.arrival = 0
+        self.queue = deque(range(instance.n_students))
+        self.step = 0  # number of students taken from the queue so far
+
+    @property
+    def done(self):
+        return not self.queue
+
+    def copy(self):
+        state = copy.copy(self)
+        state.next_pref = list(self.next_pref)
+        state.rosters = [list(roster) for roster in self.rosters]
+        state.queue = deque(self.queue)
+        return state
+
+
+def capacity_tree(instance, rosters):
+    """CapacityTree of the school / semester caps of instance holding the students of rosters; None without caps."""
+    if not len(instance.group_capacity):
+        return None
+    tree = CapacityTree(instance.program_group, instance.group_parent, instance.group_capacity)
+    for p, roster in enumerate(rosters):
+        for entry_score, neg_arrival, s in roster:
+            tree.add(p, entry_score, neg_arrival, s)
+    return tree
+
+
+def program_ranks(instance, priority=None):
+    """
+    Per program, the list of the ranking values of all students under the program's priority key.
+    priority: optional per-student key replacing the total score (key 0); programs with their own key keep it.
+    Programs sharing a key share one list.
+    """
+    keys = [(instance.student_score if priority is None else priority).tolist()]
+    keys.extend(ranks.tolist() for ranks in instance.priority_ranks)
+    return [keys[k] for k in instance.program_key.tolist()]
+
+
+def advance(instance, state, log=None, checkpoint_every=None, on_checkpoint=None, priority=None, rejections=None,
+            losses=None, filled=None):
+    """
+    Run deferred acceptance from state until the queue is empty.
+    Every program ranks by its priority key (program_ranks()), so the roster entries of a program hold the
+    total score or the student's rank under the program's own key.
+    priority: optional per-student ranking key used instead of the total score, higher is better.
+    log: optional list receiving the preference entry proposed at each step (-1 when the student had none left).
+    rejections: optional list of per-program lists receiving the (score, -arrival, student id) entries the
+    program turned away for quota or a school / semester cap, whether the newcomer or an evicted student.
+    on_checkpoint: optional callback receiving the (live) state before every checkpoint_every-th step.
+    losses: optional list receiving a (step, program, score, student id) tuple, steps counted from 0, for
+    every student turned away or evicted, like rejections but in the order of the run.
+    filled: optional per-program lists receiving the step at which the roster first reached each size.
+    """
+    # plain lists are much faster than NumPy scalars inside the proposal loop
+    pref_end = instance.pref_offsets[1:].tolist()
+    cand_offsets = instance.cand_offsets.tolist()
+    cand_programs = instance.cand_programs.tolist()
+    quota = instance.program_quota.tolist()
+    ranks = program_ranks(instance, priority)
+    tree = capacity_tree(instance, state.rosters)
+
+    next_pref, rosters, queue = state.next_pref, state.rosters, state.queue
+    arrival, step = state.arrival, state.step
+    next_checkpoint = step if on_checkpoint is not None else -1
+    while queue:
+        if step == next_checkpoint:
+            state.arrival, state.step = arrival, step
+            on_checkpoint(state)
+            next_checkpoint += checkpoint_every
+        s = queue.popleft()
+        step += 1
+        k = next_pref[s]
+        if k == pref_end[s]:
+            if log is not None:
+                log.append(-1)
+            continue  # no more schools to propose
+        next_pref[s] = k + 1
+        if log is not None:
+            log.append(k)
+
+        # only programs of the school that the student is eligible for are visited
+        accepted = False
+        for i in range(cand_offsets[k], cand_offsets[k + 1]):
+            p = cand_programs[i]
+            roster = rosters[p]
+            score = ranks[p][s]
+            arrival += 1
+            if len(roster) < quota[p]:
+                if tree is not None:
+                    g = tree.full_group(p)
+                    if g >= 0:
+                        # a school / semester cap is reached: the newcomer has to beat the lowest-ranked student
+                        # under it, who is also the lowest-ranked of their own program
+                        worst = tree.worst(g)
+                        if worst is None or (score, -arrival) < worst[:2]:
+                            if rejections is not None:
+                                rejections[p].append((score, -arrival, s))
+                            if losses is not None:
+                                losses.append((step - 1, p, score, s))
+                            continue
+                        removed_entry = heapq.heappop(rosters[worst[3]])
+                        tree.remove(worst[3], worst[2])
+                        if rejections is not None:
+                            rejections[worst[3]].append(removed_entry)
+                        if losses is not None:
+                            losses.append((step - 1, worst[3], removed_entry[0], worst[2]))
+                        queue.append(worst[2])
+                    tree.add(p, score, -arrival, s)
+                heapq.heappush(roster, (score, -arrival, s))
+                if filled is not None and len(filled[p]) < len(roster):
+                    filled[p].append(step - 1)
+            else:
+                removed_entry = heapq.heappushpop(roster, (score, -arrival, s))
+                if rejections is not None:
+                    rejections[p].append(removed_entry)
+                removed = removed_entry[2]
+                if losses is not None:
+                    losses.append((step - 1, p, removed_entry[0], removed))
+                if removed == s:
+                    continue  # rejected for quota, try the next program of the school
+                if tree is not None:
+                    tree.remove(p, removed)
+                    tree.add(p, score, -arrival, s)
+                queue.append(removed)
+            accepted = True
+            break
+
+        if not accepted:
+            queue.append(s)
+    state.arrival, state.step = arrival, step
+    return state
+
+
+def matching_result(instance, state):
+    """Assigned program id (-1 if unmatched) per student and the roster of student ids per program, best first."""
+    assignment = np.full(instance.n_students, -1, dtype=np.int32)
+    roster_ids = []
+    for p, roster in enumerate(state.rosters):
+        ids = [s for _, _, s in sorted(roster, reverse=True)]  # best first
+        assignment[ids] = p
+        roster_ids.append(ids)
+    return assignment, roster_ids
+
+
+def progress_reporter(instance, on_progress):
+    """
+    on_checkpoint callback for advance() passing the progress of the run to on_progress as a
+    utils.sep_trace.Progress; call it with done=True once the run is finished.
+    """
+    total = len(instance.pref_school) + instance.n_students
+
+    def report(state, done=False):
+        on_progress(Progress(state.step, total, done))
+    return report
+
+
+def run_deferred_acceptance(instance, priority=None, on_progress=None, progress_every=10000):
+    """
+    Student-proposing deferred acceptance on a CompiledInstance.
+    Follows utils.sep_nus.deferred_acceptance step by step: unmatched students wait in a FIFO queue,
+    a proposal is considered by the programs of the school in input order, and each program keeps
+    its best students by total score, earlier arrivals first among equal scores.
+    priority: optional per-student key replacing the total score, e.g. a score with a tie-break lottery.
+    on_progress: optional callback receiving a utils.sep_trace.Progress every progress_every steps and at the end.
+    Returns the assigned program id (-1 if unmatched) per student and the roster of student ids per program.
+    """
+    if on_progress is None:
+        return matching_result(instance, advance(instance, MatchingState(instance), priority=priority))
+    report = progress_reporter(instance, on_progress)
+    state = advance(instance, MatchingState(instance), checkpoint_every=progress_every, on_checkpoint=report, priority=priority)
+    report(state, done=True)
+    return matching_result(instance, state)
+
+
+def to_assignment_dicts(instance, assignment, roster_ids):
+    """Convert engine output to the student_assignments / program_enrollments dicts of utils.sep_nus."""
+    student_assignments = {
+        name: (instance.program_ids[p] if p >= 0 else None)
+        for name, p in zip(instance.student_names, assignment.tolist())
+    }
+    program_enrollments = {
+        program_id: [instance.student_names[s] for s in ids]
+        for program_id, ids in zip(instance.program_ids, roster_ids)
+    }
+    return student_assignments, program_enrollments
+
+
+def deferred_acceptance_fast(students, programs):
+    """Drop-in replacement for the assignment part of utils.sep_nus.deferred_acceptance."""
+    instance = compile_instance(students, programs)
+    assignment, roster_ids = run_deferred_acceptance(instance)
+    return to_assignment_dicts(instance, assignment, roster_ids)
@@ -0,0 +1,70 @@
+# This module estimates how likely each student is to get each exchange program when ties in total
+# score are broken by lottery instead of by the row order of the uploaded CSV.
+# One compiled instance is matched many times, each time with a seeded random order among students with
+# equal total scores; only a student x program count matrix is kept between runs.
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from utils.sep_engine import compile_instance, run_deferred_acceptance
+from utils.sep_store import load_instance, shared_instance
+
+UNMATCHED = 'Unmatched'
+
+_instance = None  # compiled instance of the current worker process
+
+
+def _init_worker(instance):
+    """instance: a CompiledInstance, or the directory of a stored one (utils/sep_store.py), memory-mapped."""
+    global _instance
+    _instance = load_instance(instance) if isinstance(instance, str) else instance
+
+
+def tiebreak_priority(instance, rng):
+    """
+    Ranking key for run_deferred_acceptance(): students are ordered by total score, and students with
+    equal scores by a random lottery. Returns the rank of every student, higher is better.
+    """
+    lottery = rng.permutation(instance.n_students)
+    order = np.lexsort((lottery, instance.student_score))  # worst first
+    priority = np.empty(instance.n_students, dtype=np.int64)
+    priority[order] = np.arange(instance.n_students)
+    return priority
+
+
+def _count_runs(seed, runs):
+    """Student x (program + unmatched) assignment counts over the given run numbers."""
+    instance = _instance
+    n_columns = instance.n_programs + 1
+    counts = np.zeros(instance.n_students * n_columns, dtype=np.int64)
+    rows = np.arange(instance.n_students) * n_columns
+    for run in runs:
+        # each run has its own seed, so the result does not depend on how runs are split across workers
+        priority = tiebreak_priority(instance, np.random.default_rng([seed, run]))
+        assignment, _ = run_deferred_acceptance(instance, priority)
+        counts[rows + np.where(assignment >= 0, assignment, instance.n_programs)] += 1  # one cell per student, no duplicates
+    return counts.reshape(instance.n_students, n_columns)
+
+
+def tiebreak_ensemble(students, programs, n_runs=100, seed=0, max_workers=None):
+    """
+    Match the cohort n_runs times with a different tie-break lottery each time.
+    students, programs: the dicts of utils/sep_nus.py Student / Program objects.
+    max_workers: size of the process pool, 1 runs everything in this process.
+    Returns a DataFrame of assignment probabilities, one row per student and one column per ProgramID,
+    plus an "Unmatched" column; every row sums to 1.
+    """
+    instance = compile_instance(students, programs)
+    runs = np.arange(n_runs)
+    if max_workers == 1 or n_runs <= 1:
+        _init_worker(instance)
+        counts = _count_runs(seed, runs)
+    else:
+        max_workers = max_workers or os.cpu_count()
+        chunks = np.array_split(runs, min(n_runs, 4 * max_workers))
+        with shared_instance(instance) as directory, \
+                ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(directory,)) as executor:
+            counts = sum(executor.map(_count_runs, [seed] * len(chunks), chunks))
+    return pd.DataFrame(counts / n_runs, index=pd.Index(instance.student_names, name='Student'),
+                        columns=instance.program_ids + [UNMATCHED])
@@ -0,0 +1,211 @@
+# This module lets the SEP allocation be run with different matching mechanisms on the same compiled
+# instance (utils/sep_engine.py), so a comparison costs one parse and one compile plus one fast run each.
+# A mechanism takes a CompiledInstance and returns (assignment, roster_ids) like run_deferred_acceptance:
+# the program id per student (-1 if unmatched) and the student ids of every program, best first.
+#
+# Every mechanism uses the same student preferences (the candidate lists: programs of each chosen school
+# that the student is eligible for, in school order), the same program priorities (every program ranks by
+# its priority key, utils/sep_priority.py: total score unless the school file sets another; earlier students
+# in the input first among equal values) and the same school / semester caps (utils/sep_capacity.py),
+# which every mechanism keeps.
+import numpy as np
+import pandas as pd
+from utils.sep_capacity import CapacityTree
+from utils.sep_engine import compile_instance, run_deferred_acceptance, to_assignment_dicts
+
+MECHANISMS = {}
+
+
+def register(name):
+    """Decorator adding a mechanism function to MECHANISMS under name."""
+    def wrapper(mechanism):
+        MECHANISMS[name] = mechanism
+        return mechanism
+    return wrapper
+
+
+def _choice_lists(instance):
+    """Programs each student would accept, most preferred first, without repeats."""
+    cand_offsets = instance.cand_offsets.tolist()
+    cand_programs = instance.cand_programs.tolist()
+    pref_offsets = instance.pref_offsets.tolist()
+    return [list(dict.fromkeys(cand_programs[cand_offsets[pref_offsets[s]]:cand_offsets[pref_offsets[s + 1]]]))
+            for s in range(instance.n_students)]
+
+
+def _positions(instance):
+    """
+    Per program, the position of every student in the program's priority order (0 for the best; input
+    order among equal values). Programs sharing a key share one list.
+    """
+    positions = []
+    for values in [instance.student_score, *instance.priority_ranks]:
+        position = np.empty(instance.n_students, dtype=np.int64)
+        position[np.lexsort((np.arange(instance.n_students), -values))] = np.arange(instance.n_students)
+        positions.append(position.tolist())
+    return [positions[k] for k in instance.program_key.tolist()]
+
+
+def _rosters(instance, assignment, positions=None):
+    """Student ids of every program, best first under the program's priority key."""
+    positions = positions if positions is not None else _positions(instance)
+    roster_ids = [[] for _ in range(instance.n_programs)]
+    for s, p in enumerate(assignment.tolist()):
+        if p >= 0:
+            roster_ids[p].append(s)
+    return [sorted(students, key=positions[p].__getitem__) for p, students in enumerate(roster_ids)]
+
+
+register("DA")(run_deferred_acceptance)
+
+
+def _seats(quota, tree, p):
+    """Seats program p can still give: its own, and no more than any school / semester cap above it has left."""
+    if tree is None:
+        return quota[p]
+    return min([quota[p]] + [tree.group_capacity[g] - tree.count[g] for g in tree.path(p)])
+
+
+def _capacity_tree(instance):
+    """An empty CapacityTree of the caps of instance, None without caps."""
+    if not len(instance.group_capacity):
+        return None
+    return CapacityTree(instance.program_group, instance.group_parent, instance.group_capacity)
+
+
+@register("Boston")
+def immediate_acceptance(instance):
+    """
+    Immediate acceptance (Boston mechanism): in round r every unmatched student applies to their r-th
+    choice, and programs fill their remaining seats with the best applicants of the round for good.
+    The programs of a school take their applicants in school order, so an applicant turned away by one
+    program is considered by the next one on their list; a program takes no more than the caps above it allow.
+    """
+    quota = instance.program_quota.tolist()
+    cand_offsets = instance.cand_offsets.tolist()
+    cand_programs = instance.cand_programs.tolist()
+    pref_offsets = instance.pref_offsets.tolist()
+    positions = _positions(instance)
+    tree = _capacity_tree(instance)
+    assignment = np.full(instance.n_students, -1, dtype=np.int32)
+
+    unmatched = [s for s in range(instance.n_students) if pref_offsets[s + 1] > pref_offsets[s]]
+    r = 0
+    while unmatched:
+        applicants = {}  # program -> the students of the round who would take it
+        for s in unmatched:
+            k = pref_offsets[s] + r
+            for p in cand_programs[cand_offsets[k]:cand_offsets[k + 1]]:
+                applicants.setdefault(p, []).append(s)
+        placed = set()
+        for p in sorted(applicants):  # school order within every school; one school per student and round
+            seats = _seats(quota, tree, p)
+            if seats <= 0:
+                continue
+            best = sorted((s for s in applicants[p] if s not in placed), key=positions[p].__getitem__)[:seats]
+            for s in best:
+                assignment[s] = p
+                if tree is not None:
+                    tree.add(p, -positions[p][s], -s, s)
+            quota[p] -= len(best)
+            placed.update(best)
+        unmatched = [s for s in unmatched if s not in placed and pref_offsets[s] + r + 1 < pref_offsets[s + 1]]
+        r += 1
+    return assignment, _rosters(instance, assignment, positions)
+
+
+@register("TTC")
+def top_trading_cycles(instance):
+    """
+    Top trading cycles: every student points to their best program with a free seat, every such program
+    points to its best remaining applicant; students on a cycle get the program they point to.
+    A program ranks only the students that would accept it, and points only while the school / semester
+    caps above it have a seat left; a cycle that would take more seats than a cap has left places its
+    students in cycle order, and the others point again.
+    """
+    choices = _choice_lists(instance)
+    quota = instance.program_quota.tolist()
+    tree = _capacity_tree(instance)
+    positions = _positions(instance)
+    applicants = [[] for _ in range(instance.n_programs)]
+    for s, programs in enumerate(choices):
+        for p in programs:
+            applicants[p].append(s)
+    applicants = [sorted(students, key=positions[p].__getitem__) for p, students in enumerate(applicants)]
+
+    assignment = [-1] * instance.n_students
+    done = [False] * instance.n_students
+    student_next = [0] * instance.n_students  # position in choices[s] of the program s points to
+    program_next = [0] * instance.n_programs  # position in applicants[p] of the student p points to
+
+    def top_program(s):
+        i, programs = student_next[s], choices[s]
+        while i < len(programs) and _seats(quota, tree, programs[i]) <= 0:
+            i += 1
+        student_next[s] = i
+        return programs[i] if i < len(programs) else -1
+
+    def top_student(p):
+        j, students = program_next[p], applicants[p]
+        while done[students[j]]:
+            j += 1
+        program_next[p] = j
+        return students[j]
+
+    starts = list(range(instance.n_students - 1, -1, -1))  # students yet to start a path from, next on top
+    while starts:
+        start = starts.pop()
+        if done[start]:
+            continue
+        path, on_path = [start], {start: 0}
+        while path:
+            s = path[-1]
+            p = top_program(s)
+            if p < 0:
+                done[s] = True  # no acceptable program with a free seat left
+                del on_path[path.pop()]
+                continue
+            t = top_student(p)
+            if t not in on_path:
+                on_path[t] = len(path)
+                path.append(t)
+                continue
+            # cycle from t to the end of the path: everyone gets the program they point to
+            cycle = path[on_path[t]:]
+            for u in cycle:
+                q = choices[u][student_next[u]]
+                del on_path[u]
+                if _seats(quota, tree, q) <= 0:  # a cap above q was filled by this cycle
+                    starts.append(u)
+                    continue
+                assignment[u] = q
+                quota[q] -= 1
+                if tree is not None:
+                    tree.add(q, 0, -u, u)
+                done[u] = True
+            del path[len(path) - len(cycle):]
+    assignment = np.array(assignment, dtype=np.int32)
+    return assignment, _rosters(instance, assignment, positions)
+
+
+def run_mechanisms(students, programs, names=None):
+    """
+    Run several mechanisms on one compiled instance of the utils/sep_nus.py students and programs dicts.
+    Returns {name: (student_assignments, program_enrollments)}, the dicts deferred_acceptance returns.
+    """
+    instance = compile_instance(students, programs)
+    return {name: to_assignment_dicts(instance, *MECHANISMS[name](instance)) for name in (names or MECHANISMS)}
+
+
+def compare_mechanisms(students, programs, names=None, unmatched=""):
+    """
+    Side-by-side table: one row per student, one ProgramID column per mechanism.
+    ProgramIDs are kept as given (object columns, so missing values do not turn them into floats);
+    unmatched is shown for a student a mechanism leaves unmatched.
+    """
+    results = run_mechanisms(students, programs, names)
+    table = pd.DataFrame({"Student": list(students)})
+    for name, (student_assignments, _) in results.items():
+        program_ids = [student_assignments[student] for student in students]
+        table[name] = pd.Series([unmatched if program_id is None else program_id for program_id in program_ids], dtype=object)
+    return table
@@ -1,5 +1,22 @@
-import streamlit as st
+import itertools
+
+import numpy as np
 import pandas as pd
+from utils.roster import BoundedRoster
+from utils.sep_capacity import CapacityTree
+from utils.sep_engine import compile_instance, program_ranks
+from utils.sep_priority import parse_priority
+from utils.sep_trace import TraceRecorder, Progress, Reason, SEMESTER_NOT_MET, MAJOR_NOT_MET, SENIORITY_NOT_MET, NATIONALITY_NOT_MET, UNKNOWN_SCHOOL
+
+# Columns of the matching process table
+TRACE_COLUMNS = {
+    'Student Name': object,
+    'Total Score': np.float64,
+    'Action': object,
+    'Choice Number': object,
+    'School Name': object,
+}  # followed by the reason code columns of utils.sep_trace
+
 
 class Student:
     def __init__(self, name, gpa, total_score, major, seniority, nationality, preferences): # preferences is a list of [schoolname, semester]
@@ -21,7 +38,8 @@ class Student:
 
 
 class Program:
-    def __init__(self, schoolName, sem, major_incl, major_excl, quota, minGPA, seniority, nationality_excl):
+    def __init__(self, schoolName, sem, major_incl, major_excl, quota, minGPA, seniority, nationality_excl,
+                 school_quota=None, semester_quota=None, priority=None):
         self.schoolName = schoolName
         self.sem = sem
         self.major_incl = major_incl
@@ -30,114 +48,249 @@ class Program:
         self.minGPA = minGPA
         self.seniority = seniority
         self.nationality_excl = nationality_excl
-        self.accepted_students = []  # List of (totalScore, student_name)
+        # seats shared by all programs of the school / of the school in this semester (utils/sep_capacity.py)
+        self.school_quota = school_quota
+        self.semester_quota = semester_quota
+        # tuple of student columns the applicants are ranked by, None for total score (utils/sep_priority.py)
+        self.priority = priority
+        self.accepted_students = BoundedRoster(quota)  # (totalScore, student_name), sorted view by total score or priority
     
-    def consider(self, student):
-        # Check if student meets study semester requirement
+    def check_semester(self, student):
+        # Check if student meets study semester requirement for the current proposal
         if (
             not pd.isna(self.sem) and 
             student.preferences[student.current_proposal - 1][1] != 'Any available semester' and 
             student.preferences[student.current_proposal - 1][1] != self.sem
         ):
-            rejected_reason = f"semester requirement not met"
-            return (student.total_score, student.name), rejected_reason  # Student does not meet semester requirement
+            return SEMESTER_NOT_MET
+        return None
+
+    def check_requirements(self, student):
+        # Return the Reason why the student does not meet the program requirements, None if all are met
+        rejected_reason = self.check_semester(student)
+        if rejected_reason is not None:
+            return rejected_reason
 
         # Check if student meets major requirements
         if self.major_incl != [] and student.major not in self.major_incl:
-            rejected_reason = f"major requirement not met"
-            return (student.total_score, student.name), rejected_reason  # Student does not meet major requirement
+            return MAJOR_NOT_MET
         
         if self.major_excl != [] and student.major in self.major_excl:
-            rejected_reason = f"major requirement not met"
-            return (student.total_score, student.name), rejected_reason  # Student does not meet major requirement
+            return MAJOR_NOT_MET
         
         # Check if student meets minimum GPA requirement
         if not pd.isna(self.minGPA) and student.gpa < self.minGPA:
-            rejected_reason = f"minimum GPA {self.minGPA} not met"
-            return (student.total_score, student.name), rejected_reason  # Student does not meet GPA requirement
+            return Reason("min_gpa", self.minGPA)
 
         # Check if student meets seniority requirement
         if not pd.isna(self.seniority) and student.seniority != self.seniority:
-            rejected_reason = f"seniority requirement not met"
-            return (student.total_score, student.name), rejected_reason  # Student does not meet seniority requirement
+            return SENIORITY_NOT_MET
         
         # Check if student meets nationality requirement
         if self.nationality_excl != [] and student.nationality in self.nationality_excl:
-            rejected_reason = f"nationality requirement not met"
-            return (student.total_score, student.name), rejected_reason  # Student does not meet seniority requirement
-
-        # Compare student's total score with accepted students
-        self.accepted_students.append((student.total_score, student.name))
-        self.accepted_students.sort(reverse=True, key=lambda x: x[0])  # Sort by total score in descending order
-        # Remove the lowest-ranked student if quota is reached
-        if len(self.accepted_students) > self.quota:
-            rejected_reason = f"maximum quota {self.quota} reached. Accepted students: {[(name, total_score) for total_score, name in self.accepted_students[:-1]]}"
-            return self.accepted_students.pop(), rejected_reason  # Remove lowest-ranked student
+            return NATIONALITY_NOT_MET
+
+        return None
+
+    def consider(self, student, eligible=None, rank=None):
+        # eligible is the precomputed major/GPA/seniority/nationality check from utils.sep_engine.build_eligibility;
+        # when it is True only the semester is checked, otherwise the full checks produce the rejection reason
+        # rank: the student's value under self.priority (utils.sep_engine.program_ranks), None to rank by total score
+        rejected_reason = self.check_semester(student) if eligible else self.check_requirements(student)
+        if rejected_reason is not None:
+            return (student.total_score, student.name), rejected_reason  # Student does not meet the requirements
+
+        return self.admit(student, rank)
+
+    def admit(self, student, rank=None):
+        # Compare student's total score (or rank) with accepted students
+        # The lowest-ranked student is removed if quota is reached
+        removed_student = self.accepted_students.push(student.total_score, student.name, rank)
+        if removed_student is not None:
+            cutoff = self.accepted_students.cutoff()
+            rejected_reason = Reason("quota", self.quota, cutoff[0] if cutoff else None, self.accepted_students.snapshot())
+            return removed_student, rejected_reason  # Lowest-ranked student removed
         return None, None  # No student removed
 
-def deferred_acceptance(students, programs):
+
+def consider_capped(programs, program_ids, p, student, eligible, tree, arrival, rank):
+    # Program.consider of programs[program_ids[p]] under school / semester caps; tree is the CapacityTree of
+    # the run, arrival the number of this consideration in the run and rank the student's value under the
+    # program's priority key (shared by the programs under a cap), None for total score. Returns (removed_student,
+    # rejected_reason, ProgramID of the removed student), who may come from another program under a full cap.
+    programID = program_ids[p]
+    program = programs[programID]
+    key = student.total_score if rank is None else rank
+    rejected_reason = program.check_semester(student) if eligible else program.check_requirements(student)
+    if rejected_reason is not None:
+        return (student.total_score, student.name), rejected_reason, programID
+
+    g = -1 if program.accepted_students.is_full() else tree.full_group(p)
+    if g < 0:
+        removed_student, rejected_reason = program.admit(student, rank)
+        if removed_student is None or removed_student[1] != student.name:
+            if removed_student is not None:
+                tree.remove(p, removed_student[1])
+            tree.add(p, key, -arrival, student.name)
+        return removed_student, rejected_reason, programID
+
+    # the cap is reached: the student has to beat the lowest-ranked student under it, who is also the
+    # lowest-ranked of their own program
+    worst = tree.worst(g)
+    if worst is None or (key, -arrival) < worst[:2]:
+        removed_student, removed_from = (student.total_score, student.name), programID
+    else:
+        removed_from = program_ids[worst[3]]
+        removed_student = programs[removed_from].accepted_students.pop()
+        tree.remove(worst[3], worst[2])
+        program.admit(student, rank)
+        tree.add(p, key, -arrival, student.name)
+    # the lowest-ranked student under the cap is also the lowest of their program, whose roster has their score
+    worst = tree.worst(g)
+    cutoff = programs[program_ids[worst[3]]].accepted_students.cutoff() if worst else None
+    return removed_student, Reason("group_quota", tree.group_capacity[g], cutoff[0] if cutoff else None), removed_from
+
+def load_students(students_df):
+    # Build Student objects from the NUS student preference file, one row per student and destination.
+    # One sort on (EmplID, Destination Ranking) puts every student's choices in a contiguous, ranked block;
+    # the student's attributes are taken from their first row in the file.
+    students_df = students_df.dropna(subset=["*EmplID"])
+    ordered = students_df.sort_values(["*EmplID", "Destination Ranking"])
+    names = ordered["*EmplID"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])
+    ends = np.r_[starts[1:], len(names)]
+    choices = [list(pair) for pair in zip(ordered["Ext. Study Location"].to_numpy(), ordered["*Ext. Study Period"].to_numpy())]
+
+    first = students_df.drop_duplicates("*EmplID").set_index("*EmplID").loc[names[starts]]
+    majors = first["Student Major"].str.replace(' (Hons)', '', regex=False).to_numpy()
+    return {
+        name: Student(name, gpa, total_score, major, seniority, nationality, choices[start:end])
+        for name, gpa, total_score, major, seniority, nationality, start, end in zip(
+            names[starts], first["GPA"].to_numpy(), first["Total Score"].to_numpy(), majors,
+            first["Seniority"].to_numpy(), first["Singapore Residency Status"].to_numpy(), starts, ends)
+    }
+
+
+def load_programs(schools_df):
+    # Build Program objects from the NUS school file, keyed by ProgramID
+    return {
+        row["ProgramID"]: 
+        Program(
+            row["SchoolName"],
+            row["Semester"],
+            row["Major (incl)"].split(", ") if not pd.isna(row["Major (incl)"]) else [],
+            row["Major (excl)"].split(", ") if not pd.isna(row["Major (excl)"]) else [],
+            int(row["Quota"]),
+            row["minGPA"],
+            row["Seniority"],
+            row["Nationality (excl)"].split(", ") if not pd.isna(row["Nationality (excl)"]) else [],
+            row.get("School Quota"),  # optional columns, see utils/sep_capacity.py
+            row.get("Semester Quota"),
+            parse_priority(row.get("Priority"))
+        )            
+        for _, row in schools_df.iterrows()}
+
+
+def index_programs_by_school(programs):
+    # Map each school name to the (programID, program) pairs it offers, in the order of programs
+    school_programs = {}
+    for programID, program in programs.items():
+        school_programs.setdefault(program.schoolName, []).append((programID, program))
+    return school_programs
+
+
+def deferred_acceptance(students, programs, trace_level="full", trace_path=None, on_progress=None, progress_every=10000, instance=None, rejections=None):
+    # trace_level: "off" for bulk runs, "summary" for the final event of each student, "full" for every event
+    # trace_path: optional file the "full" trace is streamed to in chunks; the trace returned is then a
+    # utils.sep_trace.SpilledTrace instead of a DataFrame
+    # on_progress: optional callback receiving a utils.sep_trace.Progress every progress_every steps and at the
+    # end, e.g. for a progress bar in a page or progress lines in batch.py
+    # instance: compile_instance(students, programs) if the caller already built it, e.g. for utils.sep_waitlist
+    # rejections: optional dict receiving ProgramID -> names of the students turned away for quota or a school /
+    # semester cap, in order, for utils.sep_cutoffs
     unmatched_students = list(students.values())
 
-    # Create a DataFrame to record the matching process
-    columns = ['Student Name', 'Total Score', 'Action', 'Choice Number', 'School Name', 'Reason']
-    matching_process_df = pd.DataFrame(columns=columns)
+    # Build step: index programs by school and precompute the student x program eligibility bitset once
+    school_programs = index_programs_by_school(programs)
+    instance = instance if instance is not None else compile_instance(students, programs)
+    student_index = {name: s for s, name in enumerate(instance.student_names)}
+    program_index = {programID: p for p, programID in enumerate(instance.program_ids)}
+    # ranks of every student under the programs with their own priority key; the others use total scores
+    ranks, program_key = program_ranks(instance), instance.program_key.tolist()
+    # school / semester caps shared by several programs, if the school file has any
+    tree = CapacityTree(instance.program_group, instance.group_parent, instance.group_capacity) if len(instance.group_capacity) else None
+    arrival = itertools.count(1)
+    # the programs of each preference entry that the student is eligible for, semester included (CSR)
+    pref_offsets, cand_offsets, cand_programs = (instance.pref_offsets.tolist(), instance.cand_offsets.tolist(),
+                                                 instance.cand_programs.tolist())
 
-    with st.expander("See detailed matching process"):
-        with st.container(height=300, border=False):
-            # st.write("Deferred Acceptance Algorithm:")
-            st.divider()
+    # Record the matching process in a columnar buffer
+    trace = TraceRecorder(TRACE_COLUMNS, trace_level, spill_path=trace_path)
+    if trace.enabled:  # quota rejections in the trace list the roster of their time, rebuilt from the history
+        for program in programs.values():
+            program.accepted_students.keep_history()
+
+    total = sum(len(student.preferences) for student in students.values()) + len(students)
+    steps = 0
+    while len(unmatched_students)>0:
+        if on_progress is not None and steps % progress_every == 0:
+            on_progress(Progress(steps, total))
+        steps += 1
+        student = unmatched_students.pop(0)
+        school_name = student.propose()
+        if school_name is not None:
+            # Record the proposal action
+            trace.record(student.name, student.total_score, 'proposed to', student.current_proposal, school_name, None)
+            
+            if school_name not in school_programs:
+                # a choice without any program in the school file rejects the student (utils/sep_validation.py warns about it)
+                trace.record(student.name, student.total_score, 'rejected by', student.current_proposal, school_name,
+                             reason=UNKNOWN_SCHOOL, program=school_name)
+                unmatched_students.append(student)
+                continue
+
+            # loop through the programs offered by the school, and consider the student for each one; without a
+            # trace no rejection reason is shown, so only the programs the student is eligible for are considered
+            s = student_index[student.name]
+            if trace.enabled:
+                candidates = [program_index[programID] for programID, _ in school_programs[school_name]]
+            else:
+                k = pref_offsets[s] + student.current_proposal - 1
+                candidates = cand_programs[cand_offsets[k]:cand_offsets[k + 1]]
+            accepted = False
+            for p in candidates:
+                programID = instance.program_ids[p]
+                program = programs[programID]
+                eligible = not trace.enabled or instance.is_eligible(s, p)
+                rank = ranks[p][s] if program_key[p] else None
+                if tree is None:
+                    removed_student, rejected_reason = program.consider(student, eligible, rank)
+                    removed_from = programID
+                else:
+                    removed_student, rejected_reason, removed_from = consider_capped(
+                        programs, instance.program_ids, p, student, eligible, tree, next(arrival), rank)
+                if removed_student is None:
+                    accepted = True
+                    break 
+                if removed_student:
+                    if rejections is not None and rejected_reason.code in ("quota", "group_quota"):
+                        rejections.setdefault(removed_from, []).append(removed_student[1])
+                    # Record the rejection action     
+                    trace.record(removed_student[1], removed_student[0], 'rejected by', None, school_name + f' ProgramID: {removed_from}',
+                                 reason=rejected_reason, program=removed_from)
+
+                    if removed_student[1] != student.name:
+                        unmatched_students.append(students[removed_student[1]])
+                        accepted = True
+                        break  # If the proposing student is not rejected, stop considering other programs
+
+            if not accepted:
+                unmatched_students.append(student)
             
-            while len(unmatched_students)>0:
-                student = unmatched_students.pop(0)
-                school_name = student.propose()
-                if school_name is not None:
-                    # Record the proposal action
-                    new_row = {
-                        'Student Name': student.name,
-                        'Total Score': student.total_score,
-                        'Action': 'proposed to',
-                        'Choice Number': student.current_proposal,
-                        'School Name': school_name,
-                        'Reason': None
-                    }
-
-                    if matching_process_df.empty:
-                        matching_process_df = pd.DataFrame([new_row], columns=columns)
-                    else:
-                        matching_process_df = pd.concat([matching_process_df, pd.DataFrame([new_row])], ignore_index=True)
-                    st.write(f"{student.name} propose to Choice {student.current_proposal} -- {school_name}")
-                    
-                    # loop through all programs offered by the school, and consider the student for each one
-                    accepted = False
-                    for programID, program in programs.items():
-                        if program.schoolName == school_name:
-                            # st.write(program)
-                            removed_student, rejected_reason = program.consider(student)
-                            if removed_student is None:
-                                accepted = True
-                                break 
-                            if removed_student:
-                                # Record the rejection action     
-                                new_row = {
-                                    'Student Name': removed_student[1],
-                                    'Total Score': removed_student[0],
-                                    'Action': 'rejected by',
-                                    'Choice Number': None,
-                                    'School Name': school_name + f' ProgramID: {programID}',
-                                    'Reason': rejected_reason
-                                }
-                                matching_process_df = pd.concat([matching_process_df, pd.DataFrame([new_row])], ignore_index=True)
-                                st.write(f"{removed_student[1]} (Total Score:{removed_student[0]}) is rejected by {school_name} because {rejected_reason}")
-
-                                if removed_student[1] != student.name:
-                                    unmatched_students.append(students[removed_student[1]])
-                                    accepted = True
-                                    break  # If the proposing student is not rejected, stop considering other programs
-
-                    if not accepted:
-                        unmatched_students.append(student)
-                    
     
+    if on_progress is not None:
+        on_progress(Progress(steps, total, done=True))
+
     student_assignments = {s.name: None for s in students.values()}
     program_enrollments = {programID: [] for programID in programs.keys()}
     
@@ -146,4 +299,4 @@ def deferred_acceptance(students, programs):
             student_assignments[student_name] = programID
             program_enrollments[programID].append(student_name)
     
-    return student_assignments, program_enrollments, matching_process_df
\ No newline at end of file
+    return student_assignments, program_enrollments, trace.finish()
\ No newline at end of file
@@ -0,0 +1,72 @@
+# This module contains the priority keys of the NUS exchange programs. By default a program ranks its
+# applicants by total score; a program can declare its own key in the optional "Priority" column of the
+# school file, a comma-separated list of student columns compared in turn, higher first, e.g.
+# "GPA, Seniority, Total Score".
+#
+# Every distinct key is turned once into a dense integer rank per student with one vectorized lexsort
+# (equal keys get equal ranks, so earlier arrivals still win ties), and the engines compare those ranks:
+# a proposal costs one number comparison whatever the key.
+import numpy as np
+import pandas as pd
+
+# student columns a key can use -> attribute of utils.sep_nus.Student
+PRIORITY_COLUMNS = {'Total Score': 'total_score', 'GPA': 'gpa', 'Seniority': 'seniority'}
+DEFAULT_PRIORITY = ('Total Score',)
+
+
+def parse_priority(value):
+    """The key of a "Priority" cell as a tuple of column names; None for an empty cell (total score)."""
+    if pd.isna(value) or not str(value).strip():
+        return None
+    return tuple(column.strip() for column in str(value).split(','))
+
+
+def dense_rank(columns):
+    """
+    Rank of every row by the given columns (most significant first, higher is better), 0 for the lowest;
+    rows with equal values in every column share a rank. Missing values rank lowest.
+    """
+    keys = [np.nan_to_num(pd.to_numeric(pd.Series(column), errors='coerce').to_numpy(dtype=np.float64), nan=-np.inf)
+            for column in columns]
+    order = np.lexsort(keys[::-1])  # lexsort takes the most significant key last; ascending, so worst first
+    changed = np.zeros(len(order), dtype=bool)
+    for key in keys:
+        ordered = key[order]
+        changed[1:] |= ordered[1:] != ordered[:-1]
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.cumsum(changed)
+    return rank
+
+
+def priority_values(instance, key):
+    """
+    Values of every student of a CompiledInstance (utils/sep_engine.py) in the columns of key, as a float
+    array (students x columns), NaN where missing; they order the students as the ranks of the key do.
+    """
+    seniority = pd.to_numeric(pd.Series(list(instance.value_codes['seniority']) + [np.nan], dtype=object), errors='coerce')
+    columns = {
+        'Total Score': instance.student_score,
+        'GPA': instance.student_gpa,
+        'Seniority': seniority.to_numpy(dtype=np.float64)[instance.student_seniority],  # code -1 (missing) reads NaN
+    }
+    return np.column_stack([columns[column] for column in key]).astype(np.float64)
+
+
+def priority_keys(students, programs):
+    """
+    Encode the priority keys of the Student / Program dicts of utils/sep_nus.py, in dict order.
+    Returns (program_key, priority_ranks, keys): program_key is 0 for programs ranking by total score and
+    k for the k-th other key, whose ranks are row k - 1 of priority_ranks (keys x students).
+    """
+    keys = [DEFAULT_PRIORITY]
+    program_key = np.zeros(len(programs), dtype=np.int32)
+    for p, program in enumerate(programs.values()):
+        key = getattr(program, 'priority', None) or DEFAULT_PRIORITY
+        if key not in keys:
+            keys.append(key)
+        program_key[p] = keys.index(key)
+    student_list = list(students.values())
+    ranks = np.empty((len(keys) - 1, len(student_list)), dtype=np.int32)
+    for k, key in enumerate(keys[1:]):
+        ranks[k] = dense_rank([[getattr(student, PRIORITY_COLUMNS[column]) for student in student_list] for column in key])
+    return program_key, ranks, keys
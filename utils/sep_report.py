@@ -0,0 +1,117 @@
+# This module builds the result tables of the NUS exchange matching (utils/sep_nus.py) for the page and
+# for batch.py. Every table is filled through one join index from students to rows of the school file,
+# instead of merges and row-wise lookups into the Student / Program objects.
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from utils.sep_engine import matching_result
+
+# students / programs: the preview tables of the page; students_df / schools_df: the uploaded files with
+# the assignment columns appended, as downloaded
+SEPReport = namedtuple("SEPReport", ["students", "programs", "students_df", "schools_df"])
+
+
+def _take(values, rows):
+    """values[rows] with None where rows is -1."""
+    taken = np.asarray(values, dtype=object)[rows]
+    taken[rows < 0] = None
+    return taken
+
+
+def build_report(students_df, schools_df, student_names, program_ids, assignment, roster_ids, chosen_semester):
+    """
+    Build the result tables from the engine's array output.
+    student_names, program_ids: names / ProgramIDs in engine order; assignment: program position per student,
+    -1 if unmatched; roster_ids: student positions enrolled in every program, best first;
+    chosen_semester: the semester of the choice each student ended on.
+    """
+    student_names = np.asarray(student_names, dtype=object)
+    program_ids = np.asarray(program_ids, dtype=object)
+    assignment = np.asarray(assignment)
+    assigned = _take(program_ids, assignment)
+
+    # join indexes: engine program -> row of the school file (the programs were loaded from it, so every
+    # ProgramID is found), file row -> engine student / program
+    school_ids = pd.Index(schools_df["ProgramID"])
+    program_row = school_ids.get_indexer(program_ids)
+    student_school_row = np.where(assignment >= 0, program_row[assignment], -1)
+    school_names = schools_df["SchoolName"].to_numpy()
+    semesters = schools_df["Semester"].to_numpy()
+
+    students = pd.DataFrame({
+        "Student": student_names,
+        "ProgramID": assigned,
+        "SchoolName": _take(school_names, student_school_row),
+        "PU required semester": _take(semesters, student_school_row),
+        "Student preferred semester": np.asarray(chosen_semester, dtype=object),
+    })
+
+    counts = np.array([len(ids) for ids in roster_ids], dtype=np.int64)
+    enrolled = [list(student_names[ids]) for ids in roster_ids]
+    quota = schools_df["Quota"].to_numpy()[program_row]
+    programs = pd.DataFrame({
+        "ProgramID": program_ids,
+        "Enrolled Student": enrolled,
+        "SchoolName": _take(school_names, program_row),
+        "PU required semester": _take(semesters, program_row),
+        "Quota": quota,
+        "Students Count": counts,
+        "Quota Remaining": quota - counts,
+    })
+
+    students_df = students_df.copy()
+    file_student = pd.Index(student_names).get_indexer(students_df["*EmplID"])
+    file_program = np.where(file_student >= 0, assignment[file_student], -1)
+    students_df["Assigned ProgramID"] = _take(program_ids, file_program)
+    file_school_row = np.where(file_program >= 0, program_row[file_program], -1)
+    students_df["Assigned University"] = _take(school_names, file_school_row)
+    students_df["PU required semester"] = _take(semesters, file_school_row)
+
+    schools_df = schools_df.copy()
+    row_program = pd.Index(program_ids).get_indexer(school_ids)
+    joined = np.array([", ".join(names) if names else None for names in enrolled] + [None], dtype=object)
+    schools_df["Enrolled Students"] = joined[row_program]
+    schools_df["Enrolled Students Count"] = np.append(counts, 0)[row_program]
+    schools_df["Quota Remaining"] = schools_df["Quota"] - schools_df["Enrolled Students Count"]
+    return SEPReport(students, programs, students_df, schools_df)
+
+
+def report_from_results(students_df, schools_df, students, student_assignments, program_enrollments, waitlist_df=None):
+    """
+    Result tables from the dicts returned by utils.sep_nus.deferred_acceptance and its Student objects.
+    waitlist_df: optional students placed by utils.sep_waitlist.run_waitlist (with the dicts it returned);
+    adds the round each student was placed in.
+    """
+    student_names = list(student_assignments)
+    program_ids = list(program_enrollments)
+    program_index = {programID: p for p, programID in enumerate(program_ids)}
+    student_index = {name: s for s, name in enumerate(student_names)}
+    assignment = np.array([program_index[programID] if programID is not None else -1
+                           for programID in student_assignments.values()], dtype=np.int64)
+    roster_ids = [[student_index[name] for name in names] for names in program_enrollments.values()]
+    # the choice a student ended on is their last proposal
+    chosen_semester = [students[name].preferences[students[name].current_proposal - 1][1] for name in student_names]
+    if waitlist_df is None:
+        return build_report(students_df, schools_df, student_names, program_ids, assignment, roster_ids, chosen_semester)
+
+    waitlisted = [student_index[name] for name in waitlist_df["Student"]]
+    for s, semester in zip(waitlisted, waitlist_df["Student preferred semester"]):
+        chosen_semester[s] = semester
+    placed_round = np.where(assignment >= 0, 1, -1)
+    placed_round[waitlisted] = waitlist_df["Round"].to_numpy()
+    report = build_report(students_df, schools_df, student_names, program_ids, assignment, roster_ids, chosen_semester)
+    rounds = np.where(placed_round > 0, placed_round, None)  # round 1 is the deferred acceptance run
+    report.students["Round"] = rounds
+    report.students_df["Assigned Round"] = _take(rounds, pd.Index(student_names).get_indexer(report.students_df["*EmplID"]))
+    return report
+
+
+def report_from_engine(students_df, schools_df, instance, state):
+    """Result tables from a finished utils.sep_engine run (CompiledInstance and MatchingState)."""
+    assignment, roster_ids = matching_result(instance, state)
+    last = np.asarray(state.next_pref) - 1
+    proposed = last >= instance.pref_offsets[:-1]
+    sem_code = np.where(proposed, instance.pref_sem[np.maximum(last, 0)], -1)
+    chosen_semester = np.asarray(instance.semester_names + [np.nan], dtype=object)[sem_code]  # -1: missing semester
+    return build_report(students_df, schools_df, instance.student_names, instance.program_ids, assignment, roster_ids, chosen_semester)
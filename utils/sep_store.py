@@ -0,0 +1,108 @@
+# This module stores a CompiledInstance (utils/sep_engine.py) as a directory of .npy files and loads it
+# back memory-mapped. Preferences are already CSR in the instance: pref_offsets (int32) delimits the
+# choices of each student in pref_school / pref_sem (int32 codes into the school_names / semester_names
+# tables), so a cohort is a few flat arrays instead of one list of [school, semester] lists per student.
+# Repeated runs on the same input files skip compile_instance(), and the worker processes of a pool map
+# the same files instead of each unpickling its own copy of the arrays.
+#
+# directory layout: one <field>.npy per array of the instance, and tables.json with the name and value
+# tables and the digest of the input files; tables.json is written last, so a directory that has it is complete.
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+from utils.sep_engine import CompiledInstance, compile_instance
+
+ARRAY_FIELDS = [
+    'student_gpa', 'student_score', 'student_major', 'student_seniority', 'student_nationality',
+    'pref_offsets', 'pref_school', 'pref_sem',
+    'program_school', 'program_sem', 'program_quota', 'program_min_gpa', 'program_seniority', 'program_has_major_incl',
+    'program_major_incl', 'program_major_excl', 'program_nationality_excl',
+    'program_group', 'group_parent', 'group_capacity', 'program_key', 'priority_ranks',
+    'school_programs', 'school_offsets', 'eligible', 'cand_offsets', 'cand_programs',
+]
+TABLES_FILE = 'tables.json'
+
+
+def file_digest(*paths):
+    """Hash of the contents of the given files, to tell whether a stored instance was built from them."""
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def save_instance(instance, directory, source=None):
+    """Write instance to directory (created if needed); source: optional file_digest() of the input files."""
+    os.makedirs(directory, exist_ok=True)
+    tables_path = os.path.join(directory, TABLES_FILE)
+    if os.path.exists(tables_path):
+        os.remove(tables_path)  # the directory is incomplete until the new tables are written
+    for name in ARRAY_FIELDS:
+        np.save(os.path.join(directory, f"{name}.npy"), getattr(instance, name))
+    tables = {
+        'source': source,
+        'student_names': instance.student_names,
+        'program_ids': instance.program_ids,
+        'group_names': instance.group_names,
+        'priority_keys': instance.priority_keys,
+        # every value table is numbered in insertion order, so a list of its values keeps the codes
+        'value_codes': {kind: list(table) for kind, table in instance.value_codes.items()},
+    }
+    temporary = os.path.join(directory, f"{TABLES_FILE}.tmp")
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(tables, f, ensure_ascii=False, default=lambda value: value.item())  # NumPy scalars from pandas
+    os.replace(temporary, tables_path)
+
+
+def stored_source(directory):
+    """The source digest a stored instance was saved with, or None if directory holds no complete instance."""
+    path = os.path.join(directory, TABLES_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['source']
+
+
+def load_instance(directory, mmap_mode='r'):
+    """
+    The CompiledInstance saved in directory, its arrays memory-mapped read-only (mmap_mode=None reads them
+    into memory). with_overrides() / with_changes() copy the arrays they change, so they work on it as usual.
+    """
+    with open(os.path.join(directory, TABLES_FILE), encoding='utf-8') as f:
+        tables = json.load(f)
+    instance = CompiledInstance.__new__(CompiledInstance)
+    for name in ARRAY_FIELDS:
+        setattr(instance, name, np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode))
+    instance.student_names = tables['student_names']
+    instance.program_ids = tables['program_ids']
+    instance.group_names = tables['group_names']
+    instance.priority_keys = [tuple(key) for key in tables['priority_keys']]
+    instance.value_codes = {kind: {value: code for code, value in enumerate(values)}
+                            for kind, values in tables['value_codes'].items()}
+    instance.school_names = tables['value_codes']['school']
+    instance.semester_names = tables['value_codes']['semester']
+    return instance
+
+
+def cached_instance(students, programs, directory, source):
+    """
+    The instance stored in directory if it was built from the same input files (source, see file_digest()),
+    otherwise compile_instance(students, programs), stored there for the next run.
+    """
+    if stored_source(directory) != source:
+        save_instance(compile_instance(students, programs), directory, source)
+    return load_instance(directory)
+
+
+@contextmanager
+def shared_instance(instance):
+    """Temporary directory holding instance, for the worker processes of a pool to load_instance(); removed on exit."""
+    with tempfile.TemporaryDirectory() as directory:
+        save_instance(instance, directory)
+        yield directory
@@ -0,0 +1,116 @@
+# This module runs "what if" scenarios on the NUS exchange allocation: the same cohort matched again
+# with some program quotas or minimum GPAs changed, e.g. "Waseda gets 2 more seats".
+# The input is compiled once (utils/sep_engine.py); each worker process memory-maps the stored compiled
+# instance (utils/sep_store.py) once and then receives only the small per-scenario overrides, and returns
+# one assignment array per scenario.
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from utils.sep_engine import compile_instance, run_deferred_acceptance, with_overrides
+from utils.sep_store import load_instance, shared_instance
+
+SWEEP_COLUMNS = ['Scenario', 'Matched', 'Newly Matched', 'Displaced', 'Changed Program', 'Unmatched',
+                 'Total Quota', 'Fill Rate', 'Fill Rate Delta']
+
+_instance = None  # base instance of the current worker process
+
+
+def _init_worker(instance):
+    """instance: a CompiledInstance, or the directory of a stored one (utils/sep_store.py), memory-mapped."""
+    global _instance
+    _instance = load_instance(instance) if isinstance(instance, str) else instance
+
+
+def _run_scenario(overrides):
+    quota, min_gpa = overrides
+    assignment, _ = run_deferred_acceptance(with_overrides(_instance, quota, min_gpa))
+    return assignment
+
+
+def scenario_grid(options):
+    """
+    Every combination of the given values, as a scenarios dict for sweep().
+    options: {ProgramID: {"quota": [...], "minGPA": [...]}}, either key may be left out.
+    """
+    axes = [[(program_id, field, value) for value in values]
+            for program_id, fields in options.items()
+            for field, values in fields.items()]
+    scenarios = {}
+    for combination in itertools.product(*axes):
+        overrides = {}
+        for program_id, field, value in combination:
+            overrides.setdefault(program_id, {})[field] = value
+        label = ", ".join(f"{program_id} {field}={value}" for program_id, field, value in combination)
+        scenarios[label] = overrides
+    return scenarios
+
+
+def _index_overrides(instance, overrides):
+    """Turn {ProgramID: {"quota": q, "minGPA": g}} into the program index dicts of with_overrides()."""
+    program_index = {program_id: p for p, program_id in enumerate(instance.program_ids)}
+    quota, min_gpa = {}, {}
+    for program_id, fields in overrides.items():
+        if program_id not in program_index:
+            raise ValueError(f"Unknown ProgramID {program_id!r} in scenario overrides")
+        for field, value in fields.items():
+            if field == "quota":
+                quota[program_index[program_id]] = int(value)
+            elif field == "minGPA":
+                min_gpa[program_index[program_id]] = value
+            else:
+                raise ValueError(f"Unknown override {field!r} for ProgramID {program_id!r}, expected 'quota' or 'minGPA'")
+    return quota, min_gpa
+
+
+def _outcome_row(label, base, assignment, quota):
+    matched = assignment >= 0
+    base_matched = base >= 0
+    total_quota = int(quota.sum())
+    return {
+        'Scenario': label,
+        'Matched': int(matched.sum()),
+        'Newly Matched': int((matched & ~base_matched).sum()),
+        'Displaced': int((base_matched & ~matched).sum()),
+        'Changed Program': int((matched & base_matched & (assignment != base)).sum()),
+        'Unmatched': int((~matched).sum()),
+        'Total Quota': total_quota,
+        'Fill Rate': matched.sum() / total_quota if total_quota else np.nan,
+    }
+
+
+def sweep(students, programs, scenarios, max_workers=None):
+    """
+    Match the cohort once as given and once per scenario, and compare every scenario with the base run.
+    scenarios: {label: {ProgramID: {"quota": q, "minGPA": g}}}, see scenario_grid(); a minGPA of None removes the floor.
+    max_workers: size of the process pool, 1 runs everything in this process.
+    Returns one row per scenario (the first row is the base run) with the columns in SWEEP_COLUMNS:
+    newly matched students were unmatched in the base run, displaced students lost their base seat
+    and changed-program students were matched to another program.
+    """
+    instance = compile_instance(students, programs)
+    labels = list(scenarios)
+    overrides = [_index_overrides(instance, scenarios[label]) for label in labels]
+
+    base, _ = run_deferred_acceptance(instance)
+    max_workers = max_workers or os.cpu_count()
+    if max_workers == 1 or len(overrides) <= 1:
+        _init_worker(instance)
+        assignments = [_run_scenario(o) for o in overrides]
+    else:
+        # workers memory-map one stored copy of the instance instead of each unpickling their own
+        with shared_instance(instance) as directory, \
+                ProcessPoolExecutor(max_workers, initializer=_init_worker, initargs=(directory,)) as executor:
+            assignments = list(executor.map(_run_scenario, overrides, chunksize=max(1, len(overrides) // (4 * max_workers))))
+
+    rows = [_outcome_row("base", base, base, instance.program_quota)]
+    for label, (quota, _), assignment in zip(labels, overrides, assignments):
+        scenario_quota = instance.program_quota.copy()
+        for p, value in quota.items():
+            scenario_quota[p] = value
+        rows.append(_outcome_row(label, base, assignment, scenario_quota))
+    results = pd.DataFrame(rows, columns=SWEEP_COLUMNS)
+    results['Fill Rate Delta'] = results['Fill Rate'] - results['Fill Rate'].iloc[0]
+    return results
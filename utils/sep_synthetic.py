@@ -0,0 +1,124 @@
+# This module generates synthetic SEP instances for load testing, in the same CSV layouts as the sample
+# files in data_sample/sep/: generate_nus() for utils/sep_nus.py and generate_sep() for utils/sep.py.
+# The same seed and parameters always give the same instance.
+#
+# skew:        how concentrated preferences are on popular schools (Zipf exponent, 0 = uniform)
+# tightness:   students per available seat; 1 means as many seats as students, 2 means half as many
+# eligibility: rough share of (student, program) pairs that meet the program requirements
+import numpy as np
+import pandas as pd
+
+MAJORS = ['Psychology', 'Comms & New Media', 'History', 'Political Sci', 'Economics', 'Geography',
+          'Sociology', 'Social Work', 'English Lit', 'Philosophy']
+RESIDENCIES = ['Singapore Citizen', 'Singapore Permanent Resident', 'Malaysia', 'China']
+STUDENT_SEMESTERS = ['Any available semester', 'NUS Sem 1', 'NUS Sem 2']
+PROGRAM_SEMESTERS = ['NUS Sem 1', 'NUS Sem 2']
+
+
+def _school_names(n_schools):
+    return [f"E{i:010d} - Synthetic University {i} (Country {i % 50})" for i in range(n_schools)]
+
+
+def _popularity(n_schools, skew):
+    weights = 1.0 / np.arange(1, n_schools + 1) ** skew
+    return weights / weights.sum()
+
+
+def _preferences(rng, n_students, popularity, prefs_per_student, chunk_size=20000):
+    """Ranked schools per student, drawn without replacement by popularity (Gumbel top-k), in chunks."""
+    k = min(prefs_per_student, len(popularity))
+    ranked = np.empty((n_students, k), dtype=np.int32)
+    log_weights = np.log(popularity)
+    for start in range(0, n_students, chunk_size):
+        stop = min(start + chunk_size, n_students)
+        keys = log_weights + rng.gumbel(size=(stop - start, len(popularity)))
+        top = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(keys, top, axis=1), axis=1)
+        ranked[start:stop] = np.take_along_axis(top, order, axis=1)
+    lengths = rng.integers(1, k + 1, size=n_students)  # not every student uses all choices
+    return ranked, lengths
+
+
+def _quotas(rng, n_seats, weights):
+    """Split n_seats over programs proportionally to weights, at least one seat each."""
+    quotas = rng.multinomial(max(n_seats - len(weights), 0), weights / weights.sum())
+    return quotas + 1
+
+
+def generate_nus(n_students, n_schools, programs_per_school=1.5, prefs_per_student=5,
+                 skew=1.0, tightness=1.5, eligibility=0.8, seed=0):
+    """Return (students_df, schools_df) in the layout of student_sample_nus.csv / school_sample_nus.csv."""
+    rng = np.random.default_rng(seed)
+    schools = np.array(_school_names(n_schools), dtype=object)
+    popularity = _popularity(n_schools, skew)
+
+    # programs: every school has one, the rest go to random schools
+    n_programs = max(n_schools, int(round(n_schools * programs_per_school)))
+    program_school = np.concatenate([np.arange(n_schools), rng.integers(0, n_schools, n_programs - n_schools)])
+    program_school.sort(kind='stable')
+    gpa = np.round(np.clip(rng.normal(4.3, 0.4, n_students), 2.0, 5.0), 2)
+
+    # a restricted program puts its GPA floor at a random GPA quantile; on average (1 - eligibility) of
+    # the students fall below it, spread over GPA floors, major lists and seniority
+    strictness = np.clip(rng.uniform(0, 2 * (1 - eligibility), n_programs), 0, 1)
+    min_gpa = np.where(strictness > 0.05, np.round(np.quantile(gpa, strictness), 2), np.nan)
+    restricted = rng.random(n_programs) < (1 - eligibility)
+    major_incl = [", ".join(rng.choice(MAJORS, 4, replace=False)) if r and rng.random() < 0.5 else np.nan for r in restricted]
+    major_excl = [rng.choice(MAJORS) if r and rng.random() < 0.3 else np.nan for r in restricted]
+    seniority = np.where(restricted & (rng.random(n_programs) < 0.2), 3.0, np.nan)
+    nationality_excl = np.where(rng.random(n_programs) < 0.05, 'China', None)
+    semester = np.where(rng.random(n_programs) < 0.5, rng.choice(PROGRAM_SEMESTERS, n_programs), None)
+
+    n_seats = int(round(n_students / tightness))
+    schools_df = pd.DataFrame({
+        'ProgramID': np.arange(1, n_programs + 1),
+        'SchoolName': schools[program_school],
+        'Semester': semester,
+        'Major (incl)': major_incl,
+        'Major (excl)': major_excl,
+        'Quota': _quotas(rng, n_seats, popularity[program_school]),
+        'minGPA': min_gpa,
+        'Seniority': seniority,
+        'Nationality (excl)': nationality_excl,
+    })
+
+    # students: one row per (student, choice), choices ranked by popularity-weighted draws
+    ranked, lengths = _preferences(rng, n_students, popularity, prefs_per_student)
+    student = np.repeat(np.arange(n_students), lengths)
+    rank = np.arange(len(student)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    names = np.array([f"{i:07d}X" for i in range(n_students)], dtype=object)
+    majors = rng.choice(MAJORS, n_students)
+    students_df = pd.DataFrame({
+        '*EmplID': names[student],
+        'Seniority': rng.choice([2, 3], n_students, p=[0.8, 0.2])[student],
+        'GPA': gpa[student],
+        'Total Score': np.round(gpa * 1.5 + rng.normal(0.6, 0.2, n_students), 2)[student],
+        'Destination Ranking': rank + 1,
+        '*Ext. Study Period': rng.choice(STUDENT_SEMESTERS, len(student)),
+        'Ext. Study Location': schools[ranked[student, rank]],
+        'Student Major': (pd.Series(majors, dtype=object) + ' (Hons)').to_numpy()[student],
+        'Singapore Residency Status': rng.choice(RESIDENCIES, n_students, p=[0.7, 0.1, 0.1, 0.1])[student],
+    })
+    return students_df, schools_df
+
+
+def generate_sep(n_students, n_schools, prefs_per_student=5, skew=1.0, tightness=1.5, eligibility=0.8, seed=0):
+    """Return (students_df, schools_df) in the layout of student_sample_en.csv / school_sample_en.csv."""
+    rng = np.random.default_rng(seed)
+    schools = np.array([f"school{i}" for i in range(1, n_schools + 1)], dtype=object)
+    popularity = _popularity(n_schools, skew)
+    gpa = np.round(np.clip(rng.normal(4.0, 0.5, n_students), 2.0, 5.0), 2)
+
+    strictness = np.clip(rng.uniform(0, 2 * (1 - eligibility), n_schools), 0, 1)
+    schools_df = pd.DataFrame({
+        'SchoolName': schools,
+        'Quota': _quotas(rng, int(round(n_students / tightness)), popularity),
+        'minGPA': np.where(strictness > 0.05, np.round(np.quantile(gpa, strictness), 2), np.nan),
+    })
+
+    ranked, lengths = _preferences(rng, n_students, popularity, prefs_per_student)
+    choices = np.where(np.arange(ranked.shape[1]) < lengths[:, None], schools[ranked], None)
+    students_df = pd.DataFrame({'StudentName': [f"student{i}" for i in range(1, n_students + 1)], 'GPA': gpa})
+    for i in range(ranked.shape[1]):
+        students_df[f"Choice{i + 1}"] = choices[:, i]
+    return students_df, schools_df
@@ -0,0 +1,257 @@
+# This module records the matching process of the SEP deferred acceptance engines.
+# Events are appended to a preallocated columnar buffer and turned into a DataFrame once at the end,
+# instead of calling pd.concat once per event.
+# Rejections are stored as reason codes with their parameters; readable text is only produced by
+# render_reasons() when the trace is shown or exported.
+# With a spill_path, a "full" trace is appended to a CSV file in chunks of chunk_size events while the
+# engine runs, so memory stays flat however long the trace gets; write_trace_csv() then renders it chunk
+# by chunk. The spill file holds the reason codes, not the rendered text, and can be read by any CSV tool.
+# filter_trace() / trace_page() select events chunk by chunk too, so a page viewer only renders what it shows.
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from utils.roster import BoundedRoster
+from utils.translations import translations_sep_reasons
+
+# values of the "Action" column
+TRACE_ACTIONS = ["proposed to", "rejected by"]
+
+# off: record nothing (bulk runs), summary: keep the final event of each student, full: every event
+TRACE_LEVELS = ["off", "summary", "full"]
+
+# code: key of translations_sep_reasons; value: its parameter (min GPA or quota);
+# cutoff: lowest accepted score after a quota rejection; snapshot: roster version listing the accepted students
+Reason = namedtuple("Reason", ["code", "value", "cutoff", "snapshot"], defaults=[None, None, None])
+
+SEMESTER_NOT_MET = Reason("semester")
+MAJOR_NOT_MET = Reason("major")
+SENIORITY_NOT_MET = Reason("seniority")
+NATIONALITY_NOT_MET = Reason("nationality")
+UNKNOWN_SCHOOL = Reason("unknown_school")
+
+# How far a matching run is, passed to the on_progress callback of the engines every progress_every steps
+# and once at the end (done). steps: students taken from the queue so far; total: the most a run can take,
+# one turn per preference entry plus a last one per student, so steps / total only gets close to 1
+Progress = namedtuple("Progress", ["steps", "total", "done"], defaults=[False])
+
+# Reason columns appended to every trace; "Program" is the key of the roster that rejected the student
+REASON_COLUMNS = {
+    'Reason Code': object,
+    'Reason Value': object,
+    'Program': object,
+    'Cutoff Score': np.float64,
+    'Roster Snapshot': object,
+}
+
+
+class TraceRecorder:
+    def __init__(self, columns, level="full", capacity=1024, spill_path=None, chunk_size=65536):
+        """
+        columns: dict of column name -> NumPy dtype, in output order. The first column identifies the
+            student and is the key used by the "summary" level. REASON_COLUMNS are added after them.
+        spill_path: file receiving the events of a "full" trace in chunks of chunk_size; the "summary"
+            level rewrites rows in place and always stays in memory (one row per student).
+        """
+        if level not in TRACE_LEVELS:
+            raise ValueError(f"Unknown trace level {level!r}, expected one of {TRACE_LEVELS}")
+        self.level = level
+        self._dtypes = {**columns, **REASON_COLUMNS}
+        self.columns = list(self._dtypes)
+        self._spill = open(spill_path, "w", encoding="utf-8", newline="") if spill_path is not None and level == "full" else None
+        self._spill_path = spill_path
+        self._chunk_size = chunk_size
+        self._spilled = 0
+        self._programs = {}  # text of every spilled "Program" key -> the key, as CSV keeps only the text
+        if self._spill is not None:
+            capacity = min(capacity, chunk_size)
+        self._buffer = {c: np.empty(capacity, dtype=dtype) for c, dtype in self._dtypes.items()}
+        self._size = 0
+        self._student_row = {}  # summary level: student -> row holding its latest event
+
+    @property
+    def enabled(self):
+        return self.level != "off"
+
+    @property
+    def full(self):
+        return self.level == "full"
+
+    def __len__(self):
+        return self._spilled + self._size
+
+    def _grow(self):
+        capacity = 2 * len(self._buffer[self.columns[0]])
+        for c in self.columns:
+            buffer = np.empty(capacity, dtype=self._dtypes[c])
+            buffer[:self._size] = self._buffer[c][:self._size]
+            self._buffer[c] = buffer
+
+    def record(self, *values, reason=None, program=None):
+        """Append one event; values are given in column order, reason is the Reason of a rejection."""
+        if self.level == "off":
+            return
+        if reason is None:
+            values += (None, None, None, None, None)
+        else:
+            values += (reason.code, reason.value, program, reason.cutoff, reason.snapshot)
+        if self.level == "summary":
+            row = self._student_row.get(values[0])
+            if row is None:
+                row = self._student_row[values[0]] = self._next_row()
+        else:
+            row = self._next_row()
+        for c, value in zip(self.columns, values):
+            self._buffer[c][row] = np.nan if value is None and self._dtypes[c] == np.float64 else value
+
+    def _next_row(self):
+        if self._spill is not None and self._size == self._chunk_size:
+            self._flush()
+        if self._size == len(self._buffer[self.columns[0]]):
+            self._grow()
+        self._size += 1
+        return self._size - 1
+
+    def _flush(self):
+        """Append the buffered events to the spill file as one CSV chunk and empty the buffer."""
+        if self._size:
+            chunk = self.to_dataframe()
+            self._programs.update((str(program), program) for program in chunk['Program'].dropna().unique())
+            chunk.to_csv(self._spill, index=False, header=not self._spilled)
+            self._spilled += self._size
+            self._size = 0
+
+    def to_dataframe(self):
+        """Build the matching process DataFrame in one step (only the buffered events once spilling)."""
+        return pd.DataFrame({c: self._buffer[c][:self._size] for c in self.columns}, columns=self.columns)
+
+    def finish(self):
+        """The recorded trace: a DataFrame, or a SpilledTrace when the events went to spill_path."""
+        if self._spill is None:
+            return self.to_dataframe()
+        self._flush()
+        self._spill.close()
+        return SpilledTrace(self._spill_path, self._dtypes, self._spilled, self._chunk_size, self._programs)
+
+
+class SpilledTrace:
+    """A matching process written to disk by TraceRecorder, read back one chunk (DataFrame) at a time."""
+    def __init__(self, path, dtypes, n_rows, chunk_size=65536, programs=None):
+        self.path = path
+        self._dtypes = dtypes
+        self.columns = list(dtypes)
+        self.n_rows = n_rows
+        self.chunk_size = chunk_size
+        self._programs = programs or {}
+
+    def __len__(self):
+        return self.n_rows
+
+    def chunks(self):
+        if not self.n_rows:
+            return
+        # text columns are read as written (no number parsing of names, empty cells only are missing);
+        # values that are numbers in the engine's trace are turned back into numbers
+        dtypes = {c: (str if dtype == object else dtype) for c, dtype in self._dtypes.items()}
+        with pd.read_csv(self.path, dtype=dtypes, keep_default_na=False, na_values=[""], chunksize=self.chunk_size) as reader:
+            for chunk in reader:
+                chunk = chunk.astype(object).where(chunk.notna(), None).astype(
+                    {c: dtype for c, dtype in self._dtypes.items() if dtype != object})
+                chunk['Program'] = chunk['Program'].map(self._programs.get)
+                chunk['Roster Snapshot'] = pd.Series([None if v is None else int(v) for v in chunk['Roster Snapshot']],
+                                                     index=chunk.index, dtype=object)
+                yield chunk
+
+    def to_dataframe(self):
+        """The whole trace in memory, as TraceRecorder.to_dataframe() would have built it."""
+        chunks = list(self.chunks())
+        if not chunks:
+            return pd.DataFrame({c: np.empty(0, dtype=dtype) for c, dtype in self._dtypes.items()}, columns=self.columns)
+        return pd.concat(chunks, ignore_index=True)
+
+
+def render_reasons(trace_df, rosters, lang_code="en", replayed=None):
+    """
+    Replace the reason code columns of a trace by a readable "Reason" column.
+    rosters maps the "Program" key of each rejection to its BoundedRoster; the accepted students of a
+    quota rejection are rebuilt from the roster history, one pass per roster.
+    replayed: optional dict of partly replayed rosters carried from one chunk of a trace to the next, so
+    consecutive chunks continue the replay instead of starting it over.
+    """
+    templates = translations_sep_reasons[lang_code]
+    reason = pd.Series(None, index=trace_df.index, dtype=object)
+    codes = trace_df['Reason Code']
+    for code in codes.dropna().unique():
+        rows = trace_df[codes == code]
+        if code != "quota":
+            reason[rows.index] = [templates[code].format(value=value) for value in rows['Reason Value']]
+            continue
+        for program, program_rows in rows.groupby('Program', sort=False):
+            replay = None if replayed is None else replayed.setdefault(program, BoundedRoster(rosters[program].capacity, history=True))
+            views = rosters[program].replay(program_rows['Roster Snapshot'], replay)
+            reason[program_rows.index] = [
+                templates[code].format(value=value, roster=[(name, score) for score, name in views[snapshot]])
+                for value, snapshot in zip(program_rows['Reason Value'], program_rows['Roster Snapshot'])
+            ]
+    rendered = trace_df.drop(columns=list(REASON_COLUMNS))
+    rendered['Reason'] = reason
+    return rendered
+
+
+def _trace_chunks(trace):
+    return trace.chunks() if isinstance(trace, SpilledTrace) else [trace]
+
+
+def filter_trace(trace, student="", school="", action=None, reasons=()):
+    """
+    Chunks of a trace (DataFrame or SpilledTrace) with only the events matching every given filter,
+    indexed by event number. student / school: case-insensitive part of the name (the first column /
+    "School Name"); action: one of TRACE_ACTIONS; reasons: reason codes to keep.
+    """
+    start = 0
+    for chunk in _trace_chunks(trace):
+        chunk = chunk.set_axis(pd.RangeIndex(start, start + len(chunk)))
+        start += len(chunk)
+        keep = np.ones(len(chunk), dtype=bool)
+        if student:
+            keep &= chunk.iloc[:, 0].astype(str).str.contains(student, case=False, regex=False).to_numpy()
+        if school:
+            keep &= chunk['School Name'].astype(str).str.contains(school, case=False, regex=False).to_numpy()
+        if action:
+            keep &= (chunk['Action'] == action).to_numpy()
+        if len(reasons):
+            keep &= chunk['Reason Code'].isin(reasons).to_numpy()
+        yield chunk[keep]
+
+
+def trace_page(trace, page, page_size, **filters):
+    """
+    (events, n_matches): page number `page` (from 0) of the events matching filter_trace(**filters),
+    with their reason codes, and the number of matching events in the whole trace.
+    """
+    first, last = page * page_size, (page + 1) * page_size
+    parts, n_matches = [], 0
+    for chunk in filter_trace(trace, **filters):
+        if n_matches < last and first < n_matches + len(chunk):
+            parts.append(chunk.iloc[max(first - n_matches, 0):last - n_matches])
+        elif not parts:
+            parts.append(chunk.iloc[:0])
+        n_matches += len(chunk)
+    if not parts:  # a spilled trace without any event
+        parts.append(trace.to_dataframe())
+    return pd.concat(parts), n_matches
+
+
+def write_trace_csv(trace, rosters, path, lang_code="en", encoding="utf-8"):
+    """
+    Write a trace (DataFrame or SpilledTrace) with readable reasons to a CSV file, one chunk at a time.
+    The chunks of a SpilledTrace are in event order, so every roster is replayed once overall.
+    """
+    replayed = {}
+    with open(path, "w", encoding=encoding, newline="") as out:
+        header = True
+        for chunk in _trace_chunks(trace):
+            render_reasons(chunk, rosters, lang_code, replayed).to_csv(out, index=False, header=header)
+            header = False
+        if header:  # no events at all
+            render_reasons(trace.to_dataframe(), rosters, lang_code).to_csv(out, index=False)
@@ -0,0 +1,194 @@
+# This module checks the uploaded SEP files before any Student / School / Program object is built, so a
+# bad file is rejected at once instead of failing halfway through a matching run.
+# Every check runs on whole columns (numeric conversion, duplicated(), isin() against the school names)
+# and returns one row per problem with the line number in the CSV file, the header being line 1.
+#
+# layout "sep": one row per student with Choice1..N columns (utils/sep.py), English or Chinese headers
+# layout "nus": one row per student and destination, programs keyed by ProgramID (utils/sep_nus.py)
+#
+# Errors would crash a run or silently lose data; warnings are handled by the engines but are probably
+# mistakes, e.g. a choice of a school that is not in the school file, which the engines treat as a rejection.
+import numpy as np
+import pandas as pd
+from utils.sep_priority import DEFAULT_PRIORITY, PRIORITY_COLUMNS, parse_priority
+
+VALIDATION_COLUMNS = ['File', 'Row', 'Column', 'Value', 'Severity', 'Problem']
+ERROR, WARNING = 'error', 'warning'
+
+# column names per layout and language
+COLUMNS = {
+    ('sep', 'en'): {'student': 'StudentName', 'gpa': 'GPA', 'choice': 'Choice',
+                    'school': 'SchoolName', 'quota': 'Quota', 'min_gpa': 'minGPA'},
+    ('sep', 'zh'): {'student': '姓名', 'gpa': 'GPA', 'choice': '选择',
+                    'school': '学校名称', 'quota': '名额', 'min_gpa': '最低绩点'},
+    ('nus', 'en'): {'student': '*EmplID', 'gpa': 'GPA', 'score': 'Total Score', 'ranking': 'Destination Ranking',
+                    'location': 'Ext. Study Location', 'program': 'ProgramID',
+                    'school': 'SchoolName', 'quota': 'Quota', 'min_gpa': 'minGPA', 'seniority': 'Seniority'},
+}
+NUS_STUDENT_COLUMNS = ['*EmplID', 'Seniority', 'GPA', 'Total Score', 'Destination Ranking', '*Ext. Study Period',
+                       'Ext. Study Location', 'Student Major', 'Singapore Residency Status']
+NUS_PROGRAM_COLUMNS = ['ProgramID', 'SchoolName', 'Semester', 'Major (incl)', 'Major (excl)', 'Quota', 'minGPA',
+                       'Seniority', 'Nationality (excl)']
+
+
+def _issues(file, df, flagged, column, severity, problem):
+    """Rows of the problem table for the flagged rows of df."""
+    flagged = np.asarray(flagged, dtype=bool)
+    return pd.DataFrame({
+        'File': file,
+        'Row': np.flatnonzero(flagged) + 2,
+        'Column': column,
+        'Value': df[column].to_numpy()[flagged] if column in df else None,
+        'Severity': severity,
+        'Problem': problem,
+    }, columns=VALIDATION_COLUMNS)
+
+
+def _combine(parts):
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return pd.DataFrame(columns=VALIDATION_COLUMNS)
+    return pd.concat(parts, ignore_index=True)
+
+
+def _missing_columns(file, df, columns):
+    missing = [column for column in columns if column not in df.columns]
+    return pd.DataFrame({'File': file, 'Row': 1, 'Column': missing, 'Value': None, 'Severity': ERROR,
+                         'Problem': 'missing column'}, columns=VALIDATION_COLUMNS)
+
+
+def _numeric(file, df, column, required=True, integer=False, non_negative=False):
+    """Checks of a numeric column: not a number, missing (if required), negative, not a whole number."""
+    raw = df[column]
+    values = pd.to_numeric(raw, errors='coerce')
+    parts = [_issues(file, df, raw.notna() & values.isna(), column, ERROR, 'not a number')]
+    if required:
+        parts.append(_issues(file, df, raw.isna(), column, ERROR, 'missing value'))
+    if non_negative:
+        parts.append(_issues(file, df, values < 0, column, ERROR, 'negative value'))
+    if integer:
+        parts.append(_issues(file, df, values.notna() & (values != values.round()), column, ERROR, 'not a whole number'))
+    return parts
+
+
+def _required(file, df, column):
+    return _issues(file, df, df[column].isna(), column, ERROR, 'missing value')
+
+
+def _duplicated(file, df, columns, severity, problem):
+    flagged = df.duplicated(columns, keep='first') & df[columns].notna().all(axis=1)
+    return _issues(file, df, flagged, columns[-1], severity, problem)
+
+
+def _shared_caps(file, df):
+    """Checks of the optional School Quota / Semester Quota columns (utils/sep_capacity.py): whole numbers, one value per group."""
+    parts = []
+    for column, group in (('School Quota', ['SchoolName']), ('Semester Quota', ['SchoolName', 'Semester'])):
+        if column not in df:
+            continue
+        parts += _numeric(file, df, column, required=False, integer=True, non_negative=True)
+        values = pd.to_numeric(df[column], errors='coerce')
+        given = values.notna() & df[group].notna().all(axis=1)
+        n_values = values[given].groupby([df.loc[given, c] for c in group]).transform('nunique')
+        conflicting = pd.Series(False, index=df.index)
+        conflicting[n_values.index] = n_values > 1
+        parts.append(_issues(file, df, conflicting, column, ERROR, f"different {column} in rows of the same {' and '.join(group)}"))
+    return parts
+
+
+def _priority(file, df):
+    """Checks of the optional Priority column (utils/sep_priority.py): known student columns, one key per cap group."""
+    if 'Priority' not in df:
+        return []
+    keys = df['Priority'].map(parse_priority)
+    unknown = keys.map(lambda key: key is not None and any(column not in PRIORITY_COLUMNS for column in key))
+    parts = [_issues(file, df, unknown, 'Priority', ERROR, f"unknown student column, use {', '.join(PRIORITY_COLUMNS)}")]
+    # programs sharing a school / semester cap compete for the same seats, so they must rank students alike
+    normalized = keys.map(lambda key: ', '.join(key or DEFAULT_PRIORITY))
+    for column, group in (('School Quota', ['SchoolName']), ('Semester Quota', ['SchoolName', 'Semester'])):
+        if column not in df:
+            continue
+        in_group = df[group].notna().all(axis=1)
+        by_group = [df.loc[in_group, c] for c in group]
+        capped = pd.to_numeric(df.loc[in_group, column], errors='coerce').notna().groupby(by_group).transform('any')
+        n_keys = normalized[in_group].groupby(by_group).transform('nunique')
+        conflicting = pd.Series(False, index=df.index)
+        conflicting[n_keys.index] = capped & (n_keys > 1)
+        parts.append(_issues(file, df, conflicting, 'Priority', ERROR, f"different Priority in rows sharing a {column}"))
+    return parts
+
+
+def validate_students(students_df, layout='nus', lang_code='en'):
+    """Problems of the student file alone, with the columns in VALIDATION_COLUMNS."""
+    columns = COLUMNS[(layout, lang_code)]
+    required = NUS_STUDENT_COLUMNS if layout == 'nus' else [columns['student'], columns['gpa']]
+    missing = _missing_columns('students', students_df, required)
+    if len(missing):
+        return missing
+
+    parts = [_required('students', students_df, columns['student'])]
+    parts += _numeric('students', students_df, columns['gpa'])
+    if layout == 'nus':
+        parts += _numeric('students', students_df, columns['score'])
+        parts += _numeric('students', students_df, columns['ranking'], integer=True)
+        parts.append(_required('students', students_df, columns['location']))
+        parts.append(_duplicated('students', students_df, [columns['student'], columns['ranking']], WARNING,
+                                 'destination ranking used twice by this student'))
+    else:
+        if not any(column.startswith(columns['choice']) for column in students_df.columns):
+            parts.append(_missing_columns('students', students_df, [columns['choice'] + '1']))
+        parts.append(_duplicated('students', students_df, [columns['student']], ERROR, 'duplicate student'))
+    return _combine(parts)
+
+
+def validate_schools(schools_df, layout='nus', lang_code='en'):
+    """Problems of the school (program) file alone, with the columns in VALIDATION_COLUMNS."""
+    columns = COLUMNS[(layout, lang_code)]
+    required = NUS_PROGRAM_COLUMNS if layout == 'nus' else [columns['school'], columns['quota'], columns['min_gpa']]
+    missing = _missing_columns('schools', schools_df, required)
+    if len(missing):
+        return missing
+
+    parts = [_required('schools', schools_df, columns['school'])]
+    parts += _numeric('schools', schools_df, columns['quota'], integer=True, non_negative=True)
+    parts += _numeric('schools', schools_df, columns['min_gpa'], required=False)
+    if layout == 'nus':
+        parts.append(_required('schools', schools_df, columns['program']))
+        parts.append(_duplicated('schools', schools_df, [columns['program']], ERROR, 'duplicate ProgramID'))
+        parts += _numeric('schools', schools_df, columns['seniority'], required=False)
+        parts += _shared_caps('schools', schools_df)
+        parts += _priority('schools', schools_df)
+    else:
+        parts.append(_duplicated('schools', schools_df, [columns['school']], ERROR, 'duplicate school'))
+    return _combine(parts)
+
+
+def validate_choices(students_df, schools_df, layout='nus', lang_code='en'):
+    """Student choices of schools that are not in the school file (both files must have their columns)."""
+    columns = COLUMNS[(layout, lang_code)]
+    known = pd.Index(schools_df[columns['school']].dropna().unique())
+    if layout == 'nus':
+        location = students_df[columns['location']]
+        return _issues('students', students_df, location.notna() & ~location.isin(known), columns['location'],
+                       WARNING, 'school not in the school file')
+    parts = []
+    for column in [c for c in students_df.columns if c.startswith(columns['choice'])]:
+        choice = students_df[column]
+        stripped = choice.astype(str).str.strip().where(choice.notna())  # utils.sep.Student strips its choices
+        parts.append(_issues('students', students_df, stripped.notna() & ~stripped.isin(known), column,
+                             WARNING, 'school not in the school file'))
+    return _combine(parts)
+
+
+def validate(students_df, schools_df, layout='nus', lang_code='en'):
+    """All checks of both files; choices are only checked when both files have the needed columns."""
+    students_issues = validate_students(students_df, layout, lang_code)
+    schools_issues = validate_schools(schools_df, layout, lang_code)
+    parts = [students_issues, schools_issues]
+    if not (students_issues['Problem'] == 'missing column').any() and not (schools_issues['Problem'] == 'missing column').any():
+        parts.append(validate_choices(students_df, schools_df, layout, lang_code))
+    return _combine(parts)
+
+
+def has_errors(issues):
+    return bool((issues['Severity'] == ERROR).any())
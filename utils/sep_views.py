@@ -0,0 +1,125 @@
+# This module contains the Streamlit widgets of the SEP pages. The engines in utils/sep.py and
+# utils/sep_nus.py do not import Streamlit; the pages show their results with the widgets defined here.
+import math
+import os
+import tempfile
+from contextlib import contextmanager
+
+import streamlit as st
+from utils.sep_trace import TRACE_ACTIONS, render_reasons, trace_page, write_trace_csv
+from utils.sep_validation import has_errors
+from utils.translations import translations_sep as translations, translations_sep_reason_labels
+
+TRACE_PAGE_SIZES = [25, 50, 100, 200]
+
+
+def trace_spill_path(trace_level):
+    """
+    Temporary file a "full" trace is streamed to while the engine runs (deferred_acceptance trace_path), else None.
+    The trace viewer reads it after the run, so the file of the previous run of the session is removed here.
+    """
+    previous = st.session_state.pop("sep_trace_path", None)
+    if previous is not None and os.path.exists(previous):
+        os.remove(previous)
+    if trace_level != "full":
+        return None
+    handle, path = tempfile.mkstemp(suffix=".trace")
+    os.close(handle)
+    st.session_state["sep_trace_path"] = path
+    return path
+
+
+@contextmanager
+def trace_csv(trace, rosters, lang_code="en"):
+    """
+    Open binary handle of a trace rendered chunk by chunk to a temporary file, for the "Download Matching
+    Processes" button; the file is removed on leaving the block.
+    """
+    handle, path = tempfile.mkstemp(suffix=".csv")
+    os.close(handle)
+    try:
+        write_trace_csv(trace, rosters, path, lang_code)
+        with open(path, "rb") as f:
+            yield f
+    finally:
+        os.remove(path)
+
+
+def progress_bar(lang_code="en"):
+    """
+    Show a progress bar for a matching run and return the on_progress callback of the engines that moves
+    it; the bar is removed when the run is done.
+    """
+    label = translations[lang_code]["matching_progress"]
+    bar = st.progress(0.0, text=label)
+
+    def on_progress(progress):
+        if progress.done:
+            bar.empty()
+        else:
+            bar.progress(min(progress.steps / max(progress.total, 1), 1.0), text=label)
+    return on_progress
+
+
+@st.fragment
+def trace_download(trace, rosters, lang_code="en"):
+    """
+    Download button for the matching process. The readable CSV is rendered only once asked for, so reruns
+    of the page do not pay for a trace nobody downloads.
+    """
+    text = translations[lang_code]
+    if not len(trace):
+        return
+    if st.button(text["trace_prepare"]):
+        # the button is given the file itself, so the page never holds a copy of the rendered CSV
+        with trace_csv(trace, rosters, lang_code) as f:
+            st.download_button(
+                text["download_trace"],
+                f,
+                "matching_processes.csv",
+                "text/csv",
+                on_click="ignore"
+            )
+
+
+@st.fragment
+def trace_viewer(trace, rosters, lang_code="en"):
+    """
+    The matching process as one paged table with filters by student, school, action and reason.
+    Filtering runs on the trace (DataFrame or SpilledTrace) on the server and only the shown page gets
+    readable reasons, so the page costs the same however many events there are. Runs as a fragment:
+    changing a filter or the page does not rerun the matching.
+    """
+    if not len(trace):
+        return
+    text = translations[lang_code]
+    with st.expander(text["trace_viewer"]):
+        col1, col2, col3, col4 = st.columns(4)
+        student = col1.text_input(text["trace_student"])
+        school = col2.text_input(text["trace_school"])
+        action = col3.selectbox(text["trace_action"], [None] + TRACE_ACTIONS, format_func=lambda a: a or text["trace_all"])
+        labels = translations_sep_reason_labels[lang_code]
+        reasons = col4.multiselect(text["trace_reason"], list(labels), format_func=labels.get)
+        col1, col2 = st.columns(2)
+        page_size = col1.selectbox(text["trace_page_size"], TRACE_PAGE_SIZES, index=1)
+        page = col2.number_input(text["trace_page"], min_value=1, value=1)
+
+        filters = dict(student=student, school=school, action=action, reasons=reasons)
+        events, n_matches = trace_page(trace, page - 1, page_size, **filters)
+        n_pages = max(math.ceil(n_matches / page_size), 1)
+        if page > n_pages:  # the filters left fewer pages: show the last one
+            page = n_pages
+            events, n_matches = trace_page(trace, page - 1, page_size, **filters)
+        st.dataframe(render_reasons(events, rosters, lang_code))
+        st.caption(text["trace_page_info"].format(n_matches, len(trace), page, n_pages))
+
+
+def validation_panel(issues, lang_code="en"):
+    """Show the problems found by utils.sep_validation, if any. Returns True when a file must be fixed first."""
+    if not len(issues):
+        return False
+    blocking = has_errors(issues)
+    message = translations[lang_code]["validation_errors" if blocking else "validation_warnings"]
+    (st.error if blocking else st.warning)(message)
+    st.dataframe(issues, hide_index=True)
+    return blocking
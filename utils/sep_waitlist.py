@@ -0,0 +1,129 @@
+# This module runs waitlist rounds after the SEP deferred acceptance run (utils/sep_nus.py): the rosters
+# of the earlier rounds are frozen, and only the students still unmatched propose again, to the seats
+# that are left. Every round reuses the compiled instance (utils/sep_engine.py) with the remaining quotas;
+# only widened rounds rebuild the candidate lists, and only for the waitlisted students.
+#
+# With widen=False a waitlist round uses the students' own choices. It can still place students, because
+# a student displaced from a program moves on to their next school without trying the school's other
+# programs. With widen=True every school with seats left is appended to the choices of the waitlisted
+# students, most remaining seats first, for the semester of their first choice.
+import copy
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from utils.sep_capacity import group_counts
+from utils.sep_engine import MatchingState, advance, build_candidates, compile_instance, matching_result
+
+WAITLIST_COLUMNS = ['Student', 'Round', 'ProgramID', 'SchoolName', 'Student preferred semester']
+
+
+def _widened_preferences(instance, students, remaining):
+    """
+    Preference CSR (offsets, schools, semesters) where the given students keep their choices followed by
+    every other school with seats left, and all other students have none.
+    """
+    seats = np.bincount(instance.program_school, weights=np.maximum(remaining, 0), minlength=len(instance.school_names))
+    open_schools = np.argsort(-seats, kind='stable')[:np.count_nonzero(seats)].astype(np.int32)
+
+    starts, ends = instance.pref_offsets[students], instance.pref_offsets[students + 1]
+    own_length = ends - starts
+    row = np.repeat(np.arange(len(students)), own_length)
+    entries = np.arange(own_length.sum()) - np.repeat(np.cumsum(own_length) - own_length, own_length) + np.repeat(starts, own_length)
+    listed = np.zeros((len(students), len(instance.school_names)), dtype=bool)
+    listed[row, instance.pref_school[entries]] = True
+    extra = ~listed[:, open_schools]
+    extra_length = extra.sum(axis=1)
+    first_sem = np.where(own_length > 0, instance.pref_sem[np.minimum(starts, len(instance.pref_sem) - 1)], 0)
+
+    lengths = np.zeros(instance.n_students, dtype=np.int32)
+    lengths[students] = own_length + extra_length
+    offsets = np.zeros(instance.n_students + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    pref_school = np.empty(offsets[-1], dtype=np.int32)
+    pref_sem = np.empty(offsets[-1], dtype=np.int32)
+
+    # own choices first, then the appended schools
+    own_slot = entries - np.repeat(starts, own_length) + np.repeat(offsets[students], own_length)
+    pref_school[own_slot] = instance.pref_school[entries]
+    pref_sem[own_slot] = instance.pref_sem[entries]
+    extra_row = np.repeat(np.arange(len(students)), extra_length)
+    extra_slot = (np.arange(extra_length.sum()) - np.repeat(np.cumsum(extra_length) - extra_length, extra_length)
+                  + np.repeat(offsets[students] + own_length, extra_length))
+    pref_school[extra_slot] = np.broadcast_to(open_schools, extra.shape)[extra]
+    pref_sem[extra_slot] = first_sem[extra_row]
+    return offsets, pref_school, pref_sem
+
+
+def waitlist_rounds(instance, assignment, roster_ids, n_rounds=1, widen=False, priority=None):
+    """
+    Run up to n_rounds waitlist rounds on top of a finished matching (assignment, roster_ids), as returned
+    by run_deferred_acceptance; the inputs are not modified.
+    Returns (assignment, roster_ids, placed_round, placed_sem): placed_round is 1 for students matched
+    before, r for students placed in waitlist round r (2, 3, ...) and -1 for students still unmatched;
+    placed_sem is the semester code of the choice a waitlisted student was placed through, -1 otherwise.
+    New students join the end of the frozen rosters. Stops early when a round places nobody.
+    """
+    assignment = np.array(assignment, dtype=np.int32)
+    roster_ids = [list(ids) for ids in roster_ids]
+    placed_round = np.where(assignment >= 0, 1, -1)
+    placed_sem = np.full(instance.n_students, -1, dtype=np.int32)
+
+    for r in range(2, n_rounds + 2):
+        remaining = instance.program_quota - np.array([len(ids) for ids in roster_ids], dtype=np.int32)
+        waiting = np.flatnonzero(assignment < 0)
+        if not len(waiting) or not (remaining > 0).any():
+            break
+        round_instance = copy.copy(instance)
+        round_instance.program_quota = np.maximum(remaining, 0).astype(np.int32)
+        filled = group_counts(instance.program_group, instance.group_parent, [len(ids) for ids in roster_ids])
+        round_instance.group_capacity = np.maximum(instance.group_capacity - filled, 0).astype(np.int32)
+        if widen:
+            round_instance.pref_offsets, round_instance.pref_school, round_instance.pref_sem = \
+                _widened_preferences(instance, waiting, remaining)
+            round_instance.cand_offsets, round_instance.cand_programs = build_candidates(round_instance)
+
+        state = MatchingState(round_instance)
+        state.queue = deque(waiting.tolist())  # frozen students never propose
+        round_assignment, round_rosters = matching_result(round_instance, advance(round_instance, state, priority=priority))
+        placed = np.flatnonzero(round_assignment >= 0)
+        if not len(placed):
+            break
+        assignment[placed] = round_assignment[placed]
+        placed_round[placed] = r
+        placed_sem[placed] = round_instance.pref_sem[np.array(state.next_pref)[placed] - 1]
+        for p, ids in enumerate(round_rosters):
+            roster_ids[p].extend(ids)
+    return assignment, roster_ids, placed_round, placed_sem
+
+
+def run_waitlist(students, programs, student_assignments, program_enrollments, n_rounds=1, widen=False, instance=None):
+    """
+    Waitlist rounds after utils.sep_nus.deferred_acceptance (or a hand-edited result in the same form).
+    instance: the compile_instance(students, programs) of the run, compiled here if not given.
+    Returns updated (student_assignments, program_enrollments) dicts and a DataFrame with the columns in
+    WAITLIST_COLUMNS listing the students placed by the waitlist rounds.
+    """
+    instance = instance if instance is not None else compile_instance(students, programs)
+    program_index = {program_id: p for p, program_id in enumerate(instance.program_ids)}
+    student_index = {name: s for s, name in enumerate(instance.student_names)}
+    assignment = np.array([program_index[student_assignments[name]] if student_assignments.get(name) is not None else -1
+                           for name in instance.student_names], dtype=np.int32)
+    roster_ids = [[student_index[name] for name in program_enrollments.get(program_id, [])] for program_id in instance.program_ids]
+
+    assignment, roster_ids, placed_round, placed_sem = waitlist_rounds(instance, assignment, roster_ids, n_rounds, widen)
+
+    student_assignments = {name: (instance.program_ids[p] if p >= 0 else None)
+                           for name, p in zip(instance.student_names, assignment.tolist())}
+    program_enrollments = {program_id: [instance.student_names[s] for s in ids]
+                           for program_id, ids in zip(instance.program_ids, roster_ids)}
+    waitlisted = np.flatnonzero(placed_round > 1)
+    semester_names = np.asarray(instance.semester_names + [np.nan], dtype=object)  # code -1: no semester
+    waitlist_df = pd.DataFrame({
+        'Student': [instance.student_names[s] for s in waitlisted],
+        'Round': placed_round[waitlisted],
+        'ProgramID': [instance.program_ids[p] for p in assignment[waitlisted]],
+        'SchoolName': [programs[instance.program_ids[p]].schoolName for p in assignment[waitlisted]],
+        'Student preferred semester': semester_names[placed_sem[waitlisted]],
+    }, columns=WAITLIST_COLUMNS)
+    return student_assignments, program_enrollments, waitlist_df
@@ -36,8 +36,38 @@ translations_sep = {
         "school_preview:": "School Enrollments Preview:",
         "download_students": "Download Student Assignments",
         "download_schools": "Download School Enrollments",
+        "trace_prepare": "Prepare Matching Processes Download",
+        "matching_progress": "Matching in progress...",
+        "download_trace": "Download Matching Processes",
         "error_message": "Please upload both student and school data files.",
-        "success_message": "Matching completed!"
+        "success_message": "Matching completed!",
+        "trace_level": "Matching process detail ('off' is fastest for large files, 'summary' keeps each student's final step)",
+        "mechanisms": "Also compare with other mechanisms (DA: deferred acceptance, Boston: immediate acceptance, TTC: top trading cycles)",
+        "mechanism_preview:": "Assignments under each mechanism:",
+        "unmatched": "Unmatched",
+        "waitlist_rounds": "Waitlist rounds: unmatched students propose again to the seats left, the rosters of earlier rounds are kept",
+        "widen_preferences": "Widen the choices of waitlisted students to every school with seats left",
+        "waitlist_placed": "{} students were placed in the waitlist rounds (see the Round column).",
+        "validation_errors": "The file has problems that must be fixed before matching (Row is the line in the CSV file):",
+        "validation_warnings": "Please check these entries; the matching can still run (Row is the line in the CSV file):",
+        "trace_viewer": "See detailed matching process",
+        "trace_student": "Student contains",
+        "trace_school": "School contains",
+        "trace_action": "Action",
+        "trace_all": "all",
+        "trace_reason": "Rejection reason",
+        "trace_page_size": "Rows per page",
+        "trace_page": "Page",
+        "trace_page_info": "{} of {} events match, page {} of {}.",
+        "cutoffs": "Program cutoffs and quota sensitivity",
+        "cutoffs_desc": "Cutoff is the lowest-ranked student enrolled in each program, given in the columns of its Priority (total score unless the school file sets another key). The second table shows who a few more seats would admit, from the students each program turned away for quota (without the moves this would cause elsewhere).",
+        "audit": "Step 4: Check an Edited Assignment (Optional)",
+        "audit_desc": "Upload the downloaded student assignments after editing the 'Assigned ProgramID' column. The student and school data of Steps 1 and 2 are used for the check.",
+        "audit_stable": "The edits cause no problem: every student is eligible, no program quota or school / semester cap is exceeded and the edits create no blocking pair.",
+        "audit_issues": "Problems caused by the edits:",
+        "audit_engine": "{} problems already in the unedited matching result",
+        "audit_engine_desc": "These blocking pairs are in the result of the matching itself, before any edit: a student displaced from a program moves on to their next school without trying the school's other programs. They are not caused by the edits.",
+        "download_audit": "Download Check Results"
     },
     "zh": {
         "title": "交换生项目匹配助手",
@@ -52,8 +82,38 @@ translations_sep = {
         "school_preview:": "学校招生结果预览:",
         "download_students": "下载学生分配结果",
         "download_schools": "下载学校招生情况",
+        "trace_prepare": "准备下载匹配过程",
+        "matching_progress": "正在匹配……",
+        "download_trace": "下载匹配过程",
         "error_message": "请上传学生和学校数据文件。",
-        "success_message": "匹配完成！"
+        "success_message": "匹配完成！",
+        "trace_level": "匹配过程记录（off 最快，适合大文件；summary 只保留每位学生的最后一步）",
+        "mechanisms": "同时比较其他匹配机制（DA：延迟接受，Boston：即时接受，TTC：首位交易循环）",
+        "mechanism_preview:": "各机制下的分配结果：",
+        "unmatched": "未匹配",
+        "waitlist_rounds": "候补轮次：未匹配的学生对剩余名额再次申请，之前各轮的录取结果保持不变",
+        "widen_preferences": "将候补学生的志愿扩展到所有仍有名额的学校",
+        "waitlist_placed": "{} 名学生在候补轮次中被录取（见 Round 列）。",
+        "validation_errors": "文件存在以下问题，需修改后才能进行匹配（Row 为 CSV 文件中的行号）：",
+        "validation_warnings": "请检查以下内容，匹配仍可进行（Row 为 CSV 文件中的行号）：",
+        "trace_viewer": "查看详细匹配过程",
+        "trace_student": "学生名称包含",
+        "trace_school": "学校名称包含",
+        "trace_action": "操作",
+        "trace_all": "全部",
+        "trace_reason": "拒绝原因",
+        "trace_page_size": "每页行数",
+        "trace_page": "页码",
+        "trace_page_info": "共 {1} 条记录，其中 {0} 条符合条件，第 {2} / {3} 页。",
+        "cutoffs": "各项目录取分数线及名额敏感性",
+        "cutoffs_desc": "Cutoff 为各项目录取的排名最低的学生在其 Priority 各列上的值（学校文件未指定时为总分）。第二个表根据各项目因名额已满而拒绝的学生，显示增加少量名额后可录取的学生（不考虑由此引起的其他调整）。",
+        "audit": "第四步：检查修改后的分配结果（可选）",
+        "audit_desc": "上传修改过“Assigned ProgramID”列的学生分配结果，将使用第一步和第二步的学生和学校数据进行检查。",
+        "audit_stable": "修改未引起问题：所有学生均符合要求，没有超出项目名额或学校 / 学期名额上限，修改也未产生阻塞对。",
+        "audit_issues": "修改引起的问题：",
+        "audit_engine": "未修改的匹配结果中已有 {} 个问题",
+        "audit_engine_desc": "这些阻塞对在修改之前的匹配结果中就已存在：被某项目替换的学生会直接申请下一所学校，而不会尝试该学校的其他项目。它们不是由修改引起的。",
+        "download_audit": "下载检查结果"
     }
 }
 
@@ -412,4 +472,52 @@ translations_exam_scu2 = {
         "error_message": "请上传考试安排和监考人员数据文件。",
         "success_message": "分配完成！"
     }
-}
\ No newline at end of file
+}
+
+# Rejection reasons of the SEP matching process, rendered from reason codes (see utils/sep_trace.py)
+translations_sep_reasons = {
+    "en": {
+        "semester": "semester requirement not met",
+        "major": "major requirement not met",
+        "min_gpa": "minimum GPA {value} not met",
+        "seniority": "seniority requirement not met",
+        "nationality": "nationality requirement not met",
+        "quota": "maximum quota {value} reached. Accepted students: {roster}",
+        "group_quota": "the {value} seats shared by the programs of the school (or of its semester) are taken",
+        "unknown_school": "the school is not in the school file",
+    },
+    "zh": {
+        "semester": "不符合学期要求",
+        "major": "不符合专业要求",
+        "min_gpa": "未达到最低绩点 {value}",
+        "seniority": "不符合年级要求",
+        "nationality": "不符合国籍要求",
+        "quota": "已达到名额上限 {value}。已录取学生：{roster}",
+        "group_quota": "该学校（或该学期）各项目共用的 {value} 个名额已满",
+        "unknown_school": "该学校不在学校名单中",
+    }
+}
+
+# Short names of the rejection reasons above, for the reason filter of the matching process viewer
+translations_sep_reason_labels = {
+    "en": {
+        "semester": "semester requirement not met",
+        "major": "major requirement not met",
+        "min_gpa": "minimum GPA not met",
+        "seniority": "seniority requirement not met",
+        "nationality": "nationality requirement not met",
+        "quota": "program quota reached",
+        "group_quota": "school / semester seats taken",
+        "unknown_school": "school not in the school file",
+    },
+    "zh": {
+        "semester": "不符合学期要求",
+        "major": "不符合专业要求",
+        "min_gpa": "未达到最低绩点",
+        "seniority": "不符合年级要求",
+        "nationality": "不符合国籍要求",
+        "quota": "项目名额已满",
+        "group_quota": "学校 / 学期名额已满",
+        "unknown_school": "学校不在学校名单中",
+    }
+}